@@ -0,0 +1,258 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+由日线（t_stock / t_etf）汇总周线、月线，存储到 t_stock_week, t_stock_month, t_etf_week, t_etf_month
+
+- 每日增量：只重新汇总当前这一周（月）的日线，覆盖写入该周期的一行，其余周期不动
+- 全量重建：按股票分批读取全部日线，向量化计算周期标识后一次 groupby 汇总
+
+周期以自然周（周一开始）和自然月划分，period_date 为周期的第一天（自然日），
+trade_date 为周期内最后一个交易日，pct_chg 为相对上一周期收盘价的涨跌幅（%）。
+"""
+
+from sqlalchemy import create_engine, text, bindparam, MetaData, Table, Column, String, Date, Float, Integer
+import pandas as pd
+import numpy as np
+from datetime import datetime
+import os
+from com.caicongyang.financial.engineering.utils.env_loader import load_env
+
+# 加载环境变量 - 使用通用加载模块
+load_env()
+
+# 列多的时候，不隐藏
+pd.set_option('expand_frame_repr', False)
+
+# 数据库连接信息
+mysql_user = os.getenv('DB_USER')
+mysql_password = os.getenv('DB_PASSWORD')
+mysql_host = os.getenv('DB_HOST')
+mysql_port = os.getenv('DB_PORT')
+mysql_db = os.getenv('DB_NAME')
+
+# 处理端口值，确保它是一个有效的整数或使用默认值
+if mysql_port is None or mysql_port.lower() == 'none':
+    mysql_port = '3306'  # 使用MySQL默认端口
+
+engine = create_engine(f'mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_db}')
+
+# 日线表 -> 周期表
+SOURCE_TABLES = {'stock': 't_stock', 'etf': 't_etf'}
+PERIODS = ('week', 'month')
+PERIOD_COLUMNS = ['stock_code', 'stock_name', 'period_date', 'trade_date', 'open', 'high', 'low', 'close',
+                  'volume', 'amount', 'pct_chg', 'trading_days']
+
+
+def target_table(source, period):
+    """如 ('stock', 'week') -> 't_stock_week'"""
+    return f"t_{source}_{period}"
+
+
+def init_tables():
+    """创建周期表（如果不存在），主键为 (stock_code, period_date)"""
+    metadata = MetaData()
+    for source in SOURCE_TABLES:
+        for period in PERIODS:
+            Table(
+                target_table(source, period), metadata,
+                Column('stock_code', String(20), primary_key=True),
+                Column('period_date', Date, primary_key=True),
+                Column('stock_name', String(64)),
+                Column('trade_date', Date, nullable=False),
+                Column('open', Float),
+                Column('high', Float),
+                Column('low', Float),
+                Column('close', Float),
+                Column('volume', Float),
+                Column('amount', Float),
+                Column('pct_chg', Float),
+                Column('trading_days', Integer),
+            )
+    metadata.create_all(engine)
+
+
+def period_start(dates, period):
+    """
+    向量化计算每个交易日所属周期的第一天
+
+    :param dates: datetime64 数组或 Series
+    :param period: 'week' 或 'month'
+    """
+    days = pd.to_datetime(pd.Series(dates)).to_numpy().astype('datetime64[D]')
+    if period == 'week':
+        # 1970-01-01 是周四，偏移3天后对7取余即为距周一的天数
+        return days - ((days.astype(np.int64) + 3) % 7)
+    if period == 'month':
+        return days.astype('datetime64[M]').astype('datetime64[D]')
+    raise ValueError(f"Unknown period: {period}, expected one of {PERIODS}")
+
+
+def aggregate_period_bars(daily, period, prev_close=None):
+    """
+    把日线汇总为周期K线
+
+    :param daily: 日线 DataFrame，列为 stock_code, stock_name, trade_date, open, high, low, close, volume, amount
+    :param period: 'week' 或 'month'
+    :param prev_close: 可选，{stock_code: 上一周期收盘价}，用于计算数据中第一个周期的涨跌幅
+    :return: DataFrame，列为 PERIOD_COLUMNS
+    """
+    if daily.empty:
+        return pd.DataFrame(columns=PERIOD_COLUMNS)
+
+    daily = daily.assign(trade_date=pd.to_datetime(daily['trade_date']))
+    daily = daily.sort_values(['stock_code', 'trade_date'], kind='mergesort')
+    daily['period_date'] = period_start(daily['trade_date'], period)
+
+    bars = daily.groupby(['stock_code', 'period_date'], sort=True).agg(
+        stock_name=('stock_name', 'last'),
+        trade_date=('trade_date', 'last'),
+        open=('open', 'first'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        close=('close', 'last'),
+        volume=('volume', 'sum'),
+        amount=('amount', 'sum'),
+        trading_days=('trade_date', 'size'),
+    ).reset_index()
+
+    last_close = bars.groupby('stock_code')['close'].shift(1)
+    if prev_close:
+        last_close = last_close.fillna(bars['stock_code'].map(prev_close))
+    bars['pct_chg'] = (bars['close'] / last_close - 1) * 100
+
+    bars['period_date'] = pd.to_datetime(bars['period_date']).dt.date
+    bars['trade_date'] = bars['trade_date'].dt.date
+    return bars[PERIOD_COLUMNS]
+
+
+def upsert_period_bars(bars, table):
+    """按主键覆盖写入周期K线"""
+    if bars.empty:
+        return
+    rows = bars.astype(object).where(bars.notna(), None).to_dict('records')
+    columns = ', '.join(PERIOD_COLUMNS)
+    values = ', '.join(f':{c}' for c in PERIOD_COLUMNS)
+    updates = ', '.join(f'{c} = VALUES({c})' for c in PERIOD_COLUMNS if c not in ('stock_code', 'period_date'))
+    sql = text(f"INSERT INTO {table} ({columns}) VALUES ({values}) ON DUPLICATE KEY UPDATE {updates}")
+    with engine.begin() as conn:
+        for begin in range(0, len(rows), 1000):
+            conn.execute(sql, rows[begin:begin + 1000])
+
+
+def get_prev_close(table, before):
+    """每只股票在 before 之前最后一个周期的收盘价"""
+    query = text(f"""
+    SELECT t.stock_code, t.close
+    FROM {table} t
+    JOIN (
+        SELECT stock_code, MAX(period_date) AS period_date
+        FROM {table}
+        WHERE period_date < :before
+        GROUP BY stock_code
+    ) m ON t.stock_code = m.stock_code AND t.period_date = m.period_date
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(query, {'before': before}).fetchall()
+    return {code: close for code, close in rows}
+
+
+def update_current_period(date, source='stock', period='week'):
+    """
+    增量更新：只汇总 date 所在周期从第一天到 date 的日线，覆盖写入该周期
+
+    :param date: 交易日，格式 YYYY-MM-DD
+    """
+    start = pd.Timestamp(period_start([pd.Timestamp(date)], period)[0]).date()
+    table = target_table(source, period)
+
+    query = text(f"""
+    SELECT stock_code, stock_name, trade_date, open, high, low, close, volume, amount
+    FROM {SOURCE_TABLES[source]}
+    WHERE trade_date BETWEEN :start_date AND :end_date
+    """)
+    with engine.connect() as conn:
+        daily = pd.read_sql(query, conn, params={'start_date': start, 'end_date': date})
+
+    bars = aggregate_period_bars(daily, period, prev_close=get_prev_close(table, start))
+    upsert_period_bars(bars, table)
+    print(f"{table}: {len(bars)} rows updated for period starting {start}")
+
+
+def rebuild_period_bars(source='stock', periods=PERIODS, batch_size=500):
+    """
+    全量重建：按股票分批读取全部日线，同时生成周线和月线
+
+    :param batch_size: 每批读取的股票数量
+    """
+    # 首次运行时表还不存在，先建表（带主键），否则 DELETE 会失败、to_sql 会建出没有主键的表
+    init_tables()
+    with engine.connect() as conn:
+        codes = [row[0] for row in conn.execute(text(f"SELECT DISTINCT stock_code FROM {SOURCE_TABLES[source]}"))]
+
+    with engine.begin() as conn:
+        for period in periods:
+            conn.execute(text(f"DELETE FROM {target_table(source, period)}"))
+
+    query = text(f"""
+    SELECT stock_code, stock_name, trade_date, open, high, low, close, volume, amount
+    FROM {SOURCE_TABLES[source]}
+    WHERE stock_code IN :codes
+    """).bindparams(bindparam('codes', expanding=True))
+
+    for begin in range(0, len(codes), batch_size):
+        batch = codes[begin:begin + batch_size]
+        with engine.connect() as conn:
+            daily = pd.read_sql(query, conn, params={'codes': batch})
+        for period in periods:
+            bars = aggregate_period_bars(daily, period)
+            with engine.begin() as conn:
+                bars.to_sql(target_table(source, period), con=conn, if_exists='append', index=False,
+                            method='multi', chunksize=1000)
+        print(f"Rebuilt {source} period bars: {min(begin + batch_size, len(codes))}/{len(codes)} codes")
+
+
+def process_period_bars(date):
+    """
+    每日任务：更新股票和ETF当前周、当前月的K线
+    :param date: 日期，格式：YYYY-MM-DD
+    """
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+        init_tables()
+        for source in SOURCE_TABLES:
+            for period in PERIODS:
+                update_current_period(date, source=source, period=period)
+        return True
+    except ValueError:
+        print(f"Invalid date format: {date}. Please use YYYY-MM-DD format.")
+        return False
+    except Exception as e:
+        print(f"处理周线、月线数据失败: {e}")
+        return False
+
+
+def get_period_bars(stock_code, period='week', source='stock', limit=None):
+    """
+    读取一只股票（ETF）的周期K线，按时间升序
+
+    :param limit: 只取最近 limit 个周期
+    """
+    table = target_table(source, period)
+    limit_sql = f"LIMIT {int(limit)}" if limit else ""
+    query = text(f"""
+    SELECT * FROM (
+        SELECT {', '.join(PERIOD_COLUMNS)}
+        FROM {table}
+        WHERE stock_code = :stock_code
+        ORDER BY period_date DESC
+        {limit_sql}
+    ) t ORDER BY period_date
+    """)
+    with engine.connect() as conn:
+        return pd.read_sql(query, conn, params={'stock_code': stock_code})
+
+
+if __name__ == "__main__":
+    # 示例：更新指定日期所在周、月的K线
+    process_period_bars('2024-12-25')
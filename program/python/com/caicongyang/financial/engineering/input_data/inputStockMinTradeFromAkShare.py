@@ -3,9 +3,12 @@
 
 """
 把AkShare的股票5分钟交易数据导入到本地数据库
+
+交易时段内 stock_trends_sse_client 已由实时分时数据生成5分钟K线写入 t_stock_min_trade，
+这里只补齐当天没有实时数据（或数据不完整）的股票
 """
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 import akshare as ak
 import pandas as pd
 from datetime import datetime, timedelta
@@ -30,6 +33,12 @@ mysql_host = os.getenv('DB_HOST')
 mysql_port = os.getenv('DB_PORT')
 mysql_db = os.getenv('DB_NAME')
 table_name = 't_stock_min_trade'
+# 一个交易日所有5分钟K线的时间：09:35-11:30、13:05-15:00，共48根
+BAR_TIMES = frozenset(
+    (datetime.min + timedelta(minutes=minute)).time()
+    for start, end in ((9 * 60 + 35, 11 * 60 + 30), (13 * 60 + 5, 15 * 60))
+    for minute in range(start, end + 1, 5)
+)
 
 # 创建数据库连接池
 engine = create_engine(
@@ -72,8 +81,33 @@ def check_data_exists(stock_code, date):
     result = pd.read_sql(query, engine)
     return result.iloc[0, 0] > 0
 
-def process_stock_min_data(stock_code, date):
-    """处理指定股票指定日期的5分钟数据"""
+def get_bar_times(date):
+    """一次查询指定日期每只股票已有的5分钟K线时间，返回 {stock_code: {time, ...}}"""
+    query = text(f"""
+    SELECT stock_code, trade_time
+    FROM {table_name}
+    WHERE trade_date = :date
+    """)
+    bar_times = {}
+    with engine.connect() as conn:
+        for code, trade_time in conn.execute(query, {'date': date}):
+            bar_times.setdefault(code, set()).add(pd.Timestamp(trade_time).time())
+    return bar_times
+
+def delete_stock_min_data(stock_codes, date):
+    """删除指定股票指定日期的5分钟数据（实时数据不完整时重新导入）"""
+    if not stock_codes:
+        return
+    query = text(f"DELETE FROM {table_name} WHERE trade_date = :date AND stock_code IN :codes") \
+        .bindparams(bindparam('codes', expanding=True))
+    with engine.begin() as conn:
+        conn.execute(query, {'date': date, 'codes': list(stock_codes)})
+
+def process_stock_min_data(stock_code, date, skip_check=False):
+    """
+    处理指定股票指定日期的5分钟数据
+    :param skip_check: 调用方已确认需要导入时跳过逐只股票的存在性检查
+    """
     try:
         # 验证日期格式
         datetime.strptime(date, '%Y-%m-%d')
@@ -82,7 +116,7 @@ def process_stock_min_data(stock_code, date):
         stock_code = pad_stock_code(stock_code)
         
         # 检查数据是否已存在
-        if check_data_exists(stock_code, date):
+        if not skip_check and check_data_exists(stock_code, date):
             print(f"Data for stock {stock_code} on {date} already exists in the database. Skipping...")
             return
         
@@ -145,22 +179,34 @@ def process_stock_min_data(stock_code, date):
         return f"Failed to process {stock_code}: {str(e)}"
 
 def process_all_stocks_min_data(date):
-    """使用多线程处理所有股票的5分钟数据"""
+    """
+    使用多线程补齐所有股票的5分钟数据
+    K线时间与 BAR_TIMES 完全一致的股票跳过；缺少K线（如盘中才开始订阅）或有交易时段以外K线的股票删除后重新导入
+    """
     # 获取最新的股票代码列表
-    stock_codes = get_latest_stock_codes()
+    stock_codes = [pad_stock_code(code) for code in get_latest_stock_codes()]
     
     if not stock_codes:
         print("No stock codes found.")
         return
+
+    bar_times = get_bar_times(date)
+    partial = [code for code in stock_codes if code in bar_times and bar_times[code] != BAR_TIMES]
+    delete_stock_min_data(partial, date)
+    total = len(stock_codes)
+    stock_codes = [code for code in stock_codes if bar_times.get(code) != BAR_TIMES]
     
-    print(f"Found {len(stock_codes)} stocks to process.")
+    print(f"Found {total} stocks, {total - len(stock_codes)} already complete, "
+          f"{len(partial)} partial, {len(stock_codes)} to process.")
+    if not stock_codes:
+        return
     
     # 使用线程池处理数据
     start_time = time.time()
     with ThreadPoolExecutor(max_workers=10) as executor:
         # 创建所有任务
         future_to_stock = {
-            executor.submit(process_stock_min_data, stock_code, date): stock_code 
+            executor.submit(process_stock_min_data, stock_code, date, True): stock_code 
             for stock_code in stock_codes
         }
         
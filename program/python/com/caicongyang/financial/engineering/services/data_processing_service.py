@@ -18,7 +18,8 @@ from com.caicongyang.financial.engineering.input_data import (
     inputStockConceptFromAkShare as concept_import,
     check_volume_increase as stock_volume,
     check_etf_volume_increase as etf_volume,
-    check_stock_limit as stock_limit
+    check_stock_limit as stock_limit,
+    calculate_period_bars as period_bars
 )
 from com.caicongyang.financial.engineering.stock_select_strategy import (
     analyze_concept_volume,
@@ -35,6 +36,7 @@ class DataProcessingService:
     3. 检查股票涨停数据
     4. 处理股票概念数据
     5. 分析成交量概念和涨停概念
+    6. 汇总股票和ETF的周线、月线
     
     此服务用于替代原有的daily_data_process.py脚本，提供更好的模块化和代码组织
     """
@@ -59,6 +61,7 @@ class DataProcessingService:
         # 按顺序执行数据处理任务
         self._import_stock_data(date)
         self._import_etf_data(date)
+        self._update_period_bars(date)
         self._check_stock_volume(date)
         self._check_etf_volume(date)
         self._check_stock_limit(date)
@@ -86,6 +89,15 @@ class DataProcessingService:
         except Exception as e:
             print(f"Error importing ETF historical data: {e}")
     
+    def _update_period_bars(self, date):
+        """更新当前周、当前月的K线"""
+        print("\n--- Updating weekly and monthly bars ---")
+        try:
+            period_bars.process_period_bars(date)
+            print("Weekly and monthly bars update completed successfully")
+        except Exception as e:
+            print(f"Error updating weekly and monthly bars: {e}")
+    
     def _check_stock_volume(self, date):
         """检查股票成交量"""
         print("\n--- Checking stock volume increase ---")
@@ -0,0 +1,192 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+企业微信机器人提醒的异步发送队列
+
+- 行情处理只调用 enqueue（put_nowait，不等待网络），队列满时丢弃并计数
+- 发送协程把 window 秒内的提醒合并为一条 markdown 消息，超过长度限制时拆分为多条
+- 多个 webhook 轮流使用，每个 webhook 按滑动窗口限速（企业微信每个机器人每分钟最多20条），
+  全部达到上限时等待；发送失败或被限流（errcode 45009）时换下一个 webhook 重试
+- 所有请求共用一个连接池会话（与 SSE 长连接分开，避免被行情连接占满连接数）
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from datetime import datetime
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+# markdown 消息内容最长 4096 字节
+MAX_CONTENT_BYTES = 4000
+RATE_LIMITED_ERRCODE = 45009
+
+
+class AlertDispatcher:
+    """
+    :param webhook_urls: 企业微信机器人地址列表
+    :param window: 合并提醒的时间窗口（秒）
+    :param rate_limit: 每个 webhook 在 rate_period 秒内最多发送的消息数
+    :param describe: 可选，协程函数 describe(stock_codes) -> {stock_code: {'stock_name':..., 'concept_name':...}}，
+                     一批提醒只调用一次
+    """
+
+    def __init__(self, webhook_urls, window=2.0, rate_limit=20, rate_period=60.0, queue_size=1000, describe=None):
+        self.webhook_urls = list(webhook_urls)
+        self.window = window
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.describe = describe
+        self.session = None
+        self.next_url = 0
+        # 每个 webhook 最近发送消息的时间
+        self.sent_times = {url: deque() for url in self.webhook_urls}
+
+        # 指标
+        self.enqueued = 0
+        self.dropped = 0
+        self.messages_sent = 0
+        self.alerts_sent = 0
+        self.send_errors = 0
+
+    def enqueue(self, stock_code, count, volume, price_change):
+        """加入一条提醒，不等待；队列满时丢弃"""
+        alert = {'stock_code': stock_code, 'count': count, 'volume': volume, 'price_change': price_change,
+                 'time': datetime.now().strftime('%H:%M:%S')}
+        try:
+            self.queue.put_nowait(alert)
+            self.enqueued += 1
+            return True
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Alert queue full, dropped alert for {stock_code}")
+            return False
+
+    async def _next_batch(self):
+        """等待第一条提醒，再收集 window 秒内的其他提醒"""
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.window
+        while True:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    @staticmethod
+    def format_alert(alert, info):
+        stock_name = info.get('stock_name', '未知')
+        concepts = info.get('concept_name', '无')
+        color = 'warning' if alert['price_change'] >= 0 else 'info'
+        return (f"**{alert['stock_code']} {stock_name}** "
+                f"<font color=\"{color}\">{alert['price_change']:+.2f}%</font>\n"
+                f"> 时间: {alert['time']}  活跃次数: {alert['count']}  当前成交量: {alert['volume']}\n"
+                f"> 所属概念: {concepts}\n")
+
+    def build_messages(self, alerts, infos):
+        """
+        把一批提醒合并为 markdown 消息，每条不超过 MAX_CONTENT_BYTES
+
+        :return: [(消息内容, 包含的提醒数), ...]
+        """
+        sections = [self.format_alert(alert, infos.get(alert['stock_code'], {})) for alert in alerts]
+        messages = []
+        current = []
+        size = 0
+        for section in sections:
+            section_size = len(section.encode('utf-8'))
+            if current and size + section_size > MAX_CONTENT_BYTES - 100:
+                messages.append(current)
+                current, size = [], 0
+            current.append(section)
+            size += section_size
+        if current:
+            messages.append(current)
+        return [(f"### 🔥 高活跃度股票提醒（{len(part)}只）\n" + '\n'.join(part), len(part)) for part in messages]
+
+    async def _acquire_url(self):
+        """轮流选择一个未达到限速的 webhook，全部达到上限时等待最早的一个恢复"""
+        while True:
+            now = time.monotonic()
+            wait = None
+            for k in range(len(self.webhook_urls)):
+                url = self.webhook_urls[(self.next_url + k) % len(self.webhook_urls)]
+                sent = self.sent_times[url]
+                while sent and now - sent[0] >= self.rate_period:
+                    sent.popleft()
+                if len(sent) < self.rate_limit:
+                    self.next_url = (self.next_url + k + 1) % len(self.webhook_urls)
+                    sent.append(now)
+                    return url
+                remaining = self.rate_period - (now - sent[0])
+                wait = remaining if wait is None else min(wait, remaining)
+            logger.warning(f"All webhooks rate limited, waiting {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    async def send(self, content):
+        """发送一条 markdown 消息，失败时换下一个 webhook，每个 webhook 最多尝试一次"""
+        data = {"msgtype": "markdown", "markdown": {"content": content}}
+        for _ in range(len(self.webhook_urls)):
+            url = await self._acquire_url()
+            try:
+                async with self.session.post(url, json=data) as response:
+                    if response.status == 200:
+                        result = await response.json(content_type=None)
+                        if result.get('errcode') == 0:
+                            self.messages_sent += 1
+                            return True
+                        if result.get('errcode') == RATE_LIMITED_ERRCODE:
+                            # 服务端限流：该 webhook 在本周期内不再使用
+                            sent = self.sent_times[url]
+                            sent.extend([time.monotonic()] * max(self.rate_limit - len(sent), 0))
+                        logger.error(f"Failed to push message: {result}")
+                    else:
+                        logger.error(f"Failed to push message, status code: {response.status}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Error pushing message to WeChat: {e}")
+            self.send_errors += 1
+        return False
+
+    async def run(self):
+        """发送协程：合并、限速并发送提醒"""
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=len(self.webhook_urls) * 2, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=10))
+        while True:
+            alerts = await self._next_batch()
+            try:
+                infos = {}
+                if self.describe is not None:
+                    infos = await self.describe([alert['stock_code'] for alert in alerts])
+                for content, count in self.build_messages(alerts, infos):
+                    if await self.send(content):
+                        self.alerts_sent += count
+            except Exception as e:
+                logger.error(f"Error dispatching {len(alerts)} alerts: {e}")
+            finally:
+                for _ in alerts:
+                    self.queue.task_done()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def metrics(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'messages_sent': self.messages_sent,
+            'alerts_sent': self.alerts_sent,
+            'send_errors': self.send_errors,
+        }
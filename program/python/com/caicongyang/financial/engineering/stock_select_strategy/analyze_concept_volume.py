@@ -20,7 +20,7 @@
 - 展示每个概念的具体股票及其成交量增幅
 """
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, bindparam
 import pandas as pd
 from datetime import datetime, timedelta
 import logging
@@ -212,14 +212,18 @@ class ConceptVolumeAnalyzer:
             # 4. 按平均增幅排序
             concept_stats = concept_stats.sort_values('avg_increase', ascending=False)
             
-            # 5. 获取每个概念的具体股票
+            # 5. 获取每个概念的具体股票（按概念排名、成交量增幅排序，一次完成）
             details_start = time.time()
-            concept_details = {}
-            for concept in concept_stats.index:
-                concept_stocks = df[df['concept_name'] == concept].sort_values(
-                    'volume_increase_ratio', ascending=False
-                )
-                concept_details[concept] = concept_stocks[['stock_code', 'volume_increase_ratio']].to_dict('records')
+            concept_details = df[df['concept_name'].isin(concept_stats.index)].copy()
+            concept_details['concept_name'] = pd.Categorical(
+                concept_details['concept_name'], categories=concept_stats.index, ordered=True
+            )
+            concept_details = concept_details.sort_values(
+                ['concept_name', 'volume_increase_ratio'], ascending=[True, False]
+            )
+            concept_details['concept_name'] = concept_details['concept_name'].astype(str)
+            concept_details = concept_details[['concept_name', 'stock_code', 'volume_increase_ratio']]
+            concept_details.reset_index(drop=True, inplace=True)
             details_end = time.time()
             logger.info(f"获取概念详情耗时: {details_end - details_start:.2f}秒")
             
@@ -237,7 +241,12 @@ class ConceptVolumeAnalyzer:
             raise
 
     def save_analysis_results(self, results, date):
-        """保存分析结果到数据库"""
+        """
+        保存分析结果到数据库
+
+        概念详情通过 merge 关联当日日线数据得到，统计表和详情表各一次批量写入，
+        并在同一个事务内完成
+        """
         start_time = time.time()
         logger.info(f"开始保存 {date} 的分析结果...")
         
@@ -245,158 +254,58 @@ class ConceptVolumeAnalyzer:
             if not results:
                 logger.warning("结果为空，无需保存")
                 return
-                
-            concept_count = len(results['concept_stats'])
-            logger.info(f"需要处理的概念数量: {concept_count}")
+            
+            # 1. 概念统计数据
+            concept_stats_df = pd.DataFrame.from_dict(results['concept_stats'], orient='index')
+            concept_stats_df.index.name = 'concept_name'
+            concept_stats_df['trade_date'] = date
+            
+            # 2. 概念详情数据：关联当日日线（股票名称、涨跌幅、收盘价）
+            concept_details = results['concept_details']
+            stock_codes = concept_details['stock_code'].unique().tolist()
+            stock_query = text("""
+                SELECT stock_code, stock_name, pct_chg, close
+                FROM t_stock
+                WHERE stock_code IN :codes
+                AND trade_date = :date
+            """).bindparams(bindparam('codes', expanding=True))
             
             with self.engine.begin() as conn:
-                # 1. 保存概念统计数据
-                stats_start = time.time()
-                concept_stats_df = pd.DataFrame.from_dict(results['concept_stats'], orient='index')
-                concept_stats_df['trade_date'] = date
+                stock_info_df = pd.read_sql(stock_query, conn, params={'codes': stock_codes, 'date': date})
+                stock_info_df = stock_info_df.drop_duplicates('stock_code')
+                
+                details_df = concept_details.merge(stock_info_df, on='stock_code', how='inner')
+                details_df.insert(0, 'trade_date', date)
+                details_df = details_df[['trade_date', 'concept_name', 'stock_code', 'stock_name',
+                                         'volume_increase_ratio', 'pct_chg', 'close']]
+                
+                not_found = len(concept_details) - len(details_df)
+                if not_found > 0:
+                    missing = sorted(set(stock_codes) - set(stock_info_df['stock_code']))
+                    logger.warning(f"有 {len(missing)} 只股票在 {date} 无交易数据, 例如: {missing[:10]}")
+                
+                # 3. 每张表一次批量写入
                 concept_stats_df.to_sql(
                     't_concept_volume_stats', 
                     conn, 
                     if_exists='append', 
                     index=True, 
-                    index_label='concept_name'
+                    index_label='concept_name',
+                    method='multi',
+                    chunksize=1000
                 )
-                stats_end = time.time()
-                logger.info(f"保存概念统计数据耗时: {stats_end - stats_start:.2f}秒, 共 {len(concept_stats_df)} 条记录")
-                
-                # 2. 获取所有需要的股票代码
-                all_stock_codes = set()
-                for stocks in results['concept_details'].values():
-                    for stock in stocks:
-                        all_stock_codes.add(stock['stock_code'])
-                
-                # 3. 预先一次性查询所有股票数据
-                prefetch_start = time.time()
-                logger.info(f"预查询 {len(all_stock_codes)} 只股票的当日信息...")
-                
-                # 将所有股票代码转换为字符串列表，用于构建SQL查询
-                stock_codes_list = list(all_stock_codes)
-                # MySQL的IN操作符需要字符串格式，如：'000001','000002'
-                codes_str = "','".join(stock_codes_list)
-                codes_str = f"'{codes_str}'"
-                
-                # 一次查询获取所有股票信息
-                stock_query = text(f"""
-                    SELECT stock_code, stock_name, pct_chg, close
-                    FROM t_stock
-                    WHERE stock_code IN ({codes_str})
-                    AND trade_date = :date
-                """)
-                
-                stock_info_df = pd.read_sql(stock_query, conn, params={'date': date})
-                
-                # 转换为字典，以股票代码为键，方便快速查找
-                stock_info_map = {}
-                for _, row in stock_info_df.iterrows():
-                    stock_info_map[row['stock_code']] = {
-                        'stock_name': row['stock_name'],
-                        'pct_chg': row['pct_chg'],
-                        'close': row['close']
-                    }
-                
-                prefetch_end = time.time()
-                logger.info(f"预查询股票信息耗时: {prefetch_end - prefetch_start:.2f}秒, 获取到 {len(stock_info_map)} 只股票信息")
-                
-                # 4. 保存概念详细数据
-                details_start = time.time()
-                details_rows = []
-                
-                # 跟踪每个概念的处理进度
-                concept_counter = 0
-                total_stocks = sum(len(stocks) for stocks in results['concept_details'].values())
-                logger.info(f"需要处理的股票总数: {total_stocks}")
-                processed_stocks = 0
-                not_found_stocks = 0
-                
-                # 处理每个概念
-                for concept, stocks in results['concept_details'].items():
-                    concept_counter += 1
-                    concept_start = time.time()
-                    logger.info(f"处理概念[{concept_counter}/{concept_count}]: {concept}, 包含 {len(stocks)} 只股票")
-                    
-                    stock_counter = 0
-                    for stock in stocks:
-                        stock_counter += 1
-                        processed_stocks += 1
-                        
-                        if stock_counter % 20 == 0 or stock_counter == len(stocks):
-                            logger.info(f"  - 概念 {concept} 处理进度: {stock_counter}/{len(stocks)} 股票")
-                        
-                        try:
-                            stock_code = stock['stock_code']
-                            
-                            # 直接从内存中获取股票信息，而不是查询数据库
-                            if stock_code in stock_info_map:
-                                info = stock_info_map[stock_code]
-                                row = {
-                                    'trade_date': date,
-                                    'concept_name': concept,
-                                    'stock_code': stock_code,
-                                    'stock_name': info['stock_name'],
-                                    'volume_increase_ratio': stock['volume_increase_ratio'],
-                                    'pct_chg': info['pct_chg'],
-                                    'close': info['close']
-                                }
-                                details_rows.append(row)
-                            else:
-                                not_found_stocks += 1
-                                if not_found_stocks <= 10:  # 只记录前10个未找到的股票，避免日志过多
-                                    logger.warning(f"  未找到股票 {stock_code} 在 {date} 的信息")
-                        except Exception as e:
-                            logger.error(f"  处理股票 {stock_code} 时出错: {str(e)}")
-                    
-                    concept_time = time.time() - concept_start
-                    if concept_time > 3.0:  # 降低阈值，因为现在处理应该更快
-                        logger.warning(f"处理概念 {concept} 耗时较长: {concept_time:.2f}秒")
-                    
-                    # 每处理20个概念保存一次数据
-                    if concept_counter % 20 == 0 and details_rows:
-                        batch_save_start = time.time()
-                        batch_df = pd.DataFrame(details_rows)
-                        logger.info(f"中间保存 {len(batch_df)} 条详情记录...")
-                        
-                        try:
-                            batch_df.to_sql(
-                                't_concept_volume_details', 
-                                conn, 
-                                if_exists='append', 
-                                index=False
-                            )
-                            details_rows = []  # 清空已保存的记录
-                            logger.info(f"中间保存完成，耗时: {time.time() - batch_save_start:.2f}秒")
-                        except Exception as e:
-                            logger.error(f"中间保存数据时出错: {str(e)}")
-                
-                # 保存剩余记录
-                if details_rows:
-                    final_save_start = time.time()
-                    logger.info(f"最终保存 {len(details_rows)} 条详情记录...")
-                    details_df = pd.DataFrame(details_rows)
-                    
-                    try:
-                        details_df.to_sql(
-                            't_concept_volume_details', 
-                            conn, 
-                            if_exists='append', 
-                            index=False
-                        )
-                        logger.info(f"最终保存完成，耗时: {time.time() - final_save_start:.2f}秒")
-                    except Exception as e:
-                        logger.error(f"最终保存数据时出错: {str(e)}")
-                
-                details_end = time.time()
-                if not_found_stocks > 0:
-                    logger.warning(f"有 {not_found_stocks} 只股票在 {date} 无交易数据")
-                    
-                logger.info(f"保存概念详情数据总耗时: {details_end - details_start:.2f}秒, 总共处理 {processed_stocks} 只股票")
-                
-                end_time = time.time()
-                logger.info(f"保存 {date} 分析结果总耗时: {end_time - start_time:.2f}秒")
+                details_df.to_sql(
+                    't_concept_volume_details', 
+                    conn, 
+                    if_exists='append', 
+                    index=False,
+                    method='multi',
+                    chunksize=1000
+                )
+            
+            end_time = time.time()
+            logger.info(f"保存 {date} 分析结果总耗时: {end_time - start_time:.2f}秒, "
+                        f"概念 {len(concept_stats_df)} 条, 详情 {len(details_df)} 条")
                 
         except Exception as e:
             import traceback
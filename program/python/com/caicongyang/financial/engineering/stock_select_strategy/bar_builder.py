@@ -0,0 +1,246 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+由 SSE 分时数据实时生成1分钟、5分钟K线
+
+分时数据（trend_codec.TREND_DTYPE 字段顺序的记录）是当前分钟K线的最新状态，同一分钟会被重复推送：
+- 1分钟K线：同一分钟的记录直接覆盖，出现下一分钟时该分钟收线
+- 5分钟K线：已收线分钟的开高低、成交量、成交额累加到当前周期，每条记录 O(1) 更新，
+  出现下一个周期的分钟时该周期收线
+时间标签与东方财富一致为周期结束时间（09:31 表示 09:30-09:31），5分钟K线与 AkShare 口径一致，
+09:30 的集合竞价并入 09:35 的K线。5分钟K线只有 09:35-11:30、13:05-15:00 共48根，
+交易时段以外的分钟标签（如 11:31、15:01）直接丢弃，不会生成不存在的K线。
+
+收线的K线暂存在内存中，由 flush 批量写入：
+- 5分钟K线写入 t_stock_min_trade（与 inputStockMinTradeFromAkShare 相同的表和列），
+  当天有实时数据的股票夜间导入时不再重复下载
+- 1分钟K线可选写入 t_stock_1min_trade
+"""
+
+import logging
+from datetime import datetime, timedelta
+
+import pandas as pd
+from sqlalchemy import text, MetaData, Table, Column, String, Date, DateTime, Float
+
+from com.caicongyang.financial.engineering.stock_select_strategy import trend_codec
+
+logger = logging.getLogger(__name__)
+
+MIN5_TABLE = 't_stock_min_trade'
+MIN1_TABLE = 't_stock_1min_trade'
+MARKET_OPEN = 9 * 3600 + 30 * 60
+MORNING_CLOSE = 11 * 3600 + 30 * 60
+AFTERNOON_OPEN = 13 * 3600
+MARKET_CLOSE = 15 * 3600
+BAR_SECONDS = 300
+MIN5_COLUMNS = ['trade_time', 'open', 'close', 'high', 'low', 'volume', 'amount', 'change_rate', 'change_amount',
+                'amplitude', 'turnover_rate', 'stock_code', 'trade_date']
+MIN1_COLUMNS = ['stock_code', 'trade_date', 'trade_time', 'open', 'close', 'high', 'low', 'volume', 'amount']
+
+
+def bucket_end(seconds):
+    """分钟标签所属5分钟K线的结束时间（当天秒数），09:30 并入 09:35"""
+    seconds = max(seconds, MARKET_OPEN + 60)
+    return -(-seconds // BAR_SECONDS) * BAR_SECONDS
+
+
+def in_session(seconds):
+    """分钟标签是否在交易时段内：11:30 之后到 13:00、15:00 之后的标签不属于任何一根K线"""
+    return not (MORNING_CLOSE < seconds <= AFTERNOON_OPEN or seconds > MARKET_CLOSE)
+
+
+class _StockBars:
+    """一只股票当前分钟和当前5分钟周期的状态"""
+    __slots__ = ('minute', 'm_open', 'm_high', 'm_low', 'm_close', 'm_volume', 'm_amount', 'open_minute',
+                 'bucket', 'b_open', 'b_high', 'b_low', 'b_close', 'b_volume', 'b_amount', 'last_bucket',
+                 'prev_close5')
+
+    def __init__(self, prev_close, last_bucket):
+        self.minute = -1
+        self.open_minute = False
+        self.bucket = None
+        # 最后一根已收线（或已写入）的5分钟K线，之后收到的属于该周期及以前的数据忽略
+        self.last_bucket = last_bucket
+        self.prev_close5 = prev_close
+
+
+class BarBuilder:
+    """
+    :param date: 交易日 date，K线的 trade_date
+    :param with_1min: 是否输出1分钟K线
+    :param pre_close: {stock_code: 前一交易日收盘价}，用于计算当天第一根K线的涨跌幅
+    :param done: {stock_code: 已写入的最后一根5分钟K线结束时间（当天秒数）}，重启时跳过已写入的K线
+    """
+
+    def __init__(self, date=None, with_1min=False, pre_close=None, done=None):
+        self.date = date or datetime.now().date()
+        self.with_1min = with_1min
+        self.pre_close = pre_close or {}
+        self.done = done or {}
+        self.stocks = {}
+        self.bars5 = []
+        self.bars1 = []
+
+    def update(self, stock_code, record):
+        """
+        :param record: TREND_DTYPE 字段顺序的元组 (time, price, open, high, low, avg_price, volume, amount)，
+                       time 为当天秒数，价格为 PRICE_SCALE 放大后的整数
+        """
+        t, price, open_price, high, low, _, volume, amount = record
+        if not in_session(t):
+            return
+        state = self.stocks.get(stock_code)
+        if state is None:
+            state = self.stocks[stock_code] = _StockBars(self.pre_close.get(stock_code), self.done.get(stock_code, -1))
+        if t < state.minute or (t == state.minute and not state.open_minute) or bucket_end(t) <= state.last_bucket:
+            return
+        if t > state.minute:
+            if state.open_minute:
+                self._close_minute(stock_code, state)
+            if state.bucket is not None and bucket_end(t) != state.bucket:
+                self._close_bucket(stock_code, state)
+            state.minute = t
+            state.open_minute = True
+        state.m_open, state.m_high, state.m_low, state.m_close = open_price, high, low, price
+        state.m_volume, state.m_amount = volume, amount
+
+    def _close_minute(self, stock_code, state):
+        """当前分钟收线：输出1分钟K线并累加到5分钟周期"""
+        state.open_minute = False
+        if self.with_1min:
+            self.bars1.append((stock_code, state.minute, state.m_open, state.m_close, state.m_high, state.m_low,
+                               state.m_volume, state.m_amount))
+        if state.bucket is None:
+            state.bucket = bucket_end(state.minute)
+            state.b_open, state.b_high, state.b_low = state.m_open, state.m_high, state.m_low
+            state.b_volume, state.b_amount = state.m_volume, state.m_amount
+        else:
+            state.b_high = max(state.b_high, state.m_high)
+            state.b_low = min(state.b_low, state.m_low)
+            state.b_volume += state.m_volume
+            state.b_amount += state.m_amount
+        state.b_close = state.m_close
+
+    def _close_bucket(self, stock_code, state):
+        """当前5分钟周期收线"""
+        self.bars5.append((stock_code, state.bucket, state.b_open, state.b_close, state.b_high, state.b_low,
+                           state.b_volume, state.b_amount, state.prev_close5))
+        state.prev_close5 = state.b_close / trend_codec.PRICE_SCALE
+        state.last_bucket = state.bucket
+        state.bucket = None
+
+    def close_expired(self, now_seconds, grace=5):
+        """
+        按时间收线：没有后续推送的股票（如收盘、停牌）在周期结束 grace 秒后收线
+
+        :param now_seconds: 当前时间（当天秒数）
+        """
+        for stock_code, state in self.stocks.items():
+            if state.open_minute and state.minute + grace <= now_seconds:
+                self._close_minute(stock_code, state)
+            if state.bucket is not None and state.bucket + grace <= now_seconds:
+                self._close_bucket(stock_code, state)
+
+    def close_all(self):
+        """收盘或停止时收线所有K线"""
+        self.close_expired(float('inf'), grace=0)
+
+    def _trade_time(self, seconds):
+        return datetime.combine(self.date, datetime.min.time()) + timedelta(seconds=int(seconds))
+
+    def take_bars(self):
+        """
+        取出已收线的K线
+
+        :return: (5分钟K线 DataFrame（列同 t_stock_min_trade）, 1分钟K线 DataFrame)
+        """
+        bars5, self.bars5 = self.bars5, []
+        bars1, self.bars1 = self.bars1, []
+
+        df5 = pd.DataFrame(bars5, columns=['stock_code', 'seconds', 'open', 'close', 'high', 'low', 'volume',
+                                           'amount', 'prev_close'])
+        if not df5.empty:
+            for column in ('open', 'close', 'high', 'low'):
+                df5[column] = df5[column] / trend_codec.PRICE_SCALE
+            prev_close = df5['prev_close'].astype(float)
+            df5['change_amount'] = (df5['close'] - prev_close).round(3)
+            df5['change_rate'] = (df5['change_amount'] / prev_close * 100).round(2)
+            df5['amplitude'] = ((df5['high'] - df5['low']) / prev_close * 100).round(2)
+            df5['turnover_rate'] = None
+            df5['trade_time'] = [self._trade_time(s) for s in df5['seconds']]
+            df5['trade_date'] = self.date
+        df5 = df5.reindex(columns=MIN5_COLUMNS)
+
+        df1 = pd.DataFrame(bars1, columns=['stock_code', 'seconds', 'open', 'close', 'high', 'low', 'volume',
+                                           'amount'])
+        if not df1.empty:
+            for column in ('open', 'close', 'high', 'low'):
+                df1[column] = df1[column] / trend_codec.PRICE_SCALE
+            df1['trade_time'] = [self._trade_time(s) for s in df1['seconds']]
+            df1['trade_date'] = self.date
+        df1 = df1.reindex(columns=MIN1_COLUMNS)
+        return df5, df1
+
+
+def init_1min_table(engine):
+    """创建1分钟K线表（如果不存在）"""
+    metadata = MetaData()
+    Table(
+        MIN1_TABLE, metadata,
+        Column('stock_code', String(20), primary_key=True),
+        Column('trade_time', DateTime, primary_key=True),
+        Column('trade_date', Date, nullable=False, index=True),
+        Column('open', Float),
+        Column('close', Float),
+        Column('high', Float),
+        Column('low', Float),
+        Column('volume', Float),
+        Column('amount', Float),
+    )
+    metadata.create_all(engine)
+
+
+def load_done(engine, date):
+    """每只股票当天已写入的最后一根5分钟K线结束时间（当天秒数），一次查询"""
+    query = text(f"""
+    SELECT stock_code, MAX(trade_time) AS last_time
+    FROM {MIN5_TABLE}
+    WHERE trade_date = :date
+    GROUP BY stock_code
+    """)
+    with engine.connect() as conn:
+        rows = conn.execute(query, {'date': date}).fetchall()
+    return {code: last.hour * 3600 + last.minute * 60 + last.second for code, last in rows if last is not None}
+
+
+def load_pre_close(engine, date):
+    """每只股票前一交易日的收盘价"""
+    query = text("""
+    SELECT stock_code, close
+    FROM t_stock
+    WHERE trade_date = (SELECT MAX(trade_date) FROM t_stock WHERE trade_date < :date)
+    """)
+    with engine.connect() as conn:
+        return {code: close for code, close in conn.execute(query, {'date': date}).fetchall()}
+
+
+def write_bars(engine, df5, df1=None):
+    """
+    批量写入已收线的K线
+
+    t_stock_min_trade 没有主键，重复由 BarBuilder 的 done 避免；1分钟K线按主键覆盖写入，
+    重启后重新收线的当前周期分钟不会冲突
+    """
+    with engine.begin() as conn:
+        if not df5.empty:
+            df5.to_sql(MIN5_TABLE, con=conn, if_exists='append', index=False, method='multi', chunksize=1000)
+        if df1 is not None and not df1.empty:
+            rows = df1.astype(object).where(df1.notna(), None).to_dict('records')
+            updates = ', '.join(f'{c} = VALUES({c})' for c in MIN1_COLUMNS if c not in ('stock_code', 'trade_time'))
+            sql = text(f"INSERT INTO {MIN1_TABLE} ({', '.join(MIN1_COLUMNS)}) "
+                       f"VALUES ({', '.join(':' + c for c in MIN1_COLUMNS)}) ON DUPLICATE KEY UPDATE {updates}")
+            for begin in range(0, len(rows), 1000):
+                conn.execute(sql, rows[begin:begin + 1000])
+    return len(df5), 0 if df1 is None else len(df1)
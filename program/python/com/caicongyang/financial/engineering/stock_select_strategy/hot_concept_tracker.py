@@ -0,0 +1,148 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+进程内的热点板块统计
+
+股票 -> 概念的映射在启动时从 t_concept_stock 加载一次，每个概念当天的活跃股票集合保存在内存中，
+活跃股票只需要在内存中更新集合，与股票所属概念的数量无关、没有 Redis 往返。
+变化的概念由 publish 定期（默认每秒）用一次 pipeline 写入 Redis：
+    - hot:concept:stats:{date} (Sorted Set)：ZADD 概念的活跃股票数量
+    - hot:concept:active:stocks:{concept_name}:{date} (Set)：SADD 新增的活跃股票
+进程重启时用 restore 从 Redis 读回当天已有的集合，计数不会从0开始。
+
+多进程分片（sse_supervisor）时每个进程只处理一部分股票：概念活跃集合各进程直接 SADD 到同一个 key，
+热点排行写入各自的分片 key（stats_key 带分片号），由 supervisor 用 ZUNIONSTORE 按 SUM 合并到
+hot:concept:stats:{date}；分片之间股票不重复，合并后的数量即为全部活跃股票数。
+"""
+
+import heapq
+import logging
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+STATS_KEY = "hot:concept:stats:{date}"
+ACTIVE_KEY = "hot:concept:active:stocks:{concept}:{date}"
+SHARD_STATS_KEY = "hot:concept:stats:{date}:shard:{shard}"
+
+
+class HotConceptTracker:
+    """
+    :param stats_key: 热点排行的 key 模板
+    :param active_key: 概念活跃股票集合的 key 模板
+    """
+
+    def __init__(self, stats_key=STATS_KEY, active_key=ACTIVE_KEY):
+        self.stats_key = stats_key
+        self.active_key = active_key
+        self.stock_concepts = {}
+        self.date = None
+        # 概念 -> 当天的活跃股票集合
+        self.active = {}
+        # 概念 -> 还没有写入 Redis 的新增活跃股票
+        self.pending = {}
+
+    def load_concepts(self, stock_concepts):
+        """
+        :param stock_concepts: {stock_code: [concept_name, ...]}
+        """
+        self.stock_concepts = stock_concepts
+
+    def roll_day(self, date=None):
+        """跨天时清空当天的统计"""
+        date = date or datetime.now().strftime('%Y%m%d')
+        if date != self.date:
+            self.date = date
+            self.active = {}
+            self.pending = {}
+        return date
+
+    def mark_active(self, stock_code):
+        """
+        股票触发活跃时调用，每只股票在同一概念中只统计一次
+
+        :return: 新加入的概念数量
+        """
+        self.roll_day()
+        added = 0
+        for concept in self.stock_concepts.get(stock_code, ()):
+            members = self.active.setdefault(concept, set())
+            if stock_code not in members:
+                members.add(stock_code)
+                self.pending.setdefault(concept, set()).add(stock_code)
+                added += 1
+        return added
+
+    def get_hot_concepts(self, limit=10):
+        """内存中的热点板块排行 [(concept_name, active_stocks_count), ...]"""
+        self.roll_day()
+        return heapq.nlargest(limit, ((concept, len(members)) for concept, members in self.active.items()),
+                              key=lambda item: (item[1], item[0]))
+
+    def get_concept_active_stocks(self, concept_name):
+        """内存中概念下的活跃股票列表"""
+        self.roll_day()
+        return list(self.active.get(concept_name, ()))
+
+    def queue_publish(self, pipe, expire_at):
+        """
+        把变化的概念加入 pipeline，没有变化时不加入任何命令
+
+        :param expire_at: 次日0点的时间戳
+        :return: 本次发布的新增活跃股票，写入失败时交给 requeue 重新发布
+        """
+        date = self.roll_day()
+        pending, self.pending = self.pending, {}
+        if not pending:
+            return pending
+        stats_key = self.stats_key.format(date=date)
+        pipe.zadd(stats_key, {concept: len(self.active[concept]) for concept in pending})
+        pipe.expireat(stats_key, expire_at)
+        for concept, stocks in pending.items():
+            active_key = self.active_key.format(concept=concept, date=date)
+            pipe.sadd(active_key, *stocks)
+            pipe.expireat(active_key, expire_at)
+        return pending
+
+    def requeue(self, pending):
+        """写入失败时把未发布的股票放回待发布集合"""
+        for concept, stocks in pending.items():
+            if concept in self.active:
+                self.pending.setdefault(concept, set()).update(stocks)
+
+    async def restore(self, redis, date=None, stock_codes=None):
+        """
+        从 Redis 读回当天已发布的概念活跃集合
+
+        :param redis: decode_responses=True 的 redis.asyncio 客户端
+        :param stock_codes: 分片模式下本进程负责的股票，只保留这些股票，并按读回的集合重写本分片的热点排行
+        """
+        date = self.roll_day(date)
+        if stock_codes is None:
+            concepts = await redis.zrange(self.stats_key.format(date=date), 0, -1)
+        else:
+            # 重新分配后本进程的股票可能来自其他分片，按股票所属的概念读取活跃集合再筛选
+            concepts = sorted({concept for codes in map(self.stock_concepts.get, stock_codes) if codes
+                               for concept in codes})
+        if concepts:
+            pipe = redis.pipeline(transaction=False)
+            for concept in concepts:
+                pipe.smembers(self.active_key.format(concept=concept, date=date))
+            for concept, members in zip(concepts, await pipe.execute()):
+                if stock_codes is not None:
+                    members = set(members).intersection(stock_codes)
+                if members:
+                    self.active.setdefault(concept, set()).update(members)
+        if stock_codes is not None:
+            # 分配的股票可能变化，分片的热点排行整体替换，移出的股票不再计入
+            stats_key = self.stats_key.format(date=date)
+            expire_at = int((datetime.strptime(date, '%Y%m%d') + timedelta(days=1)).timestamp())
+            pipe = redis.pipeline(transaction=True)
+            pipe.delete(stats_key)
+            if self.active:
+                pipe.zadd(stats_key, {concept: len(members) for concept, members in self.active.items()})
+                pipe.expireat(stats_key, expire_at)
+            await pipe.execute()
+        logger.info(f"Restored {len(self.active)} hot concepts for {date}")
+        return len(self.active)
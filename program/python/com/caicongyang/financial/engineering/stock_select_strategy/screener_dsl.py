@@ -0,0 +1,429 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+声明式选股表达式（Screener DSL）
+
+把 check_volume_increase / check_stock_limit / etf_platform_breakout 这类手写筛选条件
+统一写成一行表达式，编译为对共享行情面板（交易日 × 股票 的二维数组）的 NumPy 运算：
+
+    vol / vol.shift(1) >= 2                          # 成交量是前一日2倍以上
+    pct_chg >= 9.5                                   # 涨停
+    close > max(close, 20).shift(1)                  # 突破前20日最高价
+    ma(close, 5) > ma(close, 10) and ma(close, 10) > ma(close, 20)   # 均线多头排列
+
+支持的语法：
+- 字段：open, high, low, close, vol(volume), amount, pct_chg
+- 运算：+ - * /，比较运算（支持链式），and / or / not，取负
+- 函数：max(x, n), min(x, n), ma(x, n)/mean(x, n), sum(x, n), std(x, n), abs(x)
+- 方法：x.shift(n)
+- 窗口函数要求窗口内数据完整（等价于 rolling(n, min_periods=n)），不足时结果为 NaN，比较结果为 False
+
+性能要点：
+- 所有表达式共享同一个 MarketPanel，整个筛选只做一次数据库扫描
+- 子表达式按规范化文本缓存，多个表达式里重复出现的 max(close, 20)、ma(close, 10) 只计算一次
+- 面板只加载所有表达式所需的最大回看天数，50个表达式的开销与1个基本相同
+"""
+
+import ast
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text
+from numpy.lib.stride_tricks import sliding_window_view
+from com.caicongyang.financial.engineering.utils.env_loader import load_env
+
+# 加载环境变量 - 使用通用加载模块
+load_env()
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# 表达式字段名 -> t_stock 列名
+FIELD_COLUMNS = {
+    'open': 'open',
+    'high': 'high',
+    'low': 'low',
+    'close': 'close',
+    'vol': 'volume',
+    'volume': 'volume',
+    'amount': 'amount',
+    'pct_chg': 'pct_chg',
+}
+
+# 内置的常用筛选条件，与现有手写模块的判断口径一致
+BUILTIN_SCREENS = {
+    'volume_increase': 'vol / vol.shift(1) >= 2',
+    'limit_up': 'pct_chg >= 9.5',
+    'breakout_20d': 'close > max(close, 20).shift(1)',
+    'ma_bull': 'ma(close, 5) > ma(close, 10) and ma(close, 10) > ma(close, 20)',
+}
+
+
+class ScreenSyntaxError(ValueError):
+    """表达式语法错误或使用了不支持的语法"""
+
+
+# ===================== 窗口运算 =====================
+
+def _shift(values, n):
+    """沿交易日方向平移n行，空出的位置填NaN"""
+    result = np.full_like(values, np.nan, dtype=np.float64)
+    if n == 0:
+        result[:] = values
+    elif 0 < n < values.shape[0]:
+        result[n:] = values[:-n]
+    elif 0 < -n < values.shape[0]:
+        result[:n] = values[-n:]
+    return result
+
+
+def _rolling(values, n, reducer):
+    """对完整窗口做聚合，窗口不足n行的位置为NaN"""
+    result = np.full(values.shape, np.nan, dtype=np.float64)
+    if n <= values.shape[0]:
+        windows = sliding_window_view(values, n, axis=0)
+        result[n - 1:] = reducer(windows, axis=-1)
+    return result
+
+
+def _rolling_sum(values, n):
+    """
+    基于前缀和的滑动求和，O(1)/点；与 rolling(n).sum() 一致，窗口内有 NaN（停牌、未上市）时为 NaN，
+    NaN 不计入前缀和，不影响之后的窗口
+    """
+    result = np.full(values.shape, np.nan, dtype=np.float64)
+    if n <= values.shape[0]:
+        valid = ~np.isnan(values)
+        csum = np.cumsum(np.where(valid, values, 0), axis=0, dtype=np.float64)
+        ccnt = np.cumsum(valid, axis=0, dtype=np.int64)
+        sums = csum[n - 1:].copy()
+        counts = ccnt[n - 1:].copy()
+        sums[1:] -= csum[:-n]
+        counts[1:] -= ccnt[:-n]
+        result[n - 1:] = np.where(counts == n, sums, np.nan)
+    return result
+
+
+def _rolling_std(values, n):
+    # 与 pandas 的 rolling().std() 一致，使用样本标准差
+    return _rolling(values, n, lambda w, axis: np.std(w, axis=axis, ddof=1))
+
+
+WINDOW_FUNCTIONS = {
+    'max': lambda x, n: _rolling(x, n, np.max),
+    'min': lambda x, n: _rolling(x, n, np.min),
+    'sum': _rolling_sum,
+    'ma': lambda x, n: _rolling_sum(x, n) / n,
+    'mean': lambda x, n: _rolling_sum(x, n) / n,
+    'std': _rolling_std,
+}
+
+BINARY_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+}
+
+COMPARE_OPERATORS = {
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+# ===================== 编译 =====================
+
+class CompiledScreen:
+    """
+    编译后的筛选表达式
+
+    node 是校验过的 AST，lookback 是计算最后一天结果所需的最少历史行数
+    """
+
+    def __init__(self, name, expression):
+        self.name = name
+        self.expression = expression
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ScreenSyntaxError(f"表达式 {name} 语法错误: {e}") from e
+        self.node = tree.body
+        self.fields = set()
+        self.lookback = self._validate(self.node) + 1
+
+    def _int_arg(self, node):
+        if not isinstance(node, ast.Constant) or not isinstance(node.value, int) or isinstance(node.value, bool):
+            raise ScreenSyntaxError(f"表达式 {self.name}: 窗口/平移参数必须是整数常量")
+        return node.value
+
+    def _validate(self, node):
+        """校验语法并返回该节点需要的额外回看行数"""
+        if isinstance(node, ast.Name):
+            if node.id not in FIELD_COLUMNS:
+                raise ScreenSyntaxError(f"表达式 {self.name}: 未知字段 {node.id}")
+            self.fields.add(FIELD_COLUMNS[node.id])
+            return 0
+        if isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)):
+                raise ScreenSyntaxError(f"表达式 {self.name}: 只支持数值常量")
+            return 0
+        if isinstance(node, ast.BinOp):
+            if type(node.op) not in BINARY_OPERATORS:
+                raise ScreenSyntaxError(f"表达式 {self.name}: 不支持的运算符 {type(node.op).__name__}")
+            return max(self._validate(node.left), self._validate(node.right))
+        if isinstance(node, ast.UnaryOp):
+            if not isinstance(node.op, (ast.Not, ast.USub)):
+                raise ScreenSyntaxError(f"表达式 {self.name}: 不支持的运算符 {type(node.op).__name__}")
+            return self._validate(node.operand)
+        if isinstance(node, ast.BoolOp):
+            return max(self._validate(v) for v in node.values)
+        if isinstance(node, ast.Compare):
+            for op in node.ops:
+                if type(op) not in COMPARE_OPERATORS:
+                    raise ScreenSyntaxError(f"表达式 {self.name}: 不支持的比较 {type(op).__name__}")
+            return max(self._validate(v) for v in [node.left] + node.comparators)
+        if isinstance(node, ast.Call):
+            if node.keywords:
+                raise ScreenSyntaxError(f"表达式 {self.name}: 不支持关键字参数")
+            func = node.func
+            # x.shift(n)
+            if isinstance(func, ast.Attribute):
+                if func.attr != 'shift' or len(node.args) != 1:
+                    raise ScreenSyntaxError(f"表达式 {self.name}: 只支持 .shift(n) 方法")
+                n = self._int_arg(node.args[0])
+                return self._validate(func.value) + max(n, 0)
+            if isinstance(func, ast.Name):
+                if func.id == 'abs' and len(node.args) == 1:
+                    return self._validate(node.args[0])
+                if func.id in WINDOW_FUNCTIONS and len(node.args) == 2:
+                    n = self._int_arg(node.args[1])
+                    if n < 1:
+                        raise ScreenSyntaxError(f"表达式 {self.name}: 窗口必须为正整数")
+                    return self._validate(node.args[0]) + n - 1
+            raise ScreenSyntaxError(f"表达式 {self.name}: 不支持的函数调用 {ast.unparse(node)}")
+        raise ScreenSyntaxError(f"表达式 {self.name}: 不支持的语法 {type(node).__name__}")
+
+
+class _Evaluator:
+    """在一个面板上对多个表达式求值，按规范化子表达式缓存中间结果"""
+
+    def __init__(self, panel):
+        self.panel = panel
+        self.cache = {}
+
+    def eval(self, node):
+        key = ast.dump(node, annotate_fields=False)
+        if key not in self.cache:
+            self.cache[key] = self._eval(node)
+        return self.cache[key]
+
+    def _bool(self, node):
+        # NaN 参与的比较本身就是 False，数值结果按非零且非NaN视为真
+        value = self.eval(node)
+        if value.dtype == np.bool_:
+            return value
+        return np.nan_to_num(value, nan=0.0) != 0
+
+    def _eval(self, node):
+        if isinstance(node, ast.Name):
+            return self.panel.field(FIELD_COLUMNS[node.id])
+        if isinstance(node, ast.Constant):
+            return np.float64(node.value)
+        if isinstance(node, ast.BinOp):
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return BINARY_OPERATORS[type(node.op)](self.eval(node.left), self.eval(node.right))
+        if isinstance(node, ast.UnaryOp):
+            if isinstance(node.op, ast.Not):
+                return ~self._bool(node.operand)
+            return -self.eval(node.operand)
+        if isinstance(node, ast.BoolOp):
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            result = self._bool(node.values[0])
+            for value in node.values[1:]:
+                result = combine(result, self._bool(value))
+            return result
+        if isinstance(node, ast.Compare):
+            result = None
+            left = self.eval(node.left)
+            for op, comparator in zip(node.ops, node.comparators):
+                right = self.eval(comparator)
+                with np.errstate(invalid='ignore'):
+                    part = COMPARE_OPERATORS[type(op)](left, right)
+                result = part if result is None else result & part
+                left = right
+            return np.broadcast_to(result, self.panel.shape)
+        if isinstance(node, ast.Call):
+            func = node.func
+            if isinstance(func, ast.Attribute):
+                return _shift(self.eval(func.value), node.args[0].value)
+            if func.id == 'abs':
+                return np.abs(self.eval(node.args[0]))
+            values = np.broadcast_to(self.eval(node.args[0]), self.panel.shape).astype(np.float64)
+            return WINDOW_FUNCTIONS[func.id](values, node.args[1].value)
+        raise ScreenSyntaxError(f"不支持的语法 {type(node).__name__}")
+
+
+# ===================== 行情面板 =====================
+
+class MarketPanel:
+    """
+    共享行情面板：每个字段是一个 (交易日 × 股票) 的 float64 数组
+
+    停牌日对应位置为 NaN，shift 按市场交易日平移
+    """
+
+    def __init__(self, frame, fields=None):
+        """
+        :param frame: 长表，至少包含 stock_code, trade_date 和需要的字段列
+        :param fields: 需要加载的字段，默认加载 frame 中所有已知字段
+        """
+        if fields is None:
+            fields = [c for c in set(FIELD_COLUMNS.values()) if c in frame.columns]
+        frame = frame.drop_duplicates(['trade_date', 'stock_code'], keep='last')
+        wide = frame.pivot(index='trade_date', columns='stock_code', values=list(fields)).sort_index()
+        self.dates = wide.index.to_numpy()
+        self.codes = wide.columns.get_level_values('stock_code').unique().to_numpy()
+        self.shape = (len(self.dates), len(self.codes))
+        self._fields = {
+            f: wide[f].reindex(columns=self.codes).to_numpy(dtype=np.float64)
+            for f in fields
+        }
+
+    def field(self, name):
+        try:
+            return self._fields[name]
+        except KeyError:
+            raise KeyError(f"面板中没有加载字段 {name}") from None
+
+    @classmethod
+    def from_database(cls, engine, end_date, lookback, fields, table='t_stock'):
+        """
+        一次查询加载截至 end_date 的最近 lookback 个交易日数据
+
+        :param engine: SQLAlchemy engine
+        :param end_date: 截止日期 YYYY-MM-DD
+        :param lookback: 需要的交易日数量
+        :param fields: 需要的 t_stock 列名
+        :param table: 数据表，股票用 t_stock，ETF 用 t_etf
+        """
+        if not fields:
+            raise ValueError("fields 不能为空")
+        with engine.connect() as conn:
+            dates = conn.execute(text(f"""
+                SELECT DISTINCT trade_date
+                FROM {table}
+                WHERE trade_date <= :end_date
+                ORDER BY trade_date DESC
+                LIMIT :lookback
+            """), {'end_date': end_date, 'lookback': int(lookback)}).scalars().all()
+            if not dates:
+                raise ValueError(f"{table} 中没有 {end_date} 之前的数据")
+
+            columns = ', '.join(sorted(set(fields)))
+            frame = pd.read_sql(text(f"""
+                SELECT stock_code, trade_date, {columns}
+                FROM {table}
+                WHERE trade_date BETWEEN :start_date AND :end_date
+            """), conn, params={'start_date': min(dates), 'end_date': max(dates)})
+        return cls(frame, fields)
+
+
+# ===================== 筛选器 =====================
+
+class Screener:
+    """
+    一组筛选表达式，共享一次数据加载和子表达式缓存
+
+    用法：
+        screener = Screener(BUILTIN_SCREENS)
+        screener.add('strong', 'pct_chg > 5 and vol > 2 * ma(vol, 5).shift(1)')
+        hits = screener.run('2025-04-09')
+    """
+
+    def __init__(self, screens=None):
+        self.screens = {}
+        for name, expression in (screens or {}).items():
+            self.add(name, expression)
+
+        mysql_user = os.getenv('DB_USER')
+        mysql_password = os.getenv('DB_PASSWORD')
+        mysql_host = os.getenv('DB_HOST')
+        mysql_port = os.getenv('DB_PORT')
+        mysql_db = os.getenv('DB_NAME')
+        self.engine = create_engine(
+            f'mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_db}'
+        )
+
+    def add(self, name, expression):
+        """添加一个筛选表达式，语法错误在添加时抛出 ScreenSyntaxError"""
+        self.screens[name] = CompiledScreen(name, expression)
+
+    @property
+    def lookback(self):
+        return max((s.lookback for s in self.screens.values()), default=1)
+
+    @property
+    def fields(self):
+        fields = set()
+        for screen in self.screens.values():
+            fields |= screen.fields
+        return fields
+
+    def evaluate(self, panel):
+        """
+        在面板上对所有表达式求值
+
+        :return: {screen_name: (交易日 × 股票) 布尔数组}
+        """
+        evaluator = _Evaluator(panel)
+        return {
+            name: np.broadcast_to(evaluator._bool(screen.node), panel.shape)
+            for name, screen in self.screens.items()
+        }
+
+    def evaluate_last(self, panel):
+        """
+        求面板最后一个交易日的结果
+
+        :return: DataFrame，index 为股票代码，每列为一个表达式的布尔结果
+        """
+        results = self.evaluate(panel)
+        return pd.DataFrame(
+            {name: mask[-1] for name, mask in results.items()},
+            index=pd.Index(panel.codes, name='stock_code')
+        )
+
+    def run(self, date, table='t_stock'):
+        """
+        加载一次数据并计算 date 当天所有表达式的命中结果
+
+        :return: {screen_name: [stock_code, ...]}
+        """
+        if not self.screens:
+            return {}
+        panel = MarketPanel.from_database(self.engine, date, self.lookback, self.fields, table)
+        if str(pd.Timestamp(panel.dates[-1]).date()) != str(pd.Timestamp(date).date()):
+            logger.warning(f"{table} 中没有 {date} 的数据，最近交易日为 {panel.dates[-1]}")
+            return {name: [] for name in self.screens}
+        last = self.evaluate_last(panel)
+        hits = {name: last.index[last[name]].tolist() for name in last.columns}
+        for name, codes in hits.items():
+            logger.info(f"筛选 {name}: {self.screens[name].expression} 命中 {len(codes)} 只")
+        return hits
+
+
+if __name__ == "__main__":
+    screener = Screener(BUILTIN_SCREENS)
+    for screen_name, stock_codes in screener.run('2025-04-09').items():
+        print(f"{screen_name}: {stock_codes[:20]}")
@@ -0,0 +1,225 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+StockTrendsSSEClient 离线压测
+
+启动本地回放服务器（sse_replay.ReplayServer），客户端通过 SSE_BASE_URL 连接回放服务器，
+写入本地 Redis（--redis-url）或进程内的 fakeredis，回放结束后输出：
+- ticks_per_sec：每秒处理的分时记录数
+- latency_ms：端到端延迟分位数，从回放服务器发送数据帧到该记录写入 Redis
+- commands_per_tick / round_trips_per_tick：每条分时记录的 Redis 命令数和往返次数
+
+使用示例：
+    python sse_benchmark.py --stocks 2000 --speed 20
+    python sse_benchmark.py --recording trends.jsonl.gz --stocks 5000 --speed 10 --redis-url redis://127.0.0.1:6379/15
+"""
+
+import argparse
+import asyncio
+import contextvars
+import logging
+import os
+import tempfile
+import time
+from collections import deque
+
+import numpy as np
+
+from com.caicongyang.financial.engineering.stock_select_strategy.sse_replay import (
+    ReplayServer, generate_recording, load_recording)
+from com.caicongyang.financial.engineering.stock_select_strategy.stock_trends_sse_client import StockTrendsSSEClient
+
+logger = logging.getLogger(__name__)
+
+# 当前连接正在处理的数据帧的发送时间（每个连接是一个独立的任务，互不影响）
+frame_sent = contextvars.ContextVar('frame_sent', default=None)
+
+
+def simulated_codes(n_stocks):
+    """生成 n_stocks 个可以通过客户端代码过滤的股票代码"""
+    codes = [str(600000 + i) for i in range(min(n_stocks, 10000))]
+    codes += [f"{1 + i:06d}" for i in range(n_stocks - len(codes))]
+    return codes
+
+
+class BenchmarkClient(StockTrendsSSEClient):
+    """记录延迟、分时记录数和 Redis 命令数的客户端，不发送微信推送"""
+
+    def __init__(self):
+        super().__init__()
+        self.ticks = 0
+        self.latencies = []
+        self.pending_sent = deque()
+        self.commands = 0
+        self.round_trips = 0
+        self.pushes = 0
+
+    def instrument(self, redis):
+        """统计 Redis 命令数和往返次数：pipeline 一次 execute 为一次往返"""
+        create_pipeline = redis.pipeline
+        execute_command = redis.execute_command
+
+        def pipeline(*args, **kwargs):
+            pipe = create_pipeline(*args, **kwargs)
+            execute = pipe.execute
+
+            async def counted_execute(*exec_args, **exec_kwargs):
+                self.commands += len(pipe)
+                self.round_trips += 1
+                return await execute(*exec_args, **exec_kwargs)
+
+            pipe.execute = counted_execute
+            return pipe
+
+        async def counted_command(*args, **kwargs):
+            self.commands += 1
+            self.round_trips += 1
+            return await execute_command(*args, **kwargs)
+
+        redis.pipeline = pipeline
+        redis.execute_command = counted_command
+        return redis
+
+    async def iter_sse_events(self, conn_id, response):
+        async for json_data in super().iter_sse_events(conn_id, response):
+            frame_sent.set(json_data.get('sent'))
+            yield json_data
+
+    async def ingest(self, stock_code, trends_data):
+        sent = frame_sent.get()
+        self.ticks += len(trends_data)
+        if self.tick_store is None:
+            await super().ingest(stock_code, trends_data)
+            if sent:
+                self.latencies.append(time.time() - sent)
+            return
+        enqueued = self.tick_store.enqueued
+        await super().ingest(stock_code, trends_data)
+        # 队列先进先出，写入协程按入队顺序写入
+        if self.tick_store.enqueued > enqueued:
+            self.pending_sent.append(sent)
+
+    async def flush_trends(self, items):
+        sents = [self.pending_sent.popleft() for _ in items]
+        await super().flush_trends(items)
+        now = time.time()
+        self.latencies.extend(now - sent for sent in sents if sent)
+
+    def queue_alert(self, stock_code, count, volume, price_change):
+        self.pushes += 1
+
+
+def connect_redis(redis_url=None):
+    """返回 (decode_responses=True 的客户端, 二进制客户端)，未指定 redis_url 时使用 fakeredis"""
+    if redis_url:
+        from redis.asyncio import Redis
+        return Redis.from_url(redis_url, decode_responses=True), Redis.from_url(redis_url)
+    try:
+        import fakeredis
+    except ImportError:
+        raise ImportError("fakeredis is required when --redis-url is not given: pip install fakeredis")
+    server = fakeredis.FakeServer()
+    return (fakeredis.aioredis.FakeRedis(server=server, decode_responses=True),
+            fakeredis.aioredis.FakeRedis(server=server))
+
+
+async def run_benchmark(recording_path, n_stocks=500, speed=10.0, mode=None, redis_url=None, storage='json',
+                        write_behind=True, concepts_per_stock=5, n_concepts=300):
+    """
+    回放录制文件并压测客户端
+
+    :param mode: 'ulist' 或 'trends'，默认与录制文件一致
+    :param concepts_per_stock: 每只模拟股票所属的概念数，用于模拟热点板块统计的开销
+    :return: 压测结果 dict
+    """
+    recording = load_recording(recording_path)
+    mode = mode or recording[0]['mode']
+    server = ReplayServer(recording, speed=speed)
+    base_url = await server.start()
+
+    client = BenchmarkClient()
+    client.base_url_override = base_url
+    client.mode = mode
+    client.storage = storage
+    client.retry_delay = 1
+    client.heartbeat_interval = 3600
+    client.bar_enabled = False
+    if not write_behind:
+        client.tick_store = None
+    client.redis, client.redis_raw = connect_redis(redis_url)
+    client.instrument(client.redis)
+    client.instrument(client.redis_raw)
+
+    codes = simulated_codes(n_stocks)
+    client.hot_concepts.load_concepts({
+        code: [f"概念{(k * 7 + j) % n_concepts}" for j in range(concepts_per_stock)] for k, code in enumerate(codes)
+    })
+    # trends 模式每只股票一个连接，只有前 max_connections 个连接能拿到连接池的名额
+    connections = min(len(codes), client.max_connections) if mode == 'trends' else len(client.split_connections(codes))
+
+    task = asyncio.create_task(client.run(codes))
+    try:
+        while server.finished < connections:
+            if task.done():
+                task.result()
+                raise RuntimeError("client stopped before the replay finished")
+            await asyncio.sleep(0.05)
+        if client.tick_store is not None:
+            await client.tick_store.queue.join()
+        finished = time.time()
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await client.close()
+        await server.stop()
+
+    seconds = finished - server.first_sent if server.first_sent else 0.0
+    latencies = np.array(client.latencies) * 1000
+    percentiles = dict(zip(['p50', 'p90', 'p99', 'max'],
+                           np.round(np.percentile(latencies, [50, 90, 99, 100]), 2).tolist())) if len(latencies) else {}
+    return {
+        'mode': mode,
+        'storage': storage,
+        'write_behind': write_behind,
+        'stocks': len(codes),
+        'connections': connections,
+        'speed': speed,
+        'frames': server.frames_sent,
+        'ticks': client.ticks,
+        'seconds': round(seconds, 3),
+        'ticks_per_sec': round(client.ticks / seconds, 1) if seconds else 0.0,
+        'latency_ms': percentiles,
+        'redis_commands': client.commands,
+        'redis_round_trips': client.round_trips,
+        'commands_per_tick': round(client.commands / client.ticks, 3) if client.ticks else 0.0,
+        'round_trips_per_tick': round(client.round_trips / client.ticks, 4) if client.ticks else 0.0,
+        'pushes': client.pushes,
+        'tick_store': client.get_metrics(),
+    }
+
+
+if __name__ == "__main__":
+    # 客户端模块已配置日志格式，这里只保留警告以上的日志，避免连接日志影响输出
+    logging.getLogger().setLevel(logging.WARNING)
+    parser = argparse.ArgumentParser(description='SSE 客户端离线压测')
+    parser.add_argument('--recording', help='录制文件，不指定时生成模拟行情')
+    parser.add_argument('--stocks', type=int, default=500)
+    parser.add_argument('--speed', type=float, default=10.0)
+    parser.add_argument('--minutes', type=int, default=10, help='生成模拟行情的分钟数')
+    parser.add_argument('--mode', choices=['ulist', 'trends'], default=None)
+    parser.add_argument('--redis-url', default=None)
+    parser.add_argument('--storage', choices=['json', 'packed'], default='json')
+    parser.add_argument('--no-write-behind', action='store_true')
+    args = parser.parse_args()
+
+    path = args.recording
+    if path is None:
+        path = os.path.join(tempfile.gettempdir(), 'sse_benchmark_recording.jsonl.gz')
+        generate_recording(path, n_stocks=100, minutes=args.minutes, mode=args.mode or 'ulist')
+
+    result = asyncio.run(run_benchmark(path, n_stocks=args.stocks, speed=args.speed, mode=args.mode,
+                                       redis_url=args.redis_url, storage=args.storage,
+                                       write_behind=not args.no_write_behind))
+    for key, value in result.items():
+        print(f"{key}: {value}")
@@ -0,0 +1,384 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+东方财富行情 SSE 的录制与本地回放
+
+1. 录制：SSERecorder 使用 StockTrendsSSEClient 的请求参数连接行情服务器，把收到的原始数据帧写入 gzip 压缩的 JSON Lines 文件
+    第一行为文件头：{"version": 1, "mode": "ulist" | "trends", "connections": {conn_id: [stock_code, ...]}, "started": 时间戳}
+    之后每行一帧：{"t": 距开始录制的秒数, "conn": conn_id, "frame": 原始数据帧（去掉 'data:' 前缀）}
+   没有录制文件时可以用 generate_recording 生成随机游走的模拟行情
+
+2. 回放：ReplayServer 是一个本地 aiohttp 服务器，提供与行情服务器相同的
+    /api/qt/ulist/sse 和 /api/qt/stock/trends2/sse 接口，按录制时的时间间隔除以 speed 推送数据帧。
+   请求中的股票按代码哈希映射到录制文件中的股票，因此可以用少量股票的录制模拟任意数量的股票。
+   每帧附带服务器发送时间 sent（时间戳），用于计算端到端延迟。
+
+客户端设置 SSE_BASE_URL=http://127.0.0.1:端口 即可连接回放服务器，压测见 sse_benchmark。
+
+使用示例：
+    # 录制 10 分钟
+    python sse_replay.py record --output trends.jsonl.gz --duration 600
+    # 生成模拟行情并以 10 倍速回放
+    python sse_replay.py generate --output fake.jsonl.gz --stocks 200 --minutes 240
+    python sse_replay.py serve --recording fake.jsonl.gz --speed 10 --port 8080
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import random
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+RECORDING_VERSION = 1
+HEARTBEAT_INTERVAL = 15
+
+
+class SSERecorder:
+    """
+    录制行情服务器推送的原始数据帧
+
+    :param client: StockTrendsSSEClient，复用其会话、请求头和请求参数
+    :param path: 输出文件（gzip 压缩的 JSON Lines）
+    """
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.frames = 0
+
+    def connections(self, stock_codes, mode):
+        """{conn_id: [stock_code, ...]}，与客户端的连接划分一致"""
+        if mode == 'trends':
+            return {code: [code] for code in stock_codes}
+        return self.client.split_connections(stock_codes)
+
+    async def record(self, stock_codes, duration=None, mode=None):
+        """
+        录制指定股票的行情，duration 秒后停止（None 表示直到被取消）
+        """
+        mode = mode or self.client.mode
+        if self.client.session is None:
+            await self.client.init_session()
+        connections = self.connections(stock_codes, mode)
+        started = time.monotonic()
+
+        with gzip.open(self.path, 'wt', encoding='utf-8') as output:
+            header = {'version': RECORDING_VERSION, 'mode': mode, 'connections': connections, 'started': time.time()}
+            output.write(json.dumps(header, ensure_ascii=False) + '\n')
+            tasks = [asyncio.create_task(self._record_connection(output, conn_id, codes, mode, started))
+                     for conn_id, codes in connections.items()]
+            try:
+                await asyncio.wait(tasks, timeout=duration)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        logger.info(f"Recorded {self.frames} frames from {len(connections)} connections to {self.path}")
+        return self.frames
+
+    async def _record_connection(self, output, conn_id, codes, mode, started):
+        """保持一个连接并写入收到的数据帧，断开后重连"""
+        if mode == 'trends':
+            url_factory, params = self.client.get_base_url, self.client.trends_request_params(codes[0])
+        else:
+            url_factory, params = self.client.get_ulist_url, self.client.ulist_request_params(codes)
+        while True:
+            headers = dict(self.client.headers, **{'User-Agent': random.choice(self.client.user_agents)})
+            try:
+                async with self.client.session.get(url_factory(), params=params, headers=headers) as response:
+                    if response.status == 200:
+                        async for frame in self.client.iter_sse_frames(conn_id, response):
+                            record = {'t': round(time.monotonic() - started, 3), 'conn': conn_id, 'frame': frame}
+                            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+                            self.frames += 1
+                    else:
+                        logger.error(f"Non-200 status code: {response.status} for {conn_id}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.error(f"Recording connection error for {conn_id}: {e}")
+            await asyncio.sleep(self.client.retry_delay)
+
+
+def load_recording(path):
+    """
+    读取录制文件，把数据帧展开为按时间排序的单只股票事件
+
+    :return: (header, events)，events 为 [(t, stock_code, payload), ...]；
+             ulist 模式的 payload 为行情快照 dict（不含 f12），trends 模式为分时数据列表
+    """
+    events = []
+    # 每个连接的位置 -> 股票代码，由带 f12 的数据建立（diff 的位置按服务器排序，不一定是 secids 的顺序）
+    positions = {}
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        for line in f:
+            record = json.loads(line)
+            try:
+                data = json.loads(record['frame']).get('data')
+            except json.JSONDecodeError:
+                continue
+            if not isinstance(data, dict):
+                continue
+            t = record['t']
+            if header['mode'] == 'trends':
+                if isinstance(data.get('trends'), list):
+                    events.append((t, record['conn'], data['trends']))
+                continue
+            diff = data.get('diff')
+            if not diff:
+                continue
+            conn_positions = positions.setdefault(record['conn'], {})
+            for position, quote in (diff.items() if isinstance(diff, dict) else enumerate(diff)):
+                code = quote.get('f12')
+                if code is not None:
+                    conn_positions[int(position)] = code = str(code)
+                else:
+                    code = conn_positions.get(int(position))
+                    if code is None:
+                        continue
+                events.append((t, code, {k: v for k, v in quote.items() if k != 'f12'}))
+    events.sort(key=lambda event: event[0])
+    return header, events
+
+
+def generate_recording(path, n_stocks=100, minutes=240, updates_per_minute=20, mode='ulist', seed=0):
+    """
+    生成随机游走的模拟行情录制文件，股票代码为 600000 起
+
+    :param updates_per_minute: 每只股票每分钟推送的次数
+    """
+    rng = random.Random(seed)
+    codes = [str(600000 + i) for i in range(n_stocks)]
+    start = datetime.now().replace(hour=9, minute=30, second=0, microsecond=0)
+    state = {code: {'price': round(rng.uniform(5, 50), 2), 'volume': 0, 'amount': 0.0} for code in codes}
+    for s in state.values():
+        s['open'] = s['high'] = s['low'] = s['price']
+    step = 60.0 / updates_per_minute
+
+    with gzip.open(path, 'wt', encoding='utf-8') as output:
+        connections = {code: [code] for code in codes} if mode == 'trends' else {'ulist-0': codes}
+        header = {'version': RECORDING_VERSION, 'mode': mode, 'connections': connections, 'started': time.time()}
+        output.write(json.dumps(header) + '\n')
+        for k in range(minutes * updates_per_minute):
+            t = round(k * step, 3)
+            now = start + timedelta(seconds=t)
+            diff = {}
+            for position, code in enumerate(codes):
+                s = state[code]
+                s['price'] = round(max(0.01, s['price'] * (1 + rng.gauss(0.0002, 0.002))), 2)
+                s['high'] = max(s['high'], s['price'])
+                s['low'] = min(s['low'], s['price'])
+                lots = rng.randint(100, 20000)
+                s['volume'] += lots
+                s['amount'] += lots * 100 * s['price']
+                if mode == 'trends':
+                    label = (now.replace(second=0) + timedelta(minutes=1)).strftime('%Y-%m-%d %H:%M')
+                    trend = (f"{label},{s['price']},{s['open']},{s['high']},{s['low']},{lots},"
+                             f"{lots * 100 * s['price']:.2f},{s['amount'] / (s['volume'] * 100):.3f}")
+                    frame = json.dumps({'rc': 0, 'data': {'code': code, 'trends': [trend]}})
+                    output.write(json.dumps({'t': t, 'conn': code, 'frame': frame}) + '\n')
+                else:
+                    diff[str(position)] = {'f2': s['price'], 'f5': s['volume'], 'f6': round(s['amount'], 2),
+                                           'f12': code, 'f15': s['high'], 'f16': s['low'], 'f17': s['open'],
+                                           'f124': int(now.timestamp())}
+            if diff:
+                frame = json.dumps({'rc': 0, 'data': {'total': n_stocks, 'diff': diff}})
+                output.write(json.dumps({'t': t, 'conn': 'ulist-0', 'frame': frame}) + '\n')
+    return path
+
+
+class ReplayServer:
+    """
+    本地行情回放服务器
+
+    :param recording: load_recording 的返回值 (header, events)
+    :param speed: 回放倍速，如 10 表示 10 倍速
+    :param loop: 回放结束后是否从头重新开始
+    """
+
+    def __init__(self, recording, speed=1.0, loop=False):
+        self.header, self.events = recording
+        self.mode = self.header['mode']
+        self.speed = speed
+        self.loop = loop
+        self.sources = sorted({code for _, code, _ in self.events})
+        self.runner = None
+
+        # 统计
+        self.connections = 0
+        self.finished = 0
+        self.frames_sent = 0
+        self.records_sent = 0
+        self.first_sent = None
+
+    def source_for(self, stock_code):
+        """请求的股票映射到录制文件中的股票"""
+        return self.sources[zlib.crc32(stock_code.encode()) % len(self.sources)]
+
+    def create_app(self):
+        app = web.Application()
+        app.router.add_get('/api/qt/ulist/sse', self.handle_ulist)
+        app.router.add_get('/api/qt/stock/trends2/sse', self.handle_trends)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        """启动服务器，返回可用作 SSE_BASE_URL 的地址"""
+        self.runner = web.AppRunner(self.create_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        logger.info(f"Replay server ({self.mode}, {len(self.sources)} recorded stocks, {self.speed}x) "
+                    f"listening on http://{host}:{port}")
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    async def open_stream(self, request):
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        self.connections += 1
+        return response
+
+    async def send(self, response, data, records):
+        """发送一帧数据，附带服务器发送时间"""
+        now = time.time()
+        if self.first_sent is None:
+            self.first_sent = now
+        frame = json.dumps({'rc': 0, 'data': data, 'sent': now}, ensure_ascii=False)
+        await response.write(f"data: {frame}\n\n".encode('utf-8'))
+        self.frames_sent += 1
+        self.records_sent += records
+
+    async def replay(self, response, build_frame):
+        """
+        按录制时间推送数据帧，同一时刻的事件合并为一帧
+
+        :param build_frame: build_frame(events) -> (data, records)，data 为 None 时不发送
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            i = 0
+            while i < len(self.events):
+                t = self.events[i][0]
+                j = i
+                while j < len(self.events) and self.events[j][0] == t:
+                    j += 1
+                delay = started + t / self.speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                data, records = build_frame(self.events[i:j])
+                if data is not None:
+                    await self.send(response, data, records)
+                i = j
+            if not self.loop:
+                break
+        self.finished += 1
+        # 回放结束后保持连接，定期发送心跳
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            await response.write(b'data: {"rc":0,"data":null}\n\n')
+
+    async def handle_ulist(self, request):
+        """多股票行情：请求的每只股票按位置推送其映射股票的行情快照"""
+        codes = [secid.split('.', 1)[-1] for secid in request.query.get('secids', '').split(',') if secid]
+        positions = {}
+        for position, code in enumerate(codes):
+            positions.setdefault(self.source_for(code), []).append(position)
+
+        def build_frame(events):
+            diff = {}
+            for _, source, quote in events:
+                for position in positions.get(source, ()):
+                    diff[str(position)] = quote
+            return ({'total': len(codes), 'diff': diff}, len(diff)) if diff else (None, 0)
+
+        response = await self.open_stream(request)
+        try:
+            # 与真实服务器一样，首帧包含所有股票的代码（f12），客户端据此建立位置到股票的映射
+            first = {'total': len(codes), 'diff': {str(position): {'f12': code} for position, code in enumerate(codes)}}
+            await response.write(f"data: {json.dumps({'rc': 0, 'data': first})}\n\n".encode('utf-8'))
+            await self.replay(response, build_frame)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+    async def handle_trends(self, request):
+        """单只股票分时：推送映射股票的分时数据"""
+        code = request.query.get('secid', '').split('.', 1)[-1]
+        source = self.source_for(code)
+
+        def build_frame(events):
+            trends = [trend for _, event_code, payload in events if event_code == source for trend in payload]
+            return ({'code': code, 'trends': trends}, len(trends)) if trends else (None, 0)
+
+        response = await self.open_stream(request)
+        try:
+            await self.replay(response, build_frame)
+        except (ConnectionResetError, asyncio.CancelledError):
+            pass
+        return response
+
+
+async def _record(args):
+    from com.caicongyang.financial.engineering.stock_select_strategy.stock_trends_sse_client import StockTrendsSSEClient
+    client = StockTrendsSSEClient()
+    with open(args.codes_file) as f:
+        codes = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+    codes = [code for code in codes if code.startswith(('300', '301', '00', '60', '688'))]
+    try:
+        await SSERecorder(client, args.output).record(codes, duration=args.duration, mode=args.mode)
+    finally:
+        await client.close()
+
+
+async def _serve(args):
+    server = ReplayServer(load_recording(args.recording), speed=args.speed, loop=args.loop)
+    await server.start(port=args.port)
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='SSE 行情录制与回放')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_parser = commands.add_parser('record', help='录制行情服务器的数据帧')
+    record_parser.add_argument('--output', required=True)
+    record_parser.add_argument('--codes-file', default='input.txt')
+    record_parser.add_argument('--duration', type=float, default=600)
+    record_parser.add_argument('--mode', choices=['ulist', 'trends'], default=None)
+
+    generate_parser = commands.add_parser('generate', help='生成模拟行情录制文件')
+    generate_parser.add_argument('--output', required=True)
+    generate_parser.add_argument('--stocks', type=int, default=100)
+    generate_parser.add_argument('--minutes', type=int, default=240)
+    generate_parser.add_argument('--updates-per-minute', type=int, default=20)
+    generate_parser.add_argument('--mode', choices=['ulist', 'trends'], default='ulist')
+
+    serve_parser = commands.add_parser('serve', help='启动本地回放服务器')
+    serve_parser.add_argument('--recording', required=True)
+    serve_parser.add_argument('--speed', type=float, default=1.0)
+    serve_parser.add_argument('--port', type=int, default=8080)
+    serve_parser.add_argument('--loop', action='store_true')
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        asyncio.run(_record(args))
+    elif args.command == 'generate':
+        generate_recording(args.output, n_stocks=args.stocks, minutes=args.minutes,
+                           updates_per_minute=args.updates_per_minute, mode=args.mode)
+    else:
+        asyncio.run(_serve(args))
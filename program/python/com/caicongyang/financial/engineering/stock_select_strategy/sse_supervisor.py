@@ -0,0 +1,291 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+多进程运行 StockTrendsSSEClient
+
+一个 asyncio 进程只能使用一个 CPU 核，股票多时解析和写入会成为瓶颈。supervisor 按一致性哈希把股票
+分配给 N 个工作进程（默认 CPU 核数），每个进程只订阅自己分片的股票：
+- 连接数上限（SSE_MAX_CONNECTIONS）和每个 webhook 的推送限速（ALERT_RATE_LIMIT）按进程数平分
+- 分时数据、活跃股票、K线按股票写入，分片之间互不影响
+- 热点板块：概念活跃集合各进程直接写入同一个 key；热点排行各进程写入
+  hot:concept:stats:{date}:shard:{shard_id}，supervisor 每秒用 ZUNIONSTORE 按 SUM 合并到
+  hot:concept:stats:{date}，读取方式不变
+
+停止工作进程（supervisor 退出、重新分配）时发送 SIGTERM，工作进程取消主任务后由 client.close()
+写入队列中剩余的分时数据、热点板块变化和K线再退出。
+
+工作进程退出时在原分片重启（退避等待）；restart_window 秒内重启超过 max_restarts 次的分片从哈希环上移除，
+它的股票由一致性哈希分配给其他分片，只有分到新股票的进程需要重启（重启时从 Redis 读回概念活跃集合）。
+
+使用示例：
+    python sse_supervisor.py --workers 4
+    SSE_WORKERS=4 python sse_supervisor.py --input input.txt
+"""
+
+import argparse
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+from redis import Redis
+
+from com.caicongyang.financial.engineering.stock_select_strategy.hot_concept_tracker import (
+    STATS_KEY, SHARD_STATS_KEY)
+from com.caicongyang.financial.engineering.stock_select_strategy.stock_trends_sse_client import (
+    StockTrendsSSEClient, redis_config)
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(str(value).encode('utf-8')).digest()[:8], 'big')
+
+
+class ConsistentHashRing:
+    """
+    一致性哈希环，每个节点 replicas 个虚拟节点；移除节点时只有该节点的股票重新分配
+
+    :param nodes: 节点（分片号）列表
+    """
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self.points = []
+        self.owners = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self):
+        return sorted(set(self.owners))
+
+    def add(self, node):
+        for k in range(self.replicas):
+            point = _hash(f"{node}#{k}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        kept = [(point, owner) for point, owner in zip(self.points, self.owners) if owner != node]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def get(self, key):
+        if not self.points:
+            raise ValueError("hash ring is empty")
+        index = bisect.bisect(self.points, _hash(key)) % len(self.points)
+        return self.owners[index]
+
+    def assign(self, keys):
+        """:return: {node: [key, ...]}，每个节点都有一项（可能为空列表）"""
+        shards = {node: [] for node in self.nodes}
+        for key in keys:
+            shards[self.get(key)].append(key)
+        return shards
+
+
+async def _run_worker(shard_id, stock_codes, max_connections, alert_rate_limit):
+    # SIGTERM 时取消主任务，finally 中的 close() 写入剩余数据
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    client = StockTrendsSSEClient(shard_id=shard_id)
+    client.max_connections = max_connections
+    client.alert_dispatcher.rate_limit = alert_rate_limit
+    try:
+        await client.init_redis()
+        # 概念元数据已由 supervisor 写入，这里版本相同只加载股票 -> 概念映射
+        await client.init_concept_stocks()
+        await client.run(stock_codes)
+    finally:
+        await client.close()
+
+
+def run_worker(shard_id, stock_codes, max_connections, alert_rate_limit):
+    """工作进程入口"""
+    try:
+        asyncio.run(_run_worker(shard_id, stock_codes, max_connections, alert_rate_limit))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+
+async def _init_concept_stocks():
+    client = StockTrendsSSEClient()
+    try:
+        await client.init_redis()
+        await client.init_concept_stocks()
+    finally:
+        await client.close()
+
+
+class SSESupervisor:
+    """
+    :param stock_codes: 全部股票代码
+    :param workers: 工作进程数，默认 CPU 核数
+    :param max_restarts: restart_window 秒内允许的重启次数，超过后该分片从哈希环上移除
+    :param merge_interval: 合并热点排行的间隔（秒）
+    """
+
+    def __init__(self, stock_codes, workers=None, replicas=100, max_restarts=5, restart_window=300.0,
+                 merge_interval=1.0):
+        self.stock_codes = list(stock_codes)
+        self.workers = workers or int(os.getenv('SSE_WORKERS', '0')) or os.cpu_count() or 1
+        self.ring = ConsistentHashRing(range(self.workers), replicas=replicas)
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.merge_interval = merge_interval
+
+        # 总连接数和每个 webhook 的推送限速按进程数平分
+        self.max_connections = max(1, int(os.getenv('SSE_MAX_CONNECTIONS', '20')) // self.workers)
+        self.alert_rate_limit = max(1, int(os.getenv('ALERT_RATE_LIMIT', '20')) // self.workers)
+
+        self.redis = Redis(**redis_config(), decode_responses=True)
+
+        self.context = multiprocessing.get_context('spawn')
+        self.shards = {}
+        self.processes = {}
+        self.restarts = {}
+        self.restart_at = {}
+        self.stopping = False
+
+    def start_worker(self, shard_id):
+        process = self.context.Process(
+            target=run_worker, name=f"sse-shard-{shard_id}",
+            args=(shard_id, self.shards[shard_id], self.max_connections, self.alert_rate_limit))
+        process.start()
+        self.processes[shard_id] = process
+        logger.info(f"Started shard {shard_id} (pid {process.pid}) with {len(self.shards[shard_id])} stocks")
+
+    def stop_worker(self, shard_id, timeout=30):
+        """SIGTERM 后等待工作进程写完剩余数据，超时后强制结束"""
+        process = self.processes.pop(shard_id, None)
+        if process is None:
+            return
+        if process.is_alive():
+            process.terminate()
+            process.join(timeout)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    def start(self):
+        """写入概念元数据后按哈希环启动所有工作进程"""
+        asyncio.run(_init_concept_stocks())
+        self.shards = self.ring.assign(self.stock_codes)
+        for shard_id in self.shards:
+            self.restarts[shard_id] = deque()
+            self.start_worker(shard_id)
+
+    def check_workers(self):
+        """重启退出的工作进程，重启过于频繁的分片从哈希环上移除并重新分配股票"""
+        now = time.monotonic()
+        for shard_id in list(self.processes):
+            process = self.processes[shard_id]
+            if process.is_alive():
+                continue
+            del self.processes[shard_id]
+            restarts = self.restarts[shard_id]
+            while restarts and now - restarts[0] > self.restart_window:
+                restarts.popleft()
+            logger.warning(f"Shard {shard_id} (pid {process.pid}) exited with code {process.exitcode}")
+            if len(restarts) >= self.max_restarts:
+                self.rebalance(shard_id)
+                continue
+            restarts.append(now)
+            self.restart_at[shard_id] = now + min(2 ** (len(restarts) - 1), 30)
+
+        for shard_id, restart_at in list(self.restart_at.items()):
+            if restart_at <= now:
+                del self.restart_at[shard_id]
+                self.start_worker(shard_id)
+
+    def rebalance(self, dead_shard):
+        """把分片从哈希环上移除，重启分到新股票的工作进程"""
+        self.ring.remove(dead_shard)
+        self.restart_at.pop(dead_shard, None)
+        del self.restarts[dead_shard]
+        if not self.ring.points:
+            logger.error(f"Shard {dead_shard} was the last one, no workers left")
+            self.shards = {}
+            return
+        shards = self.ring.assign(self.stock_codes)
+        changed = [shard_id for shard_id, codes in shards.items() if codes != self.shards.get(shard_id)]
+        logger.error(f"Shard {dead_shard} restarted {self.max_restarts} times within {self.restart_window}s, "
+                     f"moving {len(self.shards.get(dead_shard, []))} stocks to shards {changed}")
+        self.shards = shards
+        # 移出的分片不再参与合并，它的股票由新分片读回后重新计入
+        self.redis.delete(self.shard_stats_key(dead_shard))
+        for shard_id in changed:
+            self.stop_worker(shard_id)
+            self.restart_at.pop(shard_id, None)
+            self.start_worker(shard_id)
+
+    def shard_stats_key(self, shard_id, date=None):
+        date = date or datetime.now().strftime('%Y%m%d')
+        return SHARD_STATS_KEY.format(date=date, shard=shard_id)
+
+    def merge_hot_concepts(self):
+        """把各分片的热点排行按 SUM 合并到 hot:concept:stats:{date}"""
+        today = datetime.now()
+        date = today.strftime('%Y%m%d')
+        stats_key = STATS_KEY.format(date=date)
+        tomorrow_ts = int((today.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)).timestamp())
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zunionstore(stats_key, [self.shard_stats_key(shard_id, date) for shard_id in self.shards],
+                         aggregate='SUM')
+        pipe.expireat(stats_key, tomorrow_ts)
+        pipe.execute()
+
+    def run(self):
+        """启动并监控工作进程，直到收到 SIGTERM / Ctrl+C 或没有可用的分片"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.request_stop())
+        self.start()
+        try:
+            while not self.stopping and self.shards:
+                self.check_workers()
+                try:
+                    self.merge_hot_concepts()
+                except Exception as e:
+                    logger.error(f"Error merging hot concepts: {e}")
+                time.sleep(self.merge_interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def request_stop(self):
+        self.stopping = True
+
+    def stop(self):
+        for shard_id in list(self.processes):
+            self.stop_worker(shard_id)
+        self.redis.close()
+        logger.info("All shards stopped")
+
+
+def load_stock_codes(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='多进程 SSE 行情客户端')
+    parser.add_argument('--input', default='input.txt', help='股票代码文件，每行一个')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数，默认 SSE_WORKERS 或 CPU 核数')
+    parser.add_argument('--max-restarts', type=int, default=5)
+    parser.add_argument('--restart-window', type=float, default=300.0)
+    args = parser.parse_args()
+
+    codes = load_stock_codes(args.input)
+    if not codes:
+        logger.error(f"No stock codes found in {args.input}")
+    else:
+        SSESupervisor(codes, workers=args.workers, max_restarts=args.max_restarts,
+                      restart_window=args.restart_window).run()
@@ -20,20 +20,31 @@ Redis数据结构设计：
         }
 
 2. 当日分时数据：
-    - stock:trends:{stock_code}:today:{date} (Sorted Set)
+    - stock:trends:{stock_code}:today:{date} (Sorted Set，TRENDS_STORAGE=json，默认)
         score: timestamp
         member: JSON字符串(包含完整行情数据)
 
+    - stock:trends:{stock_code}:packed:{date} (String，TRENDS_STORAGE=packed)
+        每条分时数据为 40 字节定长记录（见 trend_codec），按推送顺序追加，
+        内存约为 JSON 模式的 1/5 以下，一次 GET 即可解码整天数据
+
 3. 活跃股票统计：
-    - stock:trends:active:stocks:{date} (Hash)
+    - stock:trends:active:zset:{date} (Sorted Set)
+        score: 活跃次数  # 成交量>20万且价格高于开盘价即 ZINCRBY +1
+        member: 股票代码
+        按活跃次数排行用 ZREVRANGEBYSCORE ... LIMIT，O(log n + k)
+
+    - stock:trends:active:stocks:{date} (Hash，兼容旧的读取方式)
         {
-            'stock_code': '活跃次数',  # 成交量>5万即计数+1
+            'stock_code': '活跃次数',
         }
 
+    盘中异动排行（活跃次数、涨幅、累计成交量）在进程内由 top_movers.TopMovers 维护，见 get_top_movers
+
 4. 概念股元数据：
     - meta:stock:concept:{stock_code} (Hash)
         {
-            'concept_name': '概念名称',
+            'concept_name': '概念名称，多个概念用逗号分隔',
             'stock_name': '股票名称'
         }
     
@@ -45,6 +56,9 @@ Redis数据结构设计：
     - meta:concepts:all (Set)
         ['概念1', '概念2', ...]  # 所有概念名称集合
 
+    - meta:concept:version (String)
+        t_concept_stock 内容的哈希，未变化时启动跳过元数据写入
+
 5. 热点板块统计：
     - hot:concept:stats:{date} (Sorted Set)
         score: 活跃股票数量
@@ -53,14 +67,27 @@ Redis数据结构设计：
     - hot:concept:active:stocks:{concept_name}:{date} (Set)
         members: [stock_code1, stock_code2, ...]  # 该概念下当天的活跃股票集合
 
+    两者由进程内的 HotConceptTracker 维护，每 HOT_CONCEPT_PUBLISH_INTERVAL 秒（默认1秒）批量写入一次
+
+    多进程分片（sse_supervisor，SSE_SHARD_ID）时每个进程写入 hot:concept:stats:{date}:shard:{shard_id}，
+    由 supervisor 合并为 hot:concept:stats:{date}
+
+行情连接：
+- 默认（SSE_MODE=ulist）一个连接订阅多只股票，股票数按 SSE_SECIDS_PER_CONNECTION 分组，
+  连接总数不超过 SSE_MAX_CONNECTIONS；推送的行情快照转换为与 trends2 相同格式的分钟分时数据
+- SSE_MODE=trends 时每只股票一个 trends2 分时连接
+- 所有连接共用一个 aiohttp 会话，由一个 watchdog 统一检测并重连长时间没有数据的连接
+- 分时数据同时由 bar_builder 实时生成5分钟（可选1分钟）K线，收线后批量写入 t_stock_min_trade
+- SSE_BASE_URL 覆盖行情服务器地址，用于连接本地回放服务器做压测（见 sse_replay、sse_benchmark）
+
 数据过期策略：
-- 分时数据和活跃股票统计：次日0点自动过期
+- 分时数据和活跃股票统计：次日0点自动过期，收盘后由 trends_archiver 把分时数据归档为按日的 .npz 文件
 - 概念股元数据：永久保存
 
 使用示例：
 1. 获取股票最新行情：HGETALL stock:trends:000001:latest
 2. 获取分时数据：ZRANGE stock:trends:000001:today:20240318 0 -1
-3. 查询活跃股票：HGETALL stock:trends:active:stocks:20240318
+3. 查询活跃股票：ZREVRANGEBYSCORE stock:trends:active:zset:20240318 +inf 2 WITHSCORES LIMIT 0 50
 4. 获取股票概念：HGETALL meta:stock:concept:000001
 5. 获取概念股票：HGETALL meta:concept:stocks:新能源
 6. 获取所有概念：SMEMBERS meta:concepts:all
@@ -68,17 +95,28 @@ Redis数据结构设计：
 
 import aiohttp
 import asyncio
+import hashlib
 import json
 import random
 from datetime import datetime, timedelta
 import logging
 from redis.asyncio import Redis
+from redis.asyncio.retry import Retry
+from redis.backoff import NoBackoff
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
 import time
 import pandas as pd
 from sqlalchemy import create_engine
 import os
 from dotenv import load_dotenv
 from com.caicongyang.financial.engineering.utils.env_loader import load_env
+from com.caicongyang.financial.engineering.stock_select_strategy import trend_codec
+from com.caicongyang.financial.engineering.stock_select_strategy import bar_builder
+from com.caicongyang.financial.engineering.stock_select_strategy.tick_store import TickStore
+from com.caicongyang.financial.engineering.stock_select_strategy.hot_concept_tracker import (
+    HotConceptTracker, SHARD_STATS_KEY)
+from com.caicongyang.financial.engineering.stock_select_strategy.alert_dispatcher import AlertDispatcher
+from com.caicongyang.financial.engineering.stock_select_strategy.top_movers import TopMovers
 
 # 加载环境变量 - 使用通用加载模块
 load_env()
@@ -90,18 +128,127 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-class StockTrendsSSEClient:
+# t_concept_stock 内容的哈希，未变化时启动不再重新写入概念元数据
+CONCEPT_VERSION_KEY = "meta:concept:version"
+
+
+def redis_config():
+    """Redis 连接参数，sse_supervisor、trends_archiver 与客户端共用同一份配置"""
+    return {
+        'host': os.getenv('REDIS_HOST', '43.133.13.36'),
+        'port': int(os.getenv('REDIS_PORT', '3373')),
+        'db': int(os.getenv('REDIS_DB', '0')),
+        'password': os.getenv('REDIS_PASSWORD', '24777365ccyCCY!'),
+    }
+
+def trend_minute_label(now):
+    """
+    行情时间所属的分时分钟标签（分钟结束时间），与 trends2 一致只有 09:30、09:31-11:30、13:01-15:00：
+    09:15-09:30 的集合竞价为 09:30，11:30-13:00 之间（上午收盘时刻的推送）为 11:30，
+    15:00 及之后（收盘集合竞价的成交）为 15:00；09:15 之前的返回 None
+
+    :param now: datetime
+    """
+    minute = now.replace(second=0, microsecond=0)
+    minute_of_day = now.hour * 60 + now.minute
+    if minute_of_day < 9 * 60 + 15:
+        return None
+    if minute_of_day < 9 * 60 + 30:
+        return minute.replace(hour=9, minute=30)
+    if 11 * 60 + 30 <= minute_of_day < 13 * 60:
+        return minute.replace(hour=11, minute=30)
+    if minute_of_day >= 15 * 60:
+        return minute.replace(hour=15, minute=0)
+    return minute + timedelta(minutes=1)
+
+
+class QuoteTrendConverter:
+    """
+    把 ulist 推送的行情快照转换为与 trends2 相同格式的分钟分时数据
+
+    ulist 只推送变化的字段，成交量、成交额为当日累计值。这里按股票保存最新快照，
+    按分钟累计开高低收，分钟成交量 = 当前累计成交量 - 上一分钟结束时的累计成交量。
+    每次更新都返回当前分钟的最新记录（与 trends2 重复推送当前分钟的行为一致）：
+    '日期 时间,价格,开盘价,最高价,最低价,成交量,成交额,均价'
+    """
+
     def __init__(self):
+        self.snapshots = {}
+        self.minutes = {}
+
+    def update(self, stock_code, quote):
+        """
+        :param quote: 变化的字段，如 {'f2': 10.5, 'f5': 12345}
+        :return: 分时记录字符串，没有价格或非数值、或在 09:15 之前时返回 None
+        """
+        snapshot = self.snapshots.setdefault(stock_code, {})
+        snapshot.update({k: v for k, v in quote.items() if v != '-'})
+        price = snapshot.get('f2')
+        if not isinstance(price, (int, float)) or price <= 0:
+            return None
+
+        cum_volume = snapshot.get('f5') or 0
+        cum_amount = snapshot.get('f6') or 0
+        ts = snapshot.get('f124')
+        now = datetime.fromtimestamp(ts) if ts else datetime.now()
+        # 分时数据的时间为分钟结束时间，限制在交易时段内（见 trend_minute_label）
+        label = trend_minute_label(now)
+        if label is None:
+            return None
+
+        bar = self.minutes.get(stock_code)
+        if bar is None or bar['label'] != label:
+            base_volume = bar['cum_volume'] if bar else cum_volume
+            base_amount = bar['cum_amount'] if bar else cum_amount
+            bar = {'label': label, 'open': price, 'high': price, 'low': price,
+                   'base_volume': base_volume, 'base_amount': base_amount}
+            self.minutes[stock_code] = bar
+        bar['high'] = max(bar['high'], price)
+        bar['low'] = min(bar['low'], price)
+        bar['cum_volume'] = cum_volume
+        bar['cum_amount'] = cum_amount
+
+        avg_price = cum_amount / (cum_volume * 100) if cum_volume else price
+        return (f"{label.strftime('%Y-%m-%d %H:%M')},{price},{bar['open']},{bar['high']},{bar['low']},"
+                f"{int(cum_volume - bar['base_volume'])},{cum_amount - bar['base_amount']:.2f},{avg_price:.3f}")
+
+
+class StockTrendsSSEClient:
+    def __init__(self, shard_id=None):
         # 服务器列表
         self.server_list = [f"{i}.push2.eastmoney.com" for i in range(1, 100)]
         self.current_server_index = 0
+        # 覆盖行情服务器地址，如 http://127.0.0.1:8080（本地回放，见 sse_replay）
+        self.base_url_override = os.getenv('SSE_BASE_URL')
         
         # Redis配置
-        self.redis_host = os.getenv('REDIS_HOST', '43.133.13.36')
-        self.redis_port = int(os.getenv('REDIS_PORT', '3373'))
-        self.redis_db = int(os.getenv('REDIS_DB', '0'))
-        self.redis_password = os.getenv('REDIS_PASSWORD', '24777365ccyCCY!')
+        config = redis_config()
+        self.redis_host = config['host']
+        self.redis_port = config['port']
+        self.redis_db = config['db']
+        self.redis_password = config['password']
         self.redis: Redis = None
+        # 读取二进制数据用的连接（不解码响应）
+        self.redis_raw: Redis = None
+
+        # 分时数据存储方式：json（ZSET）或 packed（定长二进制记录）
+        self.storage = os.getenv('TRENDS_STORAGE', 'json')
+        # packed 模式下每只股票最后追加的 (时间, 记录)，用于跳过重复推送的历史分钟
+        self.packed_last = {}
+
+        # 写入队列：SSE 读取协程只入队，由写入协程批量写入 Redis（TRENDS_WRITE_BEHIND=0 时直接写入）
+        if os.getenv('TRENDS_WRITE_BEHIND', '1') == '1':
+            self.tick_store = TickStore(
+                queue_size=int(os.getenv('TICK_QUEUE_SIZE', '20000')),
+                flush_interval=float(os.getenv('TICK_FLUSH_INTERVAL', '0.2')),
+                flush_batch=int(os.getenv('TICK_FLUSH_BATCH', '1000')),
+            )
+        else:
+            self.tick_store = None
+        # 一批写入建立连接失败时的重试次数，超过后该批丢弃；命令发出后的错误不重试
+        self.flush_retries = int(os.getenv('TICK_FLUSH_RETRIES', '3'))
+        self.flush_retry_delay = 0.5
+        self.command_errors = 0
         
         # 通用参数
         self.common_params = {
@@ -146,16 +293,46 @@ class StockTrendsSSEClient:
         self.max_retries = 5
         self.retry_delay = 5
         self.heartbeat_interval = 60  # 增加心跳间隔
-        self.last_data_time = None
-        
+
+        # 连接复用配置
+        # ulist: 一个连接订阅多只股票（默认）；trends: 每只股票一个分时连接
+        self.mode = os.getenv('SSE_MODE', 'ulist')
+        self.max_connections = int(os.getenv('SSE_MAX_CONNECTIONS', '20'))
+        self.secids_per_connection = int(os.getenv('SSE_SECIDS_PER_CONNECTION', '100'))
+        self.session: aiohttp.ClientSession = None
+
+        # 每个连接最近一次收到数据的时间和当前的响应对象，由统一的 watchdog 检查
+        self.last_data_time = {}
+        self.responses = {}
+
+        # ulist 多股票行情参数
+        self.ulist_params = {
+            'fltt': '2',
+            'invt': '2',
+            'fields': 'f2,f5,f6,f12,f13,f15,f16,f17,f124',
+            'ut': 'fa5fd1943c7b386f172d6893dbfba10b',
+            'po': '1',
+            'pn': '1',
+        }
+        self.quote_converter = QuoteTrendConverter()
+
         # MySQL配置
         self.mysql_config = {
             'host': os.getenv('DB_HOST'),
-            'port': int(os.getenv('DB_PORT')),
+            'port': int(os.getenv('DB_PORT', '3306')),
             'user': os.getenv('DB_USER'),
             'password': os.getenv('DB_PASSWORD'),
             'db': os.getenv('DB_NAME')
         }
+        self.engine = None
+
+        # 实时K线：由分时数据生成5分钟K线写入 t_stock_min_trade（BAR_BUILDER=0 关闭），
+        # BAR_1MIN=1 时同时写入1分钟K线，每 BAR_FLUSH_INTERVAL 秒批量写入一次
+        self.bar_enabled = os.getenv('BAR_BUILDER', '1') == '1'
+        self.bar_with_1min = os.getenv('BAR_1MIN', '0') == '1'
+        self.bar_flush_interval = float(os.getenv('BAR_FLUSH_INTERVAL', '30'))
+        self.bar_builder = None
+        self.pending_bars = None
         
         # 企业微信机器人配置 - 改为列表存储多个webhook
         self.webhook_keys = [
@@ -170,6 +347,32 @@ class StockTrendsSSEClient:
         # 推送记录（避免重复推送）
         self.pushed_stocks = set()
 
+        # 提醒发送队列：ALERT_WINDOW 秒内的提醒合并为一条消息，每个 webhook 每分钟最多 ALERT_RATE_LIMIT 条
+        self.alert_dispatcher = AlertDispatcher(
+            self.webhook_urls,
+            window=float(os.getenv('ALERT_WINDOW', '2')),
+            rate_limit=int(os.getenv('ALERT_RATE_LIMIT', '20')),
+            describe=self.describe_stocks,
+        )
+
+        # 已设置过期时间的 key（按天重置）
+        self.expire_date = None
+        self.expired_keys = set()
+        self.tomorrow_ts = None
+
+        # 热点板块统计在内存中维护，每 HOT_CONCEPT_PUBLISH_INTERVAL 秒写入 Redis 一次；
+        # 作为 sse_supervisor 的分片进程运行时只统计本分片的股票，热点排行写入分片 key
+        self.shard_id = shard_id if shard_id is not None else os.getenv('SSE_SHARD_ID')
+        if self.shard_id is None:
+            self.hot_concepts = HotConceptTracker()
+        else:
+            self.hot_concepts = HotConceptTracker(stats_key=SHARD_STATS_KEY.format(date='{date}', shard=self.shard_id))
+        self.hot_concepts_restored = False
+        self.hot_concept_publish_interval = float(os.getenv('HOT_CONCEPT_PUBLISH_INTERVAL', '1'))
+
+        # 进程内的盘中异动排行（分片模式下只包含本分片的股票）
+        self.movers = TopMovers()
+
     async def init_redis(self):
         """初始化Redis连接"""
         self.redis = Redis(
@@ -177,109 +380,329 @@ class StockTrendsSSEClient:
             port=self.redis_port,
             db=self.redis_db,
             password=self.redis_password,
-            decode_responses=True  # 自动解码响应
+            decode_responses=True,  # 自动解码响应
+            # redis-py 默认在连接错误、超时后自动重放命令，ZINCRBY、HINCRBY、APPEND 会重复执行；
+            # 写入只在建立连接失败时由 write_connection 重试
+            retry=Retry(NoBackoff(), 0)
+        )
+        self.redis_raw = Redis(
+            host=self.redis_host,
+            port=self.redis_port,
+            db=self.redis_db,
+            password=self.redis_password,
+            decode_responses=False,
+            retry=Retry(NoBackoff(), 0)
         )
         # 测试连接
         await self.redis.ping()
 
+    async def init_session(self):
+        """初始化所有 SSE 连接共用的 HTTP 会话，连接数受 max_connections 限制"""
+        connector = aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300, ssl=False)
+        # SSE 是长连接，不设置总超时；读超时交给 watchdog 处理
+        timeout = aiohttp.ClientTimeout(total=None, connect=10)
+        self.session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    async def close(self):
+        """
+        停止时写入所有未写入的数据，再关闭 HTTP 会话和 Redis 连接：
+        写入队列中剩余的分时数据、热点板块的待发布变化、所有K线（当前未结束的周期也收线写入）
+        """
+        if self.tick_store is not None and self.redis is not None:
+            await self.tick_store.drain(self.flush_trends)
+        if self.redis is not None:
+            await self.publish_hot_concepts()
+        if self.bar_builder is not None:
+            self.bar_builder.close_all()
+            await self.flush_bars()
+        await self.alert_dispatcher.close()
+        if self.session is not None:
+            await self.session.close()
+        if self.redis is not None:
+            await self.redis.close()
+        if self.redis_raw is not None:
+            await self.redis_raw.close()
+
+    def roll_day(self):
+        """跨天时重置已设置过期时间的 key，并计算次日0点的时间戳"""
+        today = datetime.now().strftime('%Y%m%d')
+        if today != self.expire_date:
+            self.expire_date = today
+            self.expired_keys.clear()
+            self.packed_last.clear()
+            self.movers.reset()
+            self.tomorrow_ts = int((datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) +
+                                    timedelta(days=1)).timestamp())
+        return today
+
+    def expire_at_midnight(self, pipe, key):
+        """给当天的 key 设置次日0点过期，每个 key 每天只设置一次"""
+        self.roll_day()
+        if key not in self.expired_keys:
+            pipe.expireat(key, self.tomorrow_ts)
+            self.expired_keys.add(key)
+
+    def parse_trend(self, trend):
+        """
+        解析一条分时数据 '日期 时间,价格,开盘价,最高价,最低价,成交量,成交额,均价'
+
+        :return: (data, score)，score 为当天该时刻的时间戳；格式不对时返回 None
+        """
+        fields = trend.split(',')
+        if len(fields) != 8:
+            return None
+        # 时间可能是 HH:MM 或 HH:MM:SS
+        time_parts = fields[0].split()[-1].split(':')
+        hour, minute = int(time_parts[0]), int(time_parts[1])
+        second = int(time_parts[2]) if len(time_parts) > 2 else 0
+        data = {
+            'trade_time': ''.join(time_parts),
+            'price': str(float(fields[1])),
+            'open': str(float(fields[2])),
+            'high': fields[3],
+            'low': fields[4],
+            'volume': str(int(fields[5])),
+            'amount': fields[6],
+            'avg_price': fields[7]
+        }
+        return data, self.midnight_ts() + hour * 3600 + minute * 60 + second
+
+    def midnight_ts(self):
+        """当天0点的时间戳"""
+        self.roll_day()
+        return self.tomorrow_ts - 86400
+
+    def parse_trends(self, stock_code, trends_data):
+        """
+        解析一条 SSE 消息中的分时数据
+
+        :return: [(data, score, record, is_new), ...]
+                 record 为 trend_codec.TREND_DTYPE 字段顺序的元组；
+                 is_new 表示 packed 模式下需要追加（连接建立时会推送当天全部历史分钟，
+                 之后反复推送当前分钟，只追加新的或有变化的记录）
+        """
+        day_start = self.midnight_ts()
+        parsed = []
+        for trend in trends_data:
+            try:
+                result = self.parse_trend(trend)
+            except ValueError as ve:
+                logger.error(f"Error processing trend data: {ve}, data: {trend}")
+                continue
+            if result is None:
+                continue
+            data, score = result
+            seconds = score - day_start
+            record = trend_codec.to_record(
+                seconds, float(data['price']), float(data['open']), float(data['high']),
+                float(data['low']), float(data['avg_price']), int(data['volume']), float(data['amount']))
+            last = self.packed_last.get(stock_code)
+            is_new = last is None or seconds > last[0] or (seconds == last[0] and record != last[1])
+            if is_new:
+                self.packed_last[stock_code] = (seconds, record)
+            parsed.append((data, score, record, is_new))
+        return parsed
+
+    async def queue_trends(self, pipe, stock_code, parsed):
+        """
+        把一条消息的写入命令加入 pipeline
+
+        最新行情只写最后一条，分时数据一次 zadd（或一次 append），活跃计数用 ZINCRBY（同时 HINCRBY 兼容旧的 hash），
+        过期时间每个 key 每天只设置一次；概念活跃集合和热点排行只在内存中更新，由 publish_hot_concepts 定期写入
+
+        :return: 活跃记录 [(volume, price, open_price, ZINCRBY 结果在 pipeline 中的位置), ...]
+        """
+        if not parsed:
+            return []
+        today = datetime.now().strftime('%Y%m%d')
+        active_stocks_key = f"stock:trends:active:stocks:{today}"
+        active_zset_key = f"stock:trends:active:zset:{today}"
+
+        # 1. 更新最新行情
+        pipe.hset(f"stock:trends:{stock_code}:latest", mapping=parsed[-1][0])
+
+        # 2. 添加到当天的分时数据
+        if self.storage == 'packed':
+            records = [trend_codec.TREND_STRUCT.pack(*record) for _, _, record, is_new in parsed if is_new]
+            if records:
+                packed_key = f"stock:trends:{stock_code}:packed:{today}"
+                pipe.append(packed_key, b''.join(records))
+                self.expire_at_midnight(pipe, packed_key)
+        else:
+            today_key = f"stock:trends:{stock_code}:today:{today}"
+            pipe.zadd(today_key, {json.dumps(data): score for data, score, _, _ in parsed})
+            self.expire_at_midnight(pipe, today_key)
+
+        # 3. 更新活跃股票逻辑
+        # 条件1: 成交量大于20万
+        # 条件2: 收盘价大于开盘价
+        active = []
+        for data, _, _, _ in parsed:
+            volume_int = int(data['volume'])
+            price = float(data['price'])
+            open_price = float(data['open'])
+            if volume_int > 200000 and price > open_price:
+                pipe.zincrby(active_zset_key, 1, stock_code)
+                active.append((volume_int, price, open_price, len(pipe) - 1))
+                pipe.hincrby(active_stocks_key, stock_code, 1)
+        if active:
+            self.expire_at_midnight(pipe, active_zset_key)
+            self.expire_at_midnight(pipe, active_stocks_key)
+            self.hot_concepts.mark_active(stock_code)
+        return active
+
+    def handle_active(self, stock_code, active, results):
+        """根据 pipeline 返回的活跃次数判断是否推送（只加入提醒队列，不等待发送）"""
+        for volume_int, price, open_price, position in active:
+            if isinstance(results[position], Exception):
+                continue
+            new_count = int(float(results[position]))
+            self.movers.set_active(stock_code, new_count)
+            logger.debug(f"Stock {stock_code} active count: {new_count}, volume: {volume_int}, price: {price}, open: {open_price}")
+            if new_count >= 3 and stock_code not in self.pushed_stocks:
+                # 更新推送消息内容，添加涨跌信息
+                price_change = ((price - open_price) / open_price) * 100
+                self.pushed_stocks.add(stock_code)
+                self.queue_alert(stock_code, new_count, volume_int, price_change)
+
     async def save_trends_data(self, stock_code: str, trends_data: list):
-        """保存trends数据到Redis"""
+        """保存trends数据到Redis，一条 SSE 消息只执行一次 pipeline"""
+        await self.write_trends(stock_code, self.parse_trends(stock_code, trends_data))
+
+    async def write_trends(self, stock_code, parsed):
+        """把 parse_trends 解析后的一条消息直接写入 Redis"""
         try:
-            today = datetime.now().strftime('%Y%m%d')
-            pipe = self.redis.pipeline()
-            
-            for trend in trends_data:
-                try:
-                    fields = trend.split(',')
-                    if len(fields) == 8:
-                        # 修复时间格式解析
-                        trade_time = fields[0].split()[-1]  # 只取时间部分 "HH:MM:SS"
-                        trade_time = trade_time.replace(':', '')  # 转换为 "HHMMSS" 格式
-                        volume_int = int(fields[5])
-                        price = float(fields[1])  # 当前价/收盘价
-                        open_price = float(fields[2])  # 开盘价
-                        
-                        # 构建数据字典
-                        data = {
-                            'trade_time': trade_time,
-                            'price': str(price),
-                            'open': str(open_price),
-                            'high': fields[3],
-                            'low': fields[4],
-                            'volume': str(volume_int),
-                            'amount': fields[6],
-                            'avg_price': fields[7]
-                        }
-                        
-                        # 1. 更新最新行情 (使用hset替代hmset)
-                        latest_key = f"stock:trends:{stock_code}:latest"
-                        pipe.hset(latest_key, mapping=data)
-                        
-                        # 2. 添加到当天的分时数据
-                        today_key = f"stock:trends:{stock_code}:today:{today}"
-                        score = int(time.mktime(datetime.strptime(trade_time, '%H%M%S').timetuple()))
-                        pipe.zadd(today_key, {json.dumps(data): score})
-                        
-                        # 3. 设置过期时间
-                        tomorrow = (datetime.now().replace(hour=0, minute=0, second=0) + 
-                                  timedelta(days=1)).timestamp()
-                        pipe.expireat(today_key, int(tomorrow))
-                        
-                        # 4. 更新活跃股票逻辑
-                        # 条件1: 成交量大于20万
-                        # 条件2: 收盘价大于开盘价
-                        if volume_int > 200000 and price > open_price:
-                            active_stocks_key = f"stock:trends:active:stocks:{today}"
-                            current_count = await self.redis.hget(active_stocks_key, stock_code)
-                            
-                            new_count = 1 if current_count is None else int(current_count) + 1
-                            pipe.hset(active_stocks_key, stock_code, new_count)
-                            logger.debug(f"Stock {stock_code} active count: {new_count}, volume: {volume_int}, price: {price}, open: {open_price}")
-                            
-                            await self.update_hot_concepts(stock_code)
-                            
-                            if new_count >= 3 and stock_code not in self.pushed_stocks:
-                                # 更新推送消息内容，添加涨跌信息
-                                price_change = ((price - open_price) / open_price) * 100
-                                await self.push_to_wechat(stock_code, new_count, volume_int, price_change)
-                                self.pushed_stocks.add(stock_code)
-                            
-                            pipe.expireat(active_stocks_key, int(tomorrow))
-                
-                except ValueError as ve:
-                    logger.error(f"Error processing trend data: {ve}, data: {trend}")
-                    continue
-            
-            await pipe.execute()
-            
+            if not parsed:
+                return
+            pipe = self.redis.pipeline(transaction=False)
+            active = await self.queue_trends(pipe, stock_code, parsed)
+            pipe.connection = await self.write_connection()
+            results = await pipe.execute()
+            self.handle_active(stock_code, active, results)
         except Exception as e:
             logger.error(f"Error saving trends data for stock {stock_code}: {e}")
 
-    async def get_active_stocks(self, min_count=2):
+    async def write_connection(self):
+        """
+        从连接池取一个已建立的连接（连接池会检查并重连断开的连接）
+
+        只有建立连接失败时重试，最多 flush_retries 次：这时命令还没有发出，重试不会重复执行
+        """
+        delay = self.flush_retry_delay
+        attempt = 0
+        while True:
+            try:
+                return await self.redis.connection_pool.get_connection()
+            except (RedisConnectionError, RedisTimeoutError) as e:
+                attempt += 1
+                if attempt > self.flush_retries:
+                    raise
+                logger.warning(f"Redis connection failed ({e}), retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+    async def flush_trends(self, items):
+        """
+        把写入队列中的一批消息用一个 pipeline 写入 Redis（TickStore 的写入回调）
+
+        每批的命令最多执行一次：只有建立连接失败时重试（write_connection）；命令发出后的超时、断线时
+        Redis 可能已经执行了这批命令，ZINCRBY、HINCRBY、APPEND 不是幂等的，不重放，抛出后由 TickStore 计入丢弃。
+        单条命令的错误（如 WRONGTYPE）不影响其他命令，记录后丢弃
+
+        :param items: [(stock_code, parsed), ...]
+        """
+        pipe = self.redis.pipeline(transaction=False)
+        pending = [(stock_code, await self.queue_trends(pipe, stock_code, parsed)) for stock_code, parsed in items]
+        commands = list(pipe.command_stack)
+        try:
+            pipe.connection = await self.write_connection()
+            results = await pipe.execute(raise_on_error=False)
+        except Exception:
+            # 写入失败时过期时间可能没有设置成功，之后重新设置
+            self.expired_keys.clear()
+            raise
+
+        errors = [(commands[k][0], result) for k, result in enumerate(results) if isinstance(result, Exception)]
+        if errors:
+            self.command_errors += len(errors)
+            self.expired_keys.clear()
+            command, error = errors[0]
+            logger.error(f"{len(errors)} of {len(results)} Redis commands failed, first: {command[:2]}: {error}")
+        for stock_code, active in pending:
+            self.handle_active(stock_code, active, results)
+
+    async def ingest(self, stock_code, trends_data):
+        """
+        SSE 读取协程的入口：解析后更新实时K线，开启写入队列时只入队（队列满时等待），否则直接写入 Redis
+        """
+        parsed = self.parse_trends(stock_code, trends_data)
+        if not parsed:
+            return
+        for _, _, record, _ in parsed:
+            self.movers.update(stock_code, record)
+        if self.bar_builder is not None:
+            for _, _, record, _ in parsed:
+                self.bar_builder.update(stock_code, record)
+        if self.tick_store is None:
+            await self.write_trends(stock_code, parsed)
+        else:
+            await self.tick_store.put(stock_code, parsed, [record for _, _, record, _ in parsed])
+
+    async def metrics_loop(self, interval=60):
+        """定期输出写入队列的指标"""
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"Tick store metrics: {self.get_metrics()}")
+
+    def get_metrics(self):
+        """写入队列的深度、延迟等指标，以及提醒队列的发送情况"""
+        metrics = self.tick_store.metrics() if self.tick_store is not None else {}
+        metrics['redis_command_errors'] = self.command_errors
+        metrics['alerts'] = self.alert_dispatcher.metrics()
+        return metrics
+
+    async def get_trends_array(self, stock_code, date=None):
+        """
+        读取一只股票一天的分时数据
+
+        :param date: 日期，格式 YYYYMMDD，默认为当天
+        :return: trend_codec.TREND_DTYPE 结构化数组，按时间排序，每个时间点只保留最后一条
+        """
+        date = date or datetime.now().strftime('%Y%m%d')
+        if self.storage == 'packed':
+            buffer = await self.redis_raw.get(f"stock:trends:{stock_code}:packed:{date}")
+            return trend_codec.decode_trends(buffer)
+        members = await self.redis.zrange(f"stock:trends:{stock_code}:today:{date}", 0, -1)
+        return trend_codec.from_json_members(members)
+
+    async def get_active_stocks(self, min_count=2, limit=None):
         """
         获取活跃股票列表
-        :param min_count: 最小活跃次数，默认为2表示至少两次成交于5万
-        :return: 字典，包含股票代码和其活跃次数
+        :param min_count: 最小活跃次数，默认为2表示至少两次成交量大于20万
+        :param limit: 最多返回的股票数，默认全部
+        :return: 字典，包含股票代码和其活跃次数，按活跃次数从高到低
         """
         try:
             today = datetime.now().strftime('%Y%m%d')
-            active_stocks_key = f"stock:trends:active:stocks:{today}"
-            
-            # 获取所有股票及其活跃次数
-            all_stocks = await self.redis.hgetall(active_stocks_key)
-            
-            # 筛选并返回活跃次数大于等于min_count的股票及其次数
-            active_stocks = {
-                stock_code: int(count) 
-                for stock_code, count in all_stocks.items()
-                if int(count) >= min_count
-            }
-            
-            return active_stocks
+            active_zset_key = f"stock:trends:active:zset:{today}"
+
+            # 有序集合按分数范围取前 limit 个，不需要读取全部股票
+            kwargs = {'start': 0, 'num': limit} if limit is not None else {}
+            results = await self.redis.zrevrangebyscore(active_zset_key, '+inf', min_count, withscores=True,
+                                                        **kwargs)
+            return {stock_code: int(count) for stock_code, count in results}
         except Exception as e:
             logger.error(f"Error getting active stocks: {e}")
             return {}
 
+    def get_top_movers(self, by='active', limit=10):
+        """
+        进程内的盘中异动排行
+        :param by: 'active'（活跃次数）、'gain'（涨幅%）或 'volume'（当天累计成交量）
+        :return: [(stock_code, value), ...]
+        """
+        return self.movers.top(by, limit)
+
     async def process_sse_data(self, data):
         """处理 SSE 数据"""
         try:
@@ -325,10 +748,20 @@ class StockTrendsSSEClient:
         """随机获取一个服务器地址"""
         return random.choice(self.server_list)
 
+    def get_server_root(self):
+        """行情服务器地址，设置 SSE_BASE_URL 时使用该地址（如本地回放服务器）"""
+        if self.base_url_override:
+            return self.base_url_override.rstrip('/')
+        server = self.get_random_server()  # 或使用 self.get_next_server()
+        return f"https://{server}"
+
     def get_base_url(self):
         """获取基础URL（这里使用随机策略，也可以改用轮询策略）"""
-        server = self.get_random_server()  # 或使用 self.get_next_server()
-        return f"https://{server}/api/qt/stock/trends2/sse"
+        return f"{self.get_server_root()}/api/qt/stock/trends2/sse"
+
+    def get_ulist_url(self):
+        """多股票行情推送地址"""
+        return f"{self.get_server_root()}/api/qt/ulist/sse"
 
     def get_secid(self, stock_code):
         """生成 secid"""
@@ -339,154 +772,320 @@ class StockTrendsSSEClient:
         else:
             raise ValueError(f"Unsupported stock code format: {stock_code}")
 
-    async def heartbeat_check(self, stock_code):
-        """心跳检测"""
-        while True:
-            await asyncio.sleep(self.heartbeat_interval)
-            if self.last_data_time:
-                time_since_last_data = (datetime.now() - self.last_data_time).seconds
-                if time_since_last_data > self.heartbeat_interval:
-                    logger.warning(f"No data received for {time_since_last_data} seconds for {stock_code}")
-                    return True  # 需要重连
-            else:
-                logger.warning(f"No data received yet for {stock_code}")
-                return True  # 需要重连
-        return False
-
-    async def connect_with_retry(self, stock_code):
-        """带重试机制的连接"""
-        while True:
+    async def iter_sse_frames(self, conn_id, response):
+        """
+        按 '\\n\\n' 切分 SSE 数据帧，逐个返回原始文本（去掉 'data:' 前缀），同时记录该连接最近收到数据的时间
+        """
+        buffer = ""
+        async for chunk in response.content:
+            self.last_data_time[conn_id] = time.monotonic()
             try:
-                await self.connect_sse(stock_code)
-            except Exception as e:
-                logger.error(f"Connection failed for {stock_code}: {e}")
-                await asyncio.sleep(5)
+                buffer += chunk.decode('utf-8')
+            except UnicodeDecodeError as ude:
+                logger.error(f"Unicode decode error for {conn_id}: {ude}")
+                buffer = ""
                 continue
 
-    async def connect_sse(self, stock_code):
-        """连接 SSE 并处理数据流"""
-        try:
-            base_url = self.get_base_url()
-            params = self.common_params.copy()
-            params['secid'] = self.get_secid(stock_code)
-            self.headers['User-Agent'] = random.choice(self.user_agents)
-            
-            logger.info(f"Connecting to {base_url} for stock {stock_code}")
-            
-            while True:
-                try:
-                    timeout = aiohttp.ClientTimeout(total=60, connect=10)
-                    async with aiohttp.ClientSession(timeout=timeout) as session:
-                        async with session.get(
-                            base_url,
-                            params=params,
-                            headers=self.headers,
-                            proxy=None,
-                            ssl=False,
-                            timeout=3 * 60 * 60
-                        ) as response:
-                            if response.status != 200:
-                                logger.error(f"Non-200 status code: {response.status} for {stock_code}")
-                                await asyncio.sleep(5)
-                                continue
-                            
-                            buffer = ""
-                            async for chunk in response.content:
-                                try:
-                                    chunk_text = chunk.decode('utf-8')
-                                    buffer += chunk_text
-                                    
-                                    # 处理完整的数据块
-                                    while '\n\n' in buffer:
-                                        parts = buffer.split('\n\n', 1)
-                                        data_part = parts[0]
-                                        buffer = parts[1]
-                                        
-                                        if data_part.startswith('data:'):
-                                            data_part = data_part[5:].strip()
-                                        
-                                        if data_part and data_part != 'undefined':
-                                            try:
-                                                json_data = json.loads(data_part)
-                                                if json_data.get('data'):
-                                                    if isinstance(json_data['data'], dict) and json_data['data'].get('trends'):
-                                                        trends = json_data['data']['trends']
-                                                        if isinstance(trends, list):
-                                                            await self.save_trends_data(stock_code, trends)
-                                                        else:
-                                                            logger.warning(f"Invalid trends format for {stock_code}")
-                                                    elif json_data['data'] is None:
-                                                        logger.debug(f"Received heartbeat for {stock_code}")
-                                            except json.JSONDecodeError as je:
-                                                logger.error(f"JSON decode error: {je}")
-                                                logger.error(f"Problematic data: {data_part[:200]}...")
-                                    
-                                    # 如果缓冲区太大，清理它
-                                    if len(buffer) > 1024 * 1024:  # 1MB
-                                        logger.warning(f"Buffer too large for {stock_code}, clearing")
-                                        buffer = ""
-                                        
-                                except UnicodeDecodeError as ude:
-                                    logger.error(f"Unicode decode error for {stock_code}: {ude}")
-                                    buffer = ""
-                                    continue
-                                
-                except aiohttp.ClientPayloadError as cpe:
-                    logger.error(f"Payload error for {stock_code}: {cpe}")
-                    await asyncio.sleep(5)
-                    continue
-                except aiohttp.ClientError as e:
-                    logger.error(f"Connection error for {stock_code}: {e}")
-                    await asyncio.sleep(5)
+            # 处理完整的数据块
+            while '\n\n' in buffer:
+                data_part, buffer = buffer.split('\n\n', 1)
+                if data_part.startswith('data:'):
+                    data_part = data_part[5:].strip()
+                if not data_part or data_part == 'undefined':
                     continue
-                except asyncio.TimeoutError:
-                    logger.error(f"Connection timeout for {stock_code}")
-                    await asyncio.sleep(5)
-                    continue
-                    
-        except Exception as e:
-            logger.error(f"Unexpected error for {stock_code}: {e}", exc_info=True)
-            raise
+                yield data_part
 
-    async def init_concept_stocks(self):
-        """初始化概念股数据到Redis"""
-        try:
-            engine = create_engine(
+            # 如果缓冲区太大，清理它
+            if len(buffer) > 1024 * 1024:  # 1MB
+                logger.warning(f"Buffer too large for {conn_id}, clearing")
+                buffer = ""
+
+    async def iter_sse_events(self, conn_id, response):
+        """逐个返回解析后的 SSE 数据帧 JSON"""
+        async for data_part in self.iter_sse_frames(conn_id, response):
+            try:
+                yield json.loads(data_part)
+            except json.JSONDecodeError as je:
+                logger.error(f"JSON decode error: {je}")
+                logger.error(f"Problematic data: {data_part[:200]}...")
+
+    async def stream(self, conn_id, url_factory, params, handle_event, on_connect=None):
+        """
+        在共享会话上保持一个 SSE 连接，断开、超时或被 watchdog 关闭后自动重连
+
+        :param conn_id: 连接标识，用于日志和 watchdog
+        :param url_factory: 每次重连时调用，返回新的服务器地址
+        :param handle_event: 处理一帧 JSON 数据的协程函数
+        :param on_connect: 可选，每次连接成功后、读取数据前调用，用于重置连接相关的状态
+        """
+        while True:
+            base_url = url_factory()
+            headers = dict(self.headers, **{'User-Agent': random.choice(self.user_agents)})
+            try:
+                logger.info(f"Connecting to {base_url} for {conn_id}")
+                async with self.session.get(base_url, params=params, headers=headers, proxy=None) as response:
+                    if response.status != 200:
+                        logger.error(f"Non-200 status code: {response.status} for {conn_id}")
+                        await asyncio.sleep(self.retry_delay)
+                        continue
+
+                    self.responses[conn_id] = response
+                    self.last_data_time[conn_id] = time.monotonic()
+                    if on_connect is not None:
+                        on_connect()
+                    async for json_data in self.iter_sse_events(conn_id, response):
+                        if json_data.get('data') is None:
+                            logger.debug(f"Received heartbeat for {conn_id}")
+                            continue
+                        await handle_event(json_data['data'])
+
+            except aiohttp.ClientPayloadError as cpe:
+                logger.error(f"Payload error for {conn_id}: {cpe}")
+            except aiohttp.ClientError as e:
+                logger.error(f"Connection error for {conn_id}: {e}")
+            except asyncio.TimeoutError:
+                logger.error(f"Connection timeout for {conn_id}")
+            finally:
+                self.responses.pop(conn_id, None)
+            await asyncio.sleep(self.retry_delay)
+
+    async def watchdog(self):
+        """
+        统一的心跳检测：超过 heartbeat_interval 没有收到数据的连接会被关闭，由 stream 负责重连
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval / 2)
+            now = time.monotonic()
+            for conn_id, response in list(self.responses.items()):
+                idle = now - self.last_data_time.get(conn_id, now)
+                if idle > self.heartbeat_interval:
+                    logger.warning(f"No data received for {idle:.0f} seconds for {conn_id}, reconnecting")
+                    response.close()
+
+    def trends_request_params(self, stock_code):
+        """单只股票分时连接的请求参数"""
+        params = self.common_params.copy()
+        params['secid'] = self.get_secid(stock_code)
+        return params
+
+    def ulist_request_params(self, stock_codes):
+        """多股票行情连接的请求参数"""
+        params = dict(self.ulist_params)
+        params['secids'] = ','.join(self.get_secid(code) for code in stock_codes)
+        params['pz'] = str(len(stock_codes))
+        return params
+
+    async def connect_with_retry(self, stock_code):
+        """单只股票的分时连接（trends 模式）"""
+        params = self.trends_request_params(stock_code)
+
+        async def handle_event(data):
+            if isinstance(data, dict) and data.get('trends'):
+                trends = data['trends']
+                if isinstance(trends, list):
+                    await self.ingest(stock_code, trends)
+                else:
+                    logger.warning(f"Invalid trends format for {stock_code}")
+
+        await self.stream(stock_code, self.get_base_url, params, handle_event)
+
+    async def connect_ulist(self, conn_id, stock_codes):
+        """
+        一个连接订阅多只股票的行情（ulist 模式），推送的快照转换为分钟分时数据后入库
+
+        首帧包含全部股票（带股票代码 f12），之后只推送变化的股票和字段；diff 的 key 为股票在服务器排序
+        （po=1）中的位置，与 secids 的顺序不一定相同。位置到股票的映射由带 f12 的数据建立，每次重连后重建，
+        不在映射中的位置直接丢弃，不会写到其他股票上
+        """
+        params = self.ulist_request_params(stock_codes)
+        subscribed = set(stock_codes)
+        positions = {}
+
+        async def handle_event(data):
+            diff = data.get('diff') if isinstance(data, dict) else None
+            if not diff:
+                return
+            items = diff.items() if isinstance(diff, dict) else enumerate(diff)
+            for position, quote in items:
+                position = int(position)
+                stock_code = quote.get('f12')
+                if stock_code is not None:
+                    stock_code = str(stock_code)
+                    if stock_code not in subscribed:
+                        continue
+                    positions[position] = stock_code
+                else:
+                    stock_code = positions.get(position)
+                    if stock_code is None:
+                        continue
+                trend = self.quote_converter.update(stock_code, quote)
+                if trend is not None:
+                    await self.ingest(stock_code, [trend])
+
+        await self.stream(conn_id, self.get_ulist_url, params, handle_event, on_connect=positions.clear)
+
+    def split_connections(self, stock_codes):
+        """
+        把股票分配到各个连接，连接数不超过 max_connections
+
+        :return: {conn_id: [stock_code, ...]}
+        """
+        per_connection = max(self.secids_per_connection, -(-len(stock_codes) // self.max_connections))
+        return {
+            f"ulist-{k // per_connection}": stock_codes[k:k + per_connection]
+            for k in range(0, len(stock_codes), per_connection)
+        }
+
+    async def run(self, stock_codes):
+        """启动行情监控：所有连接共用一个会话，由一个 watchdog 统一检测"""
+        if self.session is None:
+            await self.init_session()
+
+        stock_codes = [code for code in stock_codes if code.startswith(('300', '301', '00', '60', '688'))]
+        if self.mode == 'trends':
+            if len(stock_codes) > self.max_connections:
+                logger.warning(f"trends mode needs one connection per stock, only the first "
+                               f"{self.max_connections} of {len(stock_codes)} will stream")
+            tasks = [self.connect_with_retry(code) for code in stock_codes]
+        else:
+            tasks = [self.connect_ulist(conn_id, codes)
+                     for conn_id, codes in self.split_connections(stock_codes).items()]
+        logger.info(f"Monitoring {len(stock_codes)} stocks over {len(tasks)} connections ({self.mode} mode)")
+        await self.restore_hot_concepts(stock_codes if self.shard_id is not None else None)
+        tasks += [self.hot_concepts_loop(), self.alert_dispatcher.run()]
+        if self.bar_enabled and self.bar_builder is None:
+            await self.init_bar_builder()
+        if self.bar_builder is not None:
+            tasks.append(self.bars_loop())
+        if self.tick_store is not None:
+            tasks += [self.tick_store.flush_loop(self.flush_trends), self.metrics_loop()]
+        await asyncio.gather(self.watchdog(), *tasks)
+
+    def get_engine(self):
+        """MySQL 连接（首次使用时创建）"""
+        if self.engine is None:
+            self.engine = create_engine(
                 f"mysql+pymysql://{self.mysql_config['user']}:{self.mysql_config['password']}@"
                 f"{self.mysql_config['host']}:{self.mysql_config['port']}/{self.mysql_config['db']}"
             )
+        return self.engine
 
-            df = pd.read_sql("SELECT concept_name, stock_code, stock_name FROM t_concept_stock", engine)
-            
-            pipe = self.redis.pipeline()
-            
-            # 1. 存储股票到概念的映射
-            for _, row in df.iterrows():
-                stock_key = f"meta:stock:concept:{row['stock_code']}"
-                concept_data = {
-                    'concept_name': row['concept_name'],
-                    'stock_name': row['stock_name']
-                }
-                pipe.hset(stock_key, mapping=concept_data)  # 使用hset with mapping
-            
-            # 2. 存储概念到股票的映射
-            for concept_name in df['concept_name'].unique():
-                concept_stocks = df[df['concept_name'] == concept_name]
+    async def init_bar_builder(self):
+        """创建当天的实时K线生成器，读取前收盘价和当天已写入的K线（重启时不重复写入）"""
+        try:
+            engine = self.get_engine()
+            today = datetime.now().date()
+            if self.bar_with_1min:
+                await asyncio.to_thread(bar_builder.init_1min_table, engine)
+            pre_close = await asyncio.to_thread(bar_builder.load_pre_close, engine, today)
+            done = await asyncio.to_thread(bar_builder.load_done, engine, today)
+            self.bar_builder = bar_builder.BarBuilder(today, with_1min=self.bar_with_1min, pre_close=pre_close,
+                                                      done=done)
+            self.movers.pre_close = pre_close
+            logger.info(f"Bar builder ready for {today}, {len(done)} stocks already have bars")
+        except Exception as e:
+            self.bar_builder = None
+            logger.error(f"Error initializing bar builder, real-time bars disabled: {e}")
+
+    async def flush_bars(self):
+        """把已收线的K线批量写入 MySQL，失败时保留到下次写入"""
+        df5, df1 = self.bar_builder.take_bars()
+        if self.pending_bars is not None:
+            df5 = pd.concat([self.pending_bars[0], df5], ignore_index=True)
+            df1 = pd.concat([self.pending_bars[1], df1], ignore_index=True)
+            self.pending_bars = None
+        if df5.empty and df1.empty:
+            return
+        try:
+            count5, count1 = await asyncio.to_thread(bar_builder.write_bars, self.get_engine(), df5,
+                                                     df1 if self.bar_with_1min else None)
+            logger.debug(f"Flushed {count5} 5-minute bars and {count1} 1-minute bars")
+        except Exception as e:
+            self.pending_bars = (df5, df1)
+            logger.error(f"Error writing bars: {e}")
+
+    async def bars_loop(self):
+        """定期按时间收线并写入K线，跨天时收线所有K线并重新创建生成器"""
+        while True:
+            await asyncio.sleep(self.bar_flush_interval)
+            now = datetime.now()
+            if now.date() != self.bar_builder.date:
+                self.bar_builder.close_all()
+                await self.flush_bars()
+                await self.init_bar_builder()
+                if self.bar_builder is None:
+                    return
+            else:
+                self.bar_builder.close_expired(now.hour * 3600 + now.minute * 60 + now.second)
+            await self.flush_bars()
+
+    async def init_concept_stocks(self, force=False, chunk_size=1000):
+        """
+        初始化概念股数据到Redis
+
+        按股票、按概念分组后每个 key 一条 HSET mapping，分批用 pipeline 写入，并删除已不存在的股票、概念的 key；
+        t_concept_stock 的内容哈希保存在 meta:concept:version，未变化时跳过写入（force=True 时强制写入）
+
+        :param chunk_size: 每个 pipeline 的命令数
+        """
+        try:
+            df = pd.read_sql("SELECT concept_name, stock_code, stock_name FROM t_concept_stock", self.get_engine())
+            df = df.dropna(subset=['concept_name', 'stock_code']).drop_duplicates(['stock_code', 'concept_name'])
+            df = df.sort_values(['stock_code', 'concept_name'], kind='mergesort').reset_index(drop=True)
+            df['stock_name'] = df['stock_name'].fillna('')
+
+            self.hot_concepts.load_concepts(df.groupby('stock_code', sort=False)['concept_name'].agg(list).to_dict())
+
+            version = hashlib.sha1(pd.util.hash_pandas_object(df, index=False).values.tobytes()).hexdigest()
+            if not force and await self.redis.get(CONCEPT_VERSION_KEY) == version:
+                logger.info(f"Concept stocks unchanged (version {version[:12]}), skip loading")
+                return
+
+            # 每个 key 的命令为一组，同一组在同一个 pipeline 中，不会出现 DEL 之后 HSET 在下一批的情况
+            # 1. 股票 -> 概念，一只股票的多个概念用逗号连接
+            stocks = df.groupby('stock_code', sort=False).agg(
+                concept_name=('concept_name', ','.join), stock_name=('stock_name', 'first'))
+            groups = [[('hset', f"meta:stock:concept:{code}", {'concept_name': concept, 'stock_name': name})]
+                      for code, concept, name in zip(stocks.index, stocks['concept_name'], stocks['stock_name'])]
+
+            # 2. 概念 -> 股票，先删除旧的 hash，避免已移出概念的股票残留
+            for concept_name, group in df.groupby('concept_name', sort=False):
                 concept_key = f"meta:concept:stocks:{concept_name}"
-                
-                concept_stocks_data = dict(zip(
-                    concept_stocks['stock_code'],
-                    concept_stocks['stock_name']
-                ))
-                pipe.hset(concept_key, mapping=concept_stocks_data)  # 使用hset with mapping
-            
-            # 3. 存储所有概念名称集合
+                groups.append([('delete', concept_key, None),
+                               ('hset', concept_key, dict(zip(group['stock_code'], group['stock_name'])))])
+
+            # 已不在 t_concept_stock 中的股票、概念，删除它们的 key
+            current_keys = {command[1] for group in groups for command in group}
+            stale_keys = []
+            for pattern in ("meta:stock:concept:*", "meta:concept:stocks:*"):
+                stale_keys += [key async for key in self.redis.scan_iter(match=pattern, count=1000)
+                               if key not in current_keys]
+            groups.extend([('delete', key, None)] for key in stale_keys)
+
+            pipe, size = self.redis.pipeline(transaction=False), 0
+            for group in groups:
+                if size and size + len(group) > chunk_size:
+                    await pipe.execute()
+                    pipe, size = self.redis.pipeline(transaction=False), 0
+                for command, key, mapping in group:
+                    if command == 'hset':
+                        pipe.hset(key, mapping=mapping)
+                    else:
+                        pipe.delete(key)
+                size += len(group)
+            if size:
+                await pipe.execute()
+
+            # 3. 存储所有概念名称集合，最后写入版本号
             all_concepts_key = "meta:concepts:all"
+            pipe = self.redis.pipeline()
+            pipe.delete(all_concepts_key)
             pipe.sadd(all_concepts_key, *df['concept_name'].unique())
-            
+            pipe.set(CONCEPT_VERSION_KEY, version)
             await pipe.execute()
-            logger.debug(f"Successfully loaded {len(df)} concept stock records into Redis")
-            
+            logger.info(f"Successfully loaded {len(df)} concept stock records into Redis "
+                        f"({len(stocks)} stocks, {len(stale_keys)} stale keys deleted, version {version[:12]})")
+
         except Exception as e:
             logger.error(f"Error loading concept stocks: {e}")
             raise
@@ -521,48 +1120,43 @@ class StockTrendsSSEClient:
 
     async def update_hot_concepts(self, stock_code: str):
         """
-        更新热点板块统计
+        更新热点板块统计（只更新内存，由 publish_hot_concepts 定期写入 Redis）
         每只股票在同一概念中只统计一次，不管触发多少次活跃
         """
+        self.hot_concepts.mark_active(stock_code)
+
+    async def restore_hot_concepts(self, stock_codes=None):
+        """
+        启动时从 Redis 读回当天的概念活跃集合，只读取一次
+
+        :param stock_codes: 分片模式下本进程负责的股票，只读回这些股票并重写本分片的热点排行
+        """
+        if self.hot_concepts_restored:
+            return
+        try:
+            await self.hot_concepts.restore(self.redis, stock_codes=stock_codes)
+            self.hot_concepts_restored = True
+        except Exception as e:
+            logger.error(f"Error restoring hot concepts: {e}")
+
+    async def publish_hot_concepts(self):
+        """把变化的概念热度和活跃集合用一个 pipeline 写入 Redis"""
+        pipe = self.redis.pipeline(transaction=False)
+        self.roll_day()
+        pending = self.hot_concepts.queue_publish(pipe, self.tomorrow_ts)
+        if not pending:
+            return
         try:
-            today = datetime.now().strftime('%Y%m%d')
-            
-            # 获取股票的所有概念
-            concepts = await self.get_stock_concepts(stock_code)
-            if not concepts:
-                return
-            
-            pipe = self.redis.pipeline()
-            
-            # 遍历股票的所有概念
-            for concept_name in concepts.get('concept_name', '').split(','):
-                if not concept_name:
-                    continue
-                    
-                # 概念活跃股票集合的key
-                concept_active_stocks_key = f"hot:concept:active:stocks:{concept_name}:{today}"
-                
-                # 将股票添加到概念的活跃股票集合中
-                # SADD命令：如果股票已存在，不会重复添加
-                pipe.sadd(concept_active_stocks_key, stock_code)
-                
-                # 设置过期时间
-                tomorrow = (datetime.now().replace(hour=0, minute=0, second=0) + 
-                          timedelta(days=1)).timestamp()
-                pipe.expireat(concept_active_stocks_key, int(tomorrow))
-                
-                # 获取该概念下的活跃股票数量
-                active_count = await self.redis.scard(concept_active_stocks_key)
-                
-                # 更新热点板块排行
-                hot_concepts_key = f"hot:concept:stats:{today}"
-                pipe.zadd(hot_concepts_key, {concept_name: active_count})
-                pipe.expireat(hot_concepts_key, int(tomorrow))
-            
             await pipe.execute()
-            
         except Exception as e:
-            logger.error(f"Error updating hot concepts for stock {stock_code}: {e}")
+            self.hot_concepts.requeue(pending)
+            logger.error(f"Error publishing hot concepts: {e}")
+
+    async def hot_concepts_loop(self):
+        """定期发布热点板块统计"""
+        while True:
+            await asyncio.sleep(self.hot_concept_publish_interval)
+            await self.publish_hot_concepts()
 
     async def get_hot_concepts(self, limit=10):
         """
@@ -570,6 +1164,9 @@ class StockTrendsSSEClient:
         :param limit: 返回前N个热点板块
         :return: [(concept_name, active_stocks_count), ...]
         """
+        # 本进程正在统计时直接使用内存中的数据，比 Redis 中的发布结果更新；分片进程只有部分股票，读取合并结果
+        if self.hot_concepts_restored and self.shard_id is None:
+            return self.hot_concepts.get_hot_concepts(limit)
         try:
             today = datetime.now().strftime('%Y%m%d')
             hot_concepts_key = f"hot:concept:stats:{today}"
@@ -593,6 +1190,8 @@ class StockTrendsSSEClient:
         """
         获取概念下的活跃股票列表
         """
+        if self.hot_concepts_restored and self.shard_id is None:
+            return self.hot_concepts.get_concept_active_stocks(concept_name)
         try:
             today = datetime.now().strftime('%Y%m%d')
             concept_active_stocks_key = f"hot:concept:active:stocks:{concept_name}:{today}"
@@ -605,76 +1204,22 @@ class StockTrendsSSEClient:
             logger.error(f"Error getting active stocks for concept {concept_name}: {e}")
             return []
 
+    def queue_alert(self, stock_code: str, count: int, volume: int, price_change: float):
+        """把高活跃度提醒加入发送队列（不等待），由 alert_dispatcher 合并、限速后推送到企业微信"""
+        self.alert_dispatcher.enqueue(stock_code, count, volume, price_change)
+
     async def push_to_wechat(self, stock_code: str, count: int, volume: int, price_change: float):
         """
-        推送消息到企业微信机器人（随机选择一个webhook地址）
+        推送消息到企业微信机器人（加入发送队列）
         """
-        try:
-            # 获取股票的概念信息
-            stock_concepts = await self.get_stock_concepts(stock_code)
-            stock_name = stock_concepts.get('stock_name', '未知')
-            concepts = stock_concepts.get('concept_name', '无')
+        self.queue_alert(stock_code, count, volume, price_change)
 
-            # 获取当前时间
-            current_time = datetime.now().strftime('%H:%M:%S')
-            
-            # 构建消息内容
-            message = (
-                f"🔥 高活跃度股票提醒 \n"
-                f"时间: {current_time}\n"
-                f"股票: {stock_code} {stock_name}\n"
-                f"涨跌幅: {price_change:.2f}%\n"
-                f"活跃次数: {count}\n"
-                f"当前成交量: {volume}\n"
-                f"所属概念: {concepts}\n"
-                f"------------------------\n"
-            )
-
-            # 构建请求数据
-            data = {
-                "msgtype": "text",
-                "text": {
-                    "content": message
-                }
-            }
-
-            # 随机选择一个webhook地址
-            webhook_url = random.choice(self.webhook_urls)
-            
-            # 发送请求
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    webhook_url,
-                    json=data,
-                    headers={'Content-Type': 'application/json'}
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if result.get('errcode') == 0:
-                            logger.debug(f"Successfully pushed message for stock {stock_code} to webhook")
-                        else:
-                            logger.error(f"Failed to push message: {result}")
-                            # 如果当前webhook失败，尝试其他webhook
-                            for backup_url in [url for url in self.webhook_urls if url != webhook_url]:
-                                try:
-                                    async with session.post(
-                                        backup_url,
-                                        json=data,
-                                        headers={'Content-Type': 'application/json'}
-                                    ) as backup_response:
-                                        if backup_response.status == 200:
-                                            backup_result = await backup_response.json()
-                                            if backup_result.get('errcode') == 0:
-                                                logger.debug(f"Successfully pushed message using backup webhook")
-                                                break
-                                except Exception as be:
-                                    logger.error(f"Backup webhook also failed: {be}")
-                                    continue
-                    else:
-                        logger.error(f"Failed to push message, status code: {response.status}")
-
-        except Exception as e:
-            logger.error(f"Error pushing message to WeChat: {e}")
+    async def describe_stocks(self, stock_codes):
+        """一次 pipeline 读取一批股票的名称和概念，用于组装提醒消息"""
+        pipe = self.redis.pipeline(transaction=False)
+        for stock_code in stock_codes:
+            pipe.hgetall(f"meta:stock:concept:{stock_code}")
+        return dict(zip(stock_codes, await pipe.execute()))
 
     # 添加一个方法在每天开始时重置推送记录
     async def reset_push_records(self):
@@ -706,8 +1251,7 @@ async def main():
         logger.debug(f"Loaded {len(stock_codes)} stock codes from input.txt")
         
         # 启动行情监控任务
-        tasks = [client.connect_with_retry(code) for code in stock_codes]
-        await asyncio.gather(*tasks)
+        await client.run(stock_codes)
         
     except FileNotFoundError:
         logger.error("input.txt not found in current directory")
@@ -0,0 +1,202 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+进程内的分时数据缓存与 Redis 批量写入队列
+
+- 每只股票保存最新一条分时数据，以及最近 capacity 分钟的环形缓冲区（trend_codec.TREND_DTYPE 数组），
+  同一分钟的重复推送覆盖缓冲区中的最后一条
+- SSE 读取协程只把消息放入有界队列，由一个写入协程按 flush_interval 或 flush_batch 批量写入 Redis；
+  队列满时 put 会等待（背压），Redis 短暂不可用时不会阻塞网络读取，也不会无限占用内存；
+  是否重试由写入回调决定（活跃计数、APPEND 不是幂等的，不能整批重放），回调仍然失败时丢弃该批并计数
+- metrics() 返回队列深度、写入延迟等指标
+"""
+
+import asyncio
+import logging
+import time
+
+import numpy as np
+
+from com.caicongyang.financial.engineering.stock_select_strategy import trend_codec
+
+logger = logging.getLogger(__name__)
+
+
+class TrendRing:
+    """一只股票的分时环形缓冲区"""
+
+    def __init__(self, capacity):
+        self.records = np.zeros(capacity, dtype=trend_codec.TREND_DTYPE)
+        self.capacity = capacity
+        self.head = 0  # 下一条写入的位置
+        self.count = 0
+
+    def append(self, record):
+        """
+        :param record: 与 TREND_DTYPE 字段顺序一致的元组
+        """
+        if self.count:
+            last = (self.head - 1) % self.capacity
+            last_time = self.records['time'][last]
+            if record[0] == last_time:
+                self.records[last] = record
+                return
+            # 重连时重新推送的历史分钟
+            if record[0] < last_time:
+                return
+        self.records[self.head] = record
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def to_array(self):
+        """按时间顺序返回缓冲区中的记录"""
+        start = (self.head - self.count) % self.capacity
+        return np.roll(self.records, -start)[:self.count].copy()
+
+
+class TickStore:
+    """
+    分时数据缓存和批量写入队列
+
+    :param capacity: 每只股票缓存的分钟数，一个交易日为 241 分钟
+    :param queue_size: 队列长度上限，超过后 put 等待
+    :param flush_interval: 最长写入间隔（秒）
+    :param flush_batch: 一次写入的最大消息数
+    """
+
+    def __init__(self, capacity=256, queue_size=20000, flush_interval=0.2, flush_batch=1000):
+        self.capacity = capacity
+        self.rings = {}
+        self.latest = {}
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        # 写入协程正在凑批、还没有交给 flush 的消息，写入协程被取消时由 drain 写入
+        self.collecting = []
+
+        # 指标
+        self.enqueued = 0
+        self.flushed = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.backpressure_waits = 0
+        self.last_flush_seconds = 0.0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    async def put(self, stock_code, item, records):
+        """
+        缓存一条 SSE 消息并放入写入队列
+
+        :param item: 写入 Redis 需要的数据，原样交给 flush 回调
+        :param records: 该消息中的分时记录，TREND_DTYPE 字段顺序的元组列表
+        """
+        ring = self.rings.get(stock_code)
+        if ring is None:
+            ring = self.rings[stock_code] = TrendRing(self.capacity)
+        for record in records:
+            ring.append(record)
+        if records:
+            self.latest[stock_code] = records[-1]
+
+        if self.queue.full():
+            self.backpressure_waits += 1
+        await self.queue.put((time.monotonic(), stock_code, item))
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+
+    def get_latest(self, stock_code):
+        """最新一条分时记录（元组），没有数据时返回 None"""
+        return self.latest.get(stock_code)
+
+    def get_trends(self, stock_code):
+        """缓冲区中的分时数据，TREND_DTYPE 数组"""
+        ring = self.rings.get(stock_code)
+        return ring.to_array() if ring else np.empty(0, dtype=trend_codec.TREND_DTYPE)
+
+    async def _next_batch(self):
+        """等待第一条消息，然后在 flush_interval 内尽量凑满 flush_batch 条"""
+        batch = self.collecting = []
+        batch.append(await self.queue.get())
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_batch:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        self.collecting = []
+        return batch
+
+    async def flush_loop(self, flush):
+        """
+        持续把队列中的消息批量写入 Redis
+
+        :param flush: 协程函数 flush([(stock_code, item), ...])，一次写入一批消息，自行处理可以安全重试的错误；
+                      抛出异常时丢弃该批（计入 dropped），不阻塞后续消息
+        """
+        while True:
+            batch = await self._next_batch()
+            items = [(stock_code, item) for _, stock_code, item in batch]
+            started = time.monotonic()
+            try:
+                await flush(items)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.flush_errors += 1
+                self.dropped += len(items)
+                logger.error(f"Flush of {len(items)} messages failed, dropped: {e}")
+
+            now = time.monotonic()
+            self.last_flush_seconds = now - started
+            self.last_lag_seconds = now - batch[0][0]
+            self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+            self.flushed += len(batch)
+            self.flush_count += 1
+            for _ in batch:
+                self.queue.task_done()
+
+    async def drain(self, flush):
+        """停止时把队列中剩余的消息按 flush_batch 分批写入（写入协程已停止后调用）"""
+        while self.collecting or not self.queue.empty():
+            batch, self.collecting = self.collecting, []
+            while len(batch) < self.flush_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await flush([(stock_code, item) for _, stock_code, item in batch])
+                self.flushed += len(batch)
+            except Exception as e:
+                self.flush_errors += 1
+                self.dropped += len(batch)
+                logger.error(f"Flush of {len(batch)} messages failed while draining, dropped: {e}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def metrics(self):
+        """队列和写入指标"""
+        return {
+            'queue_depth': self.queue.qsize(),
+            'queue_max_depth': self.max_depth,
+            'queue_capacity': self.queue.maxsize,
+            'enqueued': self.enqueued,
+            'flushed': self.flushed,
+            'flush_count': self.flush_count,
+            'flush_errors': self.flush_errors,
+            'dropped': self.dropped,
+            'backpressure_waits': self.backpressure_waits,
+            'avg_batch_size': self.flushed / self.flush_count if self.flush_count else 0.0,
+            'last_flush_seconds': self.last_flush_seconds,
+            'last_lag_seconds': self.last_lag_seconds,
+            'max_lag_seconds': self.max_lag_seconds,
+            'stocks': len(self.rings),
+        }
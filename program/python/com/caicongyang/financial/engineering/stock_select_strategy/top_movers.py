@@ -0,0 +1,107 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+进程内的盘中异动排行：活跃次数、涨幅、当天累计成交量的前N名
+
+每个指标一个延迟删除的堆：数值变化时压入新的 (−数值, 股票代码)，旧的条目留在堆中，
+查询时弹出并丢弃与当前数值不一致的条目。更新 O(log n)，查询前 k 名 O(k log n)（摊销），
+堆中的过期条目超过当前股票数的2倍时整体重建。
+
+分时数据（trend_codec.TREND_DTYPE 字段顺序的记录）同一分钟会被重复推送，成交量为分钟成交量：
+当天累计成交量 = 已结束分钟的成交量之和 + 当前分钟最新的成交量。
+"""
+
+import heapq
+
+from com.caicongyang.financial.engineering.stock_select_strategy import trend_codec
+
+METRICS = ('active', 'gain', 'volume')
+
+
+class _StockState:
+    """一只股票的当前分钟和已结束分钟的累计成交量"""
+    __slots__ = ('minute', 'minute_volume', 'closed_volume', 'base_price')
+
+    def __init__(self, base_price):
+        self.minute = -1
+        self.minute_volume = 0
+        self.closed_volume = 0
+        # 计算涨幅的基准价（PRICE_SCALE 放大后），前收盘价未知时为当天收到的第一个价格
+        self.base_price = base_price
+
+
+class TopMovers:
+    """
+    :param pre_close: {stock_code: 前一交易日收盘价}，用于计算涨幅
+    """
+
+    def __init__(self, pre_close=None):
+        self.pre_close = pre_close or {}
+        self.reset()
+
+    def reset(self):
+        """跨天时清空排行"""
+        self.stocks = {}
+        self.values = {metric: {} for metric in METRICS}
+        self.heaps = {metric: [] for metric in METRICS}
+
+    def _set(self, metric, stock_code, value):
+        values = self.values[metric]
+        if values.get(stock_code) == value:
+            return
+        values[stock_code] = value
+        heap = self.heaps[metric]
+        heapq.heappush(heap, (-value, stock_code))
+        if len(heap) > 2 * len(values) + 64:
+            heap = self.heaps[metric] = [(-v, code) for code, v in values.items()]
+            heapq.heapify(heap)
+
+    def update(self, stock_code, record):
+        """
+        :param record: TREND_DTYPE 字段顺序的元组 (time, price, open, high, low, avg_price, volume, amount)
+        """
+        seconds, price, _, _, _, _, volume, _ = record
+        state = self.stocks.get(stock_code)
+        if state is None:
+            pre_close = self.pre_close.get(stock_code)
+            base_price = pre_close * trend_codec.PRICE_SCALE if pre_close else price
+            state = self.stocks[stock_code] = _StockState(base_price)
+        if seconds < state.minute:
+            # 重连时推送的当天历史分钟已经统计过
+            return
+        if seconds > state.minute:
+            state.closed_volume += state.minute_volume
+            state.minute = seconds
+        state.minute_volume = volume
+        self._set('volume', stock_code, state.closed_volume + volume)
+        if state.base_price:
+            self._set('gain', stock_code, round((price - state.base_price) / state.base_price * 100, 2))
+
+    def set_active(self, stock_code, count):
+        """活跃次数（Redis 中 ZINCRBY 的结果）"""
+        self._set('active', stock_code, count)
+
+    def top(self, metric='active', limit=10):
+        """
+        :param metric: 'active'、'gain' 或 'volume'
+        :return: [(stock_code, value), ...]，按数值从大到小
+        """
+        heap = self.heaps[metric]
+        values = self.values[metric]
+        result = []
+        seen = set()
+        while heap and len(result) < limit:
+            value, stock_code = heapq.heappop(heap)
+            value = -value
+            if stock_code in seen or values.get(stock_code) != value:
+                continue
+            seen.add(stock_code)
+            result.append((stock_code, value))
+        for stock_code, value in result:
+            heapq.heappush(heap, (-value, stock_code))
+        return result
+
+    def get(self, stock_code):
+        """一只股票当前的各项指标"""
+        return {metric: self.values[metric].get(stock_code) for metric in METRICS}
@@ -0,0 +1,108 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+分时数据的定长二进制编码
+
+每条分时数据编码为 40 字节的小端定长记录，价格按 PRICE_SCALE 放大后存为整数：
+    time(uint32, 当天零点起的秒数), price, open, high, low, avg_price(int32, 价格 × 1000),
+    volume(int64, 手), amount(int64, 元)
+
+一只股票一天的分时数据追加到同一个 Redis 字符串中（APPEND），一次 GET 即可读回，
+用 numpy.frombuffer 直接解码为结构化数组，不需要逐条 json.loads。
+同一分钟会被重复推送多次，解码时只保留每个时间点的最后一条。
+"""
+
+import json
+import struct
+
+import numpy as np
+
+PRICE_SCALE = 1000
+
+TREND_DTYPE = np.dtype([
+    ('time', '<u4'),
+    ('price', '<i4'),
+    ('open', '<i4'),
+    ('high', '<i4'),
+    ('low', '<i4'),
+    ('avg_price', '<i4'),
+    ('volume', '<i8'),
+    ('amount', '<i8'),
+])
+
+TREND_STRUCT = struct.Struct('<Iiiiiiqq')
+assert TREND_STRUCT.size == TREND_DTYPE.itemsize
+
+PRICE_FIELDS = ('price', 'open', 'high', 'low', 'avg_price')
+
+
+def to_record(seconds, price, open_price, high, low, avg_price, volume, amount):
+    """一条分时数据转换为 TREND_DTYPE 字段顺序的整数元组，价格为浮点数（元）"""
+    return (int(seconds),
+            round(price * PRICE_SCALE), round(open_price * PRICE_SCALE),
+            round(high * PRICE_SCALE), round(low * PRICE_SCALE), round(avg_price * PRICE_SCALE),
+            int(volume), round(amount))
+
+
+def encode_trend(seconds, price, open_price, high, low, avg_price, volume, amount):
+    """编码一条分时数据，价格为浮点数（元）"""
+    return TREND_STRUCT.pack(*to_record(seconds, price, open_price, high, low, avg_price, volume, amount))
+
+
+def decode_trends(buffer, dedup=True):
+    """
+    解码一只股票一天的分时数据
+
+    :param buffer: Redis 中读回的 bytes，可以为 None
+    :param dedup: 是否只保留每个时间点的最后一条，并按时间排序
+    :return: TREND_DTYPE 结构化数组
+    """
+    if not buffer:
+        return np.empty(0, dtype=TREND_DTYPE)
+    # 丢弃写入中断导致的不完整记录
+    usable = len(buffer) - len(buffer) % TREND_DTYPE.itemsize
+    records = np.frombuffer(buffer[:usable], dtype=TREND_DTYPE)
+    return dedup_last(records) if dedup else records
+
+
+def dedup_last(records):
+    """只保留每个时间点最后写入的记录，并按时间排序"""
+    if len(records) == 0:
+        return records
+    # 倒序后 unique 取到的是每个时间点最后写入的记录
+    _, last = np.unique(records['time'][::-1], return_index=True)
+    return records[len(records) - 1 - last]
+
+
+def from_json_members(members):
+    """
+    把 JSON 存储模式下 ZSET 中的成员（save_trends_data 写入的 dict）转换为 TREND_DTYPE 数组
+
+    ZSET 中同一分钟的多条记录分数相同、按字典序排列，这里取成交量最大（即最新）的一条
+
+    :param members: JSON 字符串列表
+    """
+    rows = []
+    for member in members:
+        data = json.loads(member)
+        trade_time = data['trade_time'].ljust(6, '0')
+        seconds = int(trade_time[:2]) * 3600 + int(trade_time[2:4]) * 60 + int(trade_time[4:6])
+        rows.append((seconds,
+                     round(float(data['price']) * PRICE_SCALE), round(float(data['open']) * PRICE_SCALE),
+                     round(float(data['high']) * PRICE_SCALE), round(float(data['low']) * PRICE_SCALE),
+                     round(float(data['avg_price']) * PRICE_SCALE),
+                     int(data['volume']), round(float(data['amount']))))
+    records = np.array(rows, dtype=TREND_DTYPE)
+    return dedup_last(records[np.lexsort((records['volume'], records['time']))])
+
+
+def to_float_prices(records):
+    """
+    把整数价格还原为元，返回普通的浮点结构化数组，字段同 TREND_DTYPE
+    """
+    dtype = [(name, np.float64 if name in PRICE_FIELDS else records.dtype[name]) for name in records.dtype.names]
+    result = np.empty(len(records), dtype=dtype)
+    for name in records.dtype.names:
+        result[name] = records[name] / PRICE_SCALE if name in PRICE_FIELDS else records[name]
+    return result
@@ -0,0 +1,200 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+"""
+收盘后把 Redis 中当天的分时数据归档为按日的列式文件
+
+Redis 中的分时数据（stock:trends:{code}:today:{date} 或 stock:trends:{code}:packed:{date}）在次日0点过期，
+收盘后运行本脚本（如 crontab 每天 15:30）把当天所有股票的分时数据保存下来，用于回测：
+- SCAN 找出当天所有股票的 key，每 chunk_size 个 key 一次 pipeline 读取（ZRANGE / GET）
+- 用 trend_codec 解码为 TREND_DTYPE 结构化数组（每个时间点只保留最后一条）
+- 一天一个 np.savez_compressed 文件 {archive_dir}/trends_{date}.npz，按股票分段（CSR）存储：
+    codes:   股票代码，升序
+    offsets: 长度 len(codes) + 1，第 k 只股票的记录为 records[offsets[k]:offsets[k + 1]]
+    records: 所有股票的记录按股票顺序拼接，字段同 trend_codec.TREND_DTYPE（价格为 × PRICE_SCALE 的整数）
+  先写临时文件再改名，读取时不会读到写了一半的文件
+
+归档目录默认为项目根目录下的 data/trends_archive，可用 TRENDS_ARCHIVE_DIR 修改。
+
+使用示例：
+    python trends_archiver.py                      # 归档当天
+    python trends_archiver.py --date 20240318
+    读取：TrendArchive.load('20240318').get('000001')
+"""
+
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+import numpy as np
+from redis import Redis
+
+from com.caicongyang.financial.engineering.stock_select_strategy import trend_codec
+from com.caicongyang.financial.engineering.stock_select_strategy.stock_trends_sse_client import redis_config
+from com.caicongyang.financial.engineering.utils.env_loader import load_env, get_project_root
+
+load_env()
+
+logger = logging.getLogger(__name__)
+
+JSON_KEY = "stock:trends:{code}:today:{date}"
+PACKED_KEY = "stock:trends:{code}:packed:{date}"
+
+
+def default_archive_dir():
+    return os.getenv('TRENDS_ARCHIVE_DIR', os.path.join(get_project_root(), 'data', 'trends_archive'))
+
+
+def archive_path(date, archive_dir=None):
+    return os.path.join(archive_dir or default_archive_dir(), f"trends_{date}.npz")
+
+
+def connect_redis():
+    """二进制客户端：JSON 成员直接交给 json.loads，packed 数据按 bytes 解码"""
+    return Redis(**redis_config(), decode_responses=False)
+
+
+def scan_stock_keys(redis, date):
+    """
+    :return: {stock_code: (key, 'json' | 'packed')}，同一只股票两种存储都有时以 packed 为准
+    """
+    keys = {}
+    for storage, template in (('json', JSON_KEY), ('packed', PACKED_KEY)):
+        prefix, suffix = template.split('{code}')
+        suffix = suffix.format(date=date)
+        for key in redis.scan_iter(match=f"{prefix}*{suffix}", count=1000):
+            key = key.decode() if isinstance(key, bytes) else key
+            code = key[len(prefix):-len(suffix)]
+            keys[code] = (key, storage)
+    return keys
+
+
+def read_trends(redis, keys, chunk_size=500):
+    """
+    每 chunk_size 个 key 一次 pipeline 读取并解码
+
+    :param keys: scan_stock_keys 的结果
+    :return: {stock_code: TREND_DTYPE 数组}
+    """
+    codes = sorted(keys)
+    trends = {}
+    for begin in range(0, len(codes), chunk_size):
+        chunk = codes[begin:begin + chunk_size]
+        pipe = redis.pipeline(transaction=False)
+        for code in chunk:
+            key, storage = keys[code]
+            if storage == 'packed':
+                pipe.get(key)
+            else:
+                pipe.zrange(key, 0, -1)
+        for code, value in zip(chunk, pipe.execute()):
+            if keys[code][1] == 'packed':
+                records = trend_codec.decode_trends(value)
+            else:
+                records = trend_codec.from_json_members(value)
+            if len(records):
+                trends[code] = records
+    return trends
+
+
+def write_archive(path, date, trends):
+    """
+    按股票分段写入一个压缩文件
+
+    :param trends: {stock_code: TREND_DTYPE 数组}
+    :return: 记录总数
+    """
+    codes = sorted(trends)
+    offsets = np.zeros(len(codes) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(trends[code]) for code in codes])
+    records = np.concatenate([trends[code] for code in codes]) if codes else np.empty(0, trend_codec.TREND_DTYPE)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, date=np.array(date), codes=np.array(codes, dtype=str), offsets=offsets,
+                        records=records)
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+def archive_day(date=None, archive_dir=None, redis=None, chunk_size=500):
+    """
+    归档一天的分时数据
+
+    :param date: 日期，格式 YYYYMMDD，默认为当天
+    :return: 归档文件路径
+    """
+    date = date or datetime.now().strftime('%Y%m%d')
+    path = archive_path(date, archive_dir)
+    own_redis = redis is None
+    redis = redis or connect_redis()
+    try:
+        start = time.time()
+        keys = scan_stock_keys(redis, date)
+        if not keys:
+            logger.warning(f"No intraday trends found in Redis for {date}")
+            return None
+        trends = read_trends(redis, keys, chunk_size)
+        count = write_archive(path, date, trends)
+        logger.info(f"Archived {count} records of {len(trends)} stocks for {date} to {path} "
+                    f"in {time.time() - start:.1f}s ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+        return path
+    finally:
+        if own_redis:
+            redis.close()
+
+
+class TrendArchive:
+    """
+    读取 trends_{date}.npz，用于回测
+
+    :param path: 归档文件路径
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.date = str(data['date'])
+            self.codes = data['codes']
+            self.offsets = data['offsets']
+            self.records = data['records']
+        self.index = {code: k for k, code in enumerate(self.codes.tolist())}
+
+    @classmethod
+    def load(cls, date, archive_dir=None):
+        return cls(archive_path(date, archive_dir))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __contains__(self, stock_code):
+        return stock_code in self.index
+
+    def get(self, stock_code, float_prices=False):
+        """
+        一只股票当天的分时数据，按时间排序；不存在时返回空数组
+
+        :param float_prices: 为 True 时价格还原为元（trend_codec.to_float_prices）
+        """
+        k = self.index.get(stock_code)
+        if k is None:
+            records = np.empty(0, trend_codec.TREND_DTYPE)
+        else:
+            records = self.records[self.offsets[k]:self.offsets[k + 1]]
+        return trend_codec.to_float_prices(records) if float_prices else records
+
+    def items(self):
+        """依次返回 (stock_code, TREND_DTYPE 数组)"""
+        for k, code in enumerate(self.codes.tolist()):
+            yield code, self.records[self.offsets[k]:self.offsets[k + 1]]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='归档 Redis 中当天的分时数据')
+    parser.add_argument('--date', default=None, help='日期，格式 YYYYMMDD，默认为当天')
+    parser.add_argument('--archive-dir', default=None)
+    parser.add_argument('--chunk-size', type=int, default=500, help='每个 pipeline 读取的股票数')
+    args = parser.parse_args()
+    archive_day(args.date, args.archive_dir, chunk_size=args.chunk_size)
@@ -0,0 +1,289 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+基于5分钟K线（t_stock_min_trade）的成交模拟
+
+equity_curve 默认所有交易都以日线开盘价 + 固定滑点成交。这里用当天的5分钟K线模拟订单的实际成交：
+- vwap：按各根K线的成交量比例分配订单，以K线均价（成交额/成交量）成交
+- twap：在各根K线上平均分配订单，以K线均价成交
+- first_n：在开盘后前 n_bars 根K线上平均分配订单，以K线开盘价成交，n_bars=1 时即开盘价成交
+- 每根K线的成交量不超过该K线成交量 × participation（参与率上限），未成交部分不再顺延
+- 涨跌停不能成交：买单跳过一字涨停的K线，卖单跳过一字跌停的K线（first_n 模式看开盘价是否在涨跌停价）
+- 买入按整百股向下取整，手续费、印花税口径与 equity_curve 一致
+
+一批订单（多只股票 × 多个交易日）只需两次数据库查询，订单与K线的对应关系通过下标展开一次性计算，
+不需要逐笔、逐根K线循环。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text, bindparam
+
+from program.python.com.caicongyang.financial.engineering.utils.env_loader import load_env
+
+load_env()
+
+pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
+
+MIN_TABLE = 't_stock_min_trade'
+DAILY_TABLE = 't_stock'
+FILL_MODELS = ('vwap', 'twap', 'first_n')
+
+# AkShare 分钟数据的成交量单位为手
+VOLUME_UNIT = 100
+LOT_SIZE = 100
+
+
+def limit_ratio(stock_codes):
+    """
+    按股票代码判断涨跌幅限制：创业板、科创板20%，北交所30%，其余10%
+    ST股票无法从代码判断，可在订单中用 limit_ratio 列覆盖
+    """
+    codes = pd.Series(stock_codes, dtype=str).str.zfill(6)
+    ratio = np.full(len(codes), 0.1)
+    ratio[codes.str.startswith(('300', '301', '688', '689')).to_numpy()] = 0.2
+    ratio[codes.str.startswith(('8', '4', '92')).to_numpy()] = 0.3
+    return ratio
+
+
+def _round_price(values):
+    """价格四舍五入到分"""
+    return np.floor(values * 100 + 0.5) / 100
+
+
+def simulate_fills(orders, bars, model='vwap', participation=0.1, start_bar=0, n_bars=None,
+                   slippage=0.0, c_rate=5.0 / 10000, t_rate=1.0 / 1000,
+                   volume_unit=VOLUME_UNIT, lot_size=LOT_SIZE):
+    """
+    用分钟K线批量模拟订单成交
+
+    :param orders: DataFrame，列为 stock_code, trade_date, side（1买入，-1卖出）, quantity（股数），
+                   可选 pre_close（前收盘价，用于计算涨跌停价）和 limit_ratio
+    :param bars: DataFrame，t_stock_min_trade 的数据，至少包含 stock_code, trade_date, trade_time,
+                 open, close, volume, amount
+    :param model: 'vwap', 'twap' 或 'first_n'
+    :param participation: 每根K线的参与率上限，None 表示不限制
+    :param start_bar: 从当天第几根K线开始执行（0为第一根）
+    :param n_bars: 执行的K线根数，None 表示到收盘；first_n 模式默认为1
+    :param slippage: 在模拟成交价之外再加的固定滑点（元/股），买入加、卖出减
+    :return: orders 的副本，增加 filled_qty, fill_price, fill_cash, commission, tax, fill_ratio,
+             benchmark_vwap, shortfall_bps, status 列
+    """
+    if model not in FILL_MODELS:
+        raise ValueError(f"Unknown fill model: {model}, expected one of {FILL_MODELS}")
+    if model == 'first_n' and n_bars is None:
+        n_bars = 1
+
+    result = orders.reset_index(drop=True).copy()
+    n_orders = len(result)
+    order_codes = result['stock_code'].astype(str).str.zfill(6).to_numpy()
+    order_dates = pd.to_datetime(result['trade_date']).dt.normalize().to_numpy()
+    side = result['side'].to_numpy(dtype=np.int64)
+    quantity = result['quantity'].to_numpy(dtype=np.float64)
+
+    # ===K线按 (股票, 交易日, 时间) 排序，每个 (股票, 交易日) 是连续的一段
+    bars = bars.assign(stock_code=bars['stock_code'].astype(str).str.zfill(6),
+                       trade_date=pd.to_datetime(bars['trade_date']).dt.normalize())
+    bars = bars.sort_values(['stock_code', 'trade_date', 'trade_time'], kind='mergesort')
+    group_id, groups = pd.MultiIndex.from_arrays([bars['stock_code'], bars['trade_date']]).factorize()
+    counts = np.bincount(group_id, minlength=len(groups))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    bar_open = bars['open'].to_numpy(dtype=np.float64)
+    bar_close = bars['close'].to_numpy(dtype=np.float64)
+    bar_low = bars['low'].to_numpy(dtype=np.float64) if 'low' in bars else np.minimum(bar_open, bar_close)
+    bar_high = bars['high'].to_numpy(dtype=np.float64) if 'high' in bars else np.maximum(bar_open, bar_close)
+    bar_shares = bars['volume'].to_numpy(dtype=np.float64) * volume_unit
+    bar_amount = bars['amount'].to_numpy(dtype=np.float64)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bar_avg = np.where(bar_shares > 0, bar_amount / bar_shares, bar_close)
+        # 当天全部K线的成交均价，作为执行质量的基准
+        benchmark = (np.bincount(group_id, weights=bar_amount, minlength=len(groups))
+                     / np.bincount(group_id, weights=bar_shares, minlength=len(groups)))
+
+    # ===每个订单对应的K线区间 [lo, hi)
+    order_group = groups.get_indexer(pd.MultiIndex.from_arrays([order_codes, order_dates]))
+    found = order_group >= 0
+    group_count = np.where(found, counts[order_group], 0)
+    lo = np.minimum(start_bar, group_count)
+    hi = group_count if n_bars is None else np.minimum(start_bar + n_bars, group_count)
+    length = hi - lo
+
+    # 展开成 (订单, K线) 的长数组
+    order_idx = np.repeat(np.arange(n_orders), length)
+    offset = np.arange(order_idx.size) - np.repeat(np.cumsum(length) - length, length)
+    bar_idx = starts[order_group[order_idx]] + lo[order_idx] + offset
+
+    # ===涨跌停价
+    if 'pre_close' in result:
+        pre_close = result['pre_close'].to_numpy(dtype=np.float64)
+    else:
+        pre_close = np.full(n_orders, np.nan)
+    ratio = result['limit_ratio'].to_numpy(dtype=np.float64) if 'limit_ratio' in result else limit_ratio(order_codes)
+    limit_up = _round_price(pre_close * (1 + ratio))
+    limit_down = _round_price(pre_close * (1 - ratio))
+
+    row_side = side[order_idx]
+    if model == 'first_n':
+        row_price = bar_open[bar_idx]
+        locked_up = bar_open[bar_idx] >= limit_up[order_idx] - 1e-6
+        locked_down = bar_open[bar_idx] <= limit_down[order_idx] + 1e-6
+    else:
+        row_price = bar_avg[bar_idx]
+        locked_up = bar_low[bar_idx] >= limit_up[order_idx] - 1e-6
+        locked_down = bar_high[bar_idx] <= limit_down[order_idx] + 1e-6
+    row_shares = bar_shares[bar_idx]
+    eligible = (row_shares > 0) & ~((row_side > 0) & locked_up) & ~((row_side < 0) & locked_down)
+
+    # ===按模型分配订单数量，并受参与率约束
+    weight = np.where(eligible, row_shares if model == 'vwap' else 1.0, 0.0)
+    weight_sum = np.bincount(order_idx, weights=weight, minlength=n_orders)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        alloc = np.where(weight > 0, quantity[order_idx] * weight / weight_sum[order_idx], 0.0)
+    if participation is not None:
+        alloc = np.minimum(alloc, participation * row_shares)
+
+    filled = np.bincount(order_idx, weights=alloc, minlength=n_orders)
+    notional = np.bincount(order_idx, weights=alloc * row_price, minlength=n_orders)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_price = notional / filled
+
+    # 买入按整百股成交；卖出可以有零股
+    filled = np.where(side > 0, np.floor(filled / lot_size + 1e-9) * lot_size, np.floor(filled + 1e-9))
+    fill_price = np.where(filled > 0, avg_price + side * slippage, np.nan)
+    fill_cash = np.where(filled > 0, filled * fill_price, 0.0)
+
+    commission = np.where(filled > 0, np.round(np.maximum(fill_cash * c_rate, 5), 2), 0.0)
+    tax = np.where(side < 0, np.round(fill_cash * t_rate, 2), 0.0)
+
+    result['filled_qty'] = filled
+    result['fill_price'] = fill_price
+    result['fill_cash'] = fill_cash
+    result['commission'] = commission
+    result['tax'] = tax
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result['fill_ratio'] = filled / quantity
+        result['benchmark_vwap'] = np.where(found, benchmark[np.maximum(order_group, 0)], np.nan)
+        result['shortfall_bps'] = side * (fill_price / result['benchmark_vwap'].to_numpy() - 1) * 10000
+    result['status'] = np.select([~found, filled <= 0, filled < quantity], ['no_data', 'no_fill', 'partial'],
+                                 default='filled')
+    return result
+
+
+class ExecutionSimulator:
+    """
+    从数据库读取分钟K线和前收盘价，批量模拟订单成交
+    """
+
+    def __init__(self, engine=None, model='vwap', participation=0.1, start_bar=0, n_bars=None,
+                 slippage=0.0, c_rate=5.0 / 10000, t_rate=1.0 / 1000):
+        if engine is None:
+            mysql_user = os.getenv('DB_USER')
+            mysql_password = os.getenv('DB_PASSWORD')
+            mysql_host = os.getenv('DB_HOST')
+            mysql_port = os.getenv('DB_PORT')
+            mysql_db = os.getenv('DB_NAME')
+            engine = create_engine(f'mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_db}')
+        self.engine = engine
+        self.fill_kwargs = {
+            'model': model, 'participation': participation, 'start_bar': start_bar, 'n_bars': n_bars,
+            'slippage': slippage, 'c_rate': c_rate, 't_rate': t_rate,
+        }
+
+    def load_bars(self, stock_codes, trade_dates):
+        """一次查询读取多只股票、多个交易日的5分钟K线"""
+        query = text(f"""
+            SELECT stock_code, trade_date, trade_time, open, close, high, low, volume, amount
+            FROM {MIN_TABLE}
+            WHERE stock_code IN :codes AND trade_date IN :dates
+        """).bindparams(bindparam('codes', expanding=True), bindparam('dates', expanding=True))
+        with self.engine.connect() as conn:
+            return pd.read_sql(query, conn, params={'codes': list(stock_codes), 'dates': list(trade_dates)})
+
+    def load_pre_close(self, stock_codes, trade_dates, lookback_days=20):
+        """
+        一次查询读取每个 (股票, 交易日) 的前收盘价
+
+        :return: DataFrame，列为 stock_code, trade_date, pre_close
+        """
+        dates = pd.to_datetime(pd.Series(list(trade_dates)))
+        query = text(f"""
+            SELECT stock_code, trade_date, close
+            FROM {DAILY_TABLE}
+            WHERE stock_code IN :codes AND trade_date BETWEEN :start AND :end
+            ORDER BY stock_code, trade_date
+        """).bindparams(bindparam('codes', expanding=True))
+        params = {
+            'codes': list(stock_codes),
+            'start': (dates.min() - pd.Timedelta(days=lookback_days)).date(),
+            'end': dates.max().date(),
+        }
+        with self.engine.connect() as conn:
+            daily = pd.read_sql(query, conn, params=params)
+        daily['trade_date'] = pd.to_datetime(daily['trade_date'])
+        daily['pre_close'] = daily.groupby('stock_code')['close'].shift(1)
+        return daily[['stock_code', 'trade_date', 'pre_close']]
+
+    def simulate(self, orders, **kwargs):
+        """
+        模拟一批订单，参数同 simulate_fills，未指定的使用构造时的设置
+        """
+        orders = orders.reset_index(drop=True).copy()
+        orders['stock_code'] = orders['stock_code'].astype(str).str.zfill(6)
+        orders['trade_date'] = pd.to_datetime(orders['trade_date']).dt.normalize()
+        codes = orders['stock_code'].unique().tolist()
+        dates = [d.date() for d in orders['trade_date'].unique()]
+
+        if 'pre_close' not in orders:
+            pre_close = self.load_pre_close(codes, dates)
+            pre_close['stock_code'] = pre_close['stock_code'].astype(str).str.zfill(6)
+            orders = orders.merge(pre_close, on=['stock_code', 'trade_date'], how='left')
+
+        bars = self.load_bars(codes, dates)
+        return simulate_fills(orders, bars, **{**self.fill_kwargs, **kwargs})
+
+    def trade_prices(self, df, stock_code, quantity=10000, **kwargs):
+        """
+        为单只股票的回测生成执行价
+
+        在仓位变化的日期按分钟K线模拟成交，用模拟成交价替换开盘价，
+        其余日期或没有分钟数据、无法成交的日期保留 开盘价 ± slippage。
+        返回值可以直接作为 equity_curve_arrays 的 open_price 传入（此时 slippage 传0）。
+
+        :param df: 包含 交易日期, 开盘价, pos 的 DataFrame
+        :param quantity: 模拟订单的股数，用于参与率约束
+        """
+        slippage = kwargs.get('slippage', self.fill_kwargs['slippage'])
+        pos = df['pos'].to_numpy(dtype=np.float64)
+        change = np.diff(pos, prepend=0)
+        rows = np.flatnonzero(change != 0)
+
+        prices = df['开盘价'].to_numpy(dtype=np.float64) + np.sign(change) * slippage
+        if len(rows) == 0:
+            return prices
+
+        orders = pd.DataFrame({
+            'stock_code': stock_code,
+            'trade_date': df['交易日期'].to_numpy()[rows],
+            'side': np.sign(change[rows]).astype(np.int64),
+            'quantity': quantity,
+        })
+        fills = self.simulate(orders, **kwargs)
+        filled = fills['filled_qty'].to_numpy() > 0
+        prices[rows[filled]] = fills['fill_price'].to_numpy()[filled]
+        return prices
+
+
+if __name__ == "__main__":
+    simulator = ExecutionSimulator(model='vwap', participation=0.1)
+    sample_orders = pd.DataFrame({
+        'stock_code': ['000001', '600000'],
+        'trade_date': ['2024-12-25', '2024-12-25'],
+        'side': [1, -1],
+        'quantity': [10000, 5000],
+    })
+    print(simulator.simulate(sample_orders))
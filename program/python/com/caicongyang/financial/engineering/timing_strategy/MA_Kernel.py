@@ -0,0 +1,91 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+多组均线参数的批量计算内核
+
+对一只股票同时评估 k 组 (ma_short, ma_long) 时，signal_ma 需要做 k 次完整的 rolling 计算，
+再做 k 次 position。这里改为：
+1. 对后复权收盘价做一次前缀和，任意窗口的均线都可以 O(1)/点 得到
+2. 所有用到的窗口一次性算成 (窗口 × 交易日) 的均线矩阵
+3. 通过下标广播得到 (参数组 × 交易日) 的交叉信号矩阵
+4. 可选地在信号矩阵上一次性计算仓位（含涨跌停不能买卖的规则）
+
+均线口径与 signal_ma 一致，即 rolling(n, min_periods=1).mean()，
+所以扫描 400 组参数的开销只相当于几次单独运行。
+前缀和与 rolling 的舍入误差不同：两条均线的相对差在 TIE_TOLERANCE 以内时按相等处理（价格持平时常见），
+这些交易日 signal_ma 的结果取决于 rolling 自身的舍入误差，两者可能不同；其余交易日的信号一致。
+输入为单只股票连续交易日的一维数组，不含 NaN。
+"""
+
+import numpy as np
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Timing_Functions
+
+# 均线相对差的容差，远大于前缀和的舍入误差（约 1e-15 × 交易日数），远小于价格的最小变动
+TIE_TOLERANCE = 1e-9
+
+
+def ma_matrix(close_adj, windows):
+    """
+    基于前缀和计算多个窗口的均线
+
+    :param close_adj: 后复权收盘价，一维数组
+    :param windows: 窗口长度列表
+    :return: (len(windows) × 交易日) 均线矩阵，前 n-1 天为已有数据的均值
+    """
+    close_adj = np.asarray(close_adj, dtype=np.float64)
+    n_days = close_adj.shape[0]
+    csum = np.concatenate(([0.0], np.cumsum(close_adj)))
+
+    windows = np.asarray(windows, dtype=np.int64)[:, None]
+    end = np.arange(1, n_days + 1)[None, :]
+    start = np.maximum(end - windows, 0)
+    return (csum[end] - csum[start]) / (end - start)
+
+
+def crossover_signals(close_adj, pairs, tie_tolerance=TIE_TOLERANCE):
+    """
+    多组参数的均线交叉信号
+
+    :param close_adj: 后复权收盘价，一维数组
+    :param pairs: [(ma_short, ma_long), ...]
+    :param tie_tolerance: 两条均线的相对差不超过该值时视为相等
+    :return: (参数组 × 交易日) 信号矩阵，买入为1，卖出为0，其余为 NaN
+    """
+    pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+    windows, inverse = np.unique(pairs, return_inverse=True)
+    inverse = inverse.reshape(pairs.shape)
+    ma = ma_matrix(close_adj, windows)
+
+    ma_l = ma[inverse[:, 1]]
+    diff = ma[inverse[:, 0]] - ma_l
+    # 前缀和与 rolling 的舍入误差不同，差值在误差范围内的视为两条均线相等
+    diff[np.abs(diff) <= tie_tolerance * np.abs(ma_l)] = 0
+
+    signal = np.full(diff.shape, np.nan)
+    # 当天短期均线大于等于长期均线，上个交易日短期均线小于长期均线
+    buy = (diff[:, 1:] >= 0) & (diff[:, :-1] < 0)
+    # 当天短期均线小于等于长期均线，上个交易日短期均线大于长期均线
+    sell = (diff[:, 1:] <= 0) & (diff[:, :-1] > 0)
+    signal[:, 1:][buy] = 1
+    signal[:, 1:][sell] = 0
+    return signal
+
+
+def crossover_positions(close_adj, open_price, close, pairs):
+    """
+    多组参数的每日仓位，规则与 Timing_Functions.position 一致
+
+    :param close_adj: 后复权收盘价
+    :param open_price: 开盘价（不复权），用于判断开盘涨跌停
+    :param close: 收盘价（不复权）
+    :param pairs: [(ma_short, ma_long), ...]
+    :return: (参数组 × 交易日) 仓位矩阵
+    """
+    signal = crossover_signals(close_adj, pairs)
+    k = signal.shape[0]
+    open_price = np.broadcast_to(np.asarray(open_price, dtype=np.float64)[:, None], (len(open_price), k))
+    close = np.broadcast_to(np.asarray(close, dtype=np.float64)[:, None], (len(close), k))
+    return Timing_Functions.position_panel(signal.T, open_price, close).T
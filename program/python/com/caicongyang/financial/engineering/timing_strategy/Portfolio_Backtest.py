@@ -0,0 +1,298 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+多股票组合回测
+
+与 main.py 的单股票回测使用相同的策略口径：
+- 信号：Signals.signal_ma（后复权收盘价均线交叉）
+- 仓位：Timing_Functions.position（开盘涨停不能买入，开盘跌停不能卖出）
+- 上市未满一年（250个交易日）的股票不参与交易
+- 整百买入、手续费不足5元按5元收、卖出收印花税、除权时调整持股数量
+
+不同之处在于所有股票对齐到同一个 (交易日 × 股票) 面板上，信号和仓位按每只股票自己的交易日算出
+（均线窗口不包含未上市、停牌的日期，与单股票回测一致），停牌日保持停牌前的仓位；
+资金在股票之间分配：总资金分成 max_positions 份，仓位由0变1时用一份资金买入，
+资金或仓位不足时按股票顺序先到先得，没有买入的等待下一次信号。
+面板使用 float32 存储，3000只股票 × 10年 每个字段约 30MB。
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from program.python.com.caicongyang.financial.engineering import config
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Signals
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Timing_Functions
+from program.python.com.caicongyang.financial.engineering.utils import FinFunctions
+
+pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
+
+PANEL_FIELDS = ('开盘价', '收盘价', '涨跌幅')
+
+
+def load_panel(stock_codes, loader=FinFunctions.import_stock_data_cached, dtype=np.float32):
+    """
+    把多只股票的日线数据对齐成 (交易日 × 股票) 面板
+
+    :param stock_codes: 股票代码列表，如 ['sz300001', 'sh600000']
+    :param loader: 单只股票的加载函数，返回包含 交易日期 和 PANEL_FIELDS 的 DataFrame
+    :param dtype: 面板数据类型，默认 float32 以节省内存
+    :return: dict，包含 dates, codes 以及每个字段的二维数组，未上市、停牌的位置为 NaN
+    """
+    frames = {}
+    for code in stock_codes:
+        df = loader(code)
+        if df is not None and not df.empty:
+            frames[code] = df
+
+    codes = list(frames.keys())
+    dates = np.unique(np.concatenate([df['交易日期'].to_numpy() for df in frames.values()])) if codes else np.array([])
+
+    panel = {'dates': pd.DatetimeIndex(dates), 'codes': codes}
+    for field in PANEL_FIELDS:
+        panel[field] = np.full((len(dates), len(codes)), np.nan, dtype=dtype)
+
+    # 逐只股票按日期位置写入预分配的数组，避免构造大的长表再透视
+    for j, code in enumerate(codes):
+        df = frames[code]
+        rows = np.searchsorted(dates, df['交易日期'].to_numpy())
+        for field in PANEL_FIELDS:
+            panel[field][rows, j] = df[field].to_numpy()
+
+    panel['收盘价_后复权'] = cal_answer_authority_panel(panel['收盘价'], panel['涨跌幅']).astype(dtype)
+    return panel
+
+
+def cal_answer_authority_panel(close, pct_chg):
+    """
+    FinFunctions.cal_answer_authority 的面板版本，计算后复权收盘价
+
+    与单股票版本一致：复权因子为 (1 + 涨跌幅) 的累乘，并以最后一个收盘价为基准缩放
+    """
+    valid = ~np.isnan(close)
+    factor = np.cumprod(np.where(valid, 1.0 + pct_chg.astype(np.float64), 1.0), axis=0)
+
+    # 每只股票最后一个有效交易日
+    n_days = close.shape[0]
+    last_idx = n_days - 1 - np.argmax(valid[::-1], axis=0)
+    cols = np.arange(close.shape[1])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scale = close[last_idx, cols].astype(np.float64) / factor[last_idx, cols]
+    adj = factor * scale
+    adj[~valid] = np.nan
+    return adj
+
+
+def listed_index(listed):
+    """
+    每只股票有数据的交易日在压缩面板中的位置，压缩面板各列的第 k 行是该股票的第 k+1 个交易日
+
+    :param listed: (交易日 × 股票) 是否有数据
+    :return: (source, target, n_rows)，原面板和压缩面板展平后的下标（一一对应），以及压缩面板的行数
+    """
+    n_stocks = listed.shape[1]
+    source = np.flatnonzero(listed)
+    target = (np.cumsum(listed, axis=0, dtype=np.int64) - 1).ravel()[source] * n_stocks + source % n_stocks
+    return source, target, int(listed.sum(axis=0).max(initial=0))
+
+
+def compress_listed(values, index):
+    """把每只股票有数据的交易日连续排到面板前面，后面补 NaN"""
+    source, target, n_rows = index
+    compressed = np.full((n_rows, values.shape[1]), np.nan)
+    compressed.ravel()[target] = values.ravel()[source]
+    return compressed
+
+
+def portfolio_position(panel, ma_short=6, ma_long=50, min_listed_days=250, block_size=32):
+    """
+    计算所有股票每天的目标仓位
+
+    每只股票只用自己有数据的交易日计算信号和仓位：各列有数据的交易日压缩到面板前面后一次向量化计算，
+    面板上未上市、停牌的日期不计入均线窗口，停牌日的仓位与停牌前一致
+
+    :param block_size: 每次计算的股票数，中间数组不超过 CPU 缓存时比整个面板一次计算更快
+    :return: (交易日 × 股票) 仓位数组，取值0/1
+    """
+    pos = np.empty(panel['收盘价'].shape)
+    for begin in range(0, pos.shape[1], block_size):
+        columns = slice(begin, begin + block_size)
+        pos[:, columns] = _listed_position(panel['收盘价'][:, columns], panel['开盘价'][:, columns],
+                                           panel['收盘价_后复权'][:, columns], ma_short, ma_long, min_listed_days)
+    return pos
+
+
+def _listed_position(close, open_price, close_adj, ma_short, ma_long, min_listed_days):
+    close = np.ascontiguousarray(close)
+    index = listed_index(~np.isnan(close))
+
+    signal = Signals.signal_ma_panel(compress_listed(np.ascontiguousarray(close_adj), index),
+                                     ma_short=ma_short, ma_long=ma_long)
+    pos = Timing_Functions.position_panel(signal, compress_listed(np.ascontiguousarray(open_price), index),
+                                          compress_listed(close, index))
+    # 上市未满一年的股票不运行策略，满一年的当天仓位也设置为0
+    pos[:min_listed_days] = 0
+
+    # 移回原来的交易日，停牌日的仓位与停牌前一致
+    result = np.full(close.shape, np.nan)
+    result.ravel()[index[0]] = pos.ravel()[index[1]]
+    result = Timing_Functions.ffill_panel(result)
+    result[np.isnan(result)] = 0
+    return result
+
+
+def backtest_portfolio(panel, pos, initial_money=1000000, max_positions=20, slippage=0.01,
+                       c_rate=5.0 / 10000, t_rate=1.0 / 1000):
+    """
+    根据仓位面板模拟组合资金曲线
+
+    每天开盘先卖后买：
+    - 仓位由1变0且开盘可交易的股票全部卖出
+    - 仓位由0变1且开盘可交易的股票，用 前一日总资产 / max_positions 的资金整百买入，
+      受空余仓位数和现金约束，按股票顺序先到先得；当天没有买入的不再追买，等待下一次仓位由0变1
+
+    :param panel: load_panel 的返回值
+    :param pos: 仓位面板，取值0/1
+    :return: (equity_df, attribution_df)
+             equity_df: 每天的现金、持仓市值、总资产、持仓数量、手续费、资金曲线
+             attribution_df: 每只股票的盈亏、收益贡献、交易次数、手续费、持仓天数
+    """
+    open_price = panel['开盘价']
+    close = panel['收盘价']
+    pct_chg = panel['涨跌幅']
+    n_days, n_stocks = close.shape
+
+    # 停牌日按最近一个收盘价估值
+    close_valued = Timing_Functions.ffill_panel(close.astype(np.float64))
+    close_valued[np.isnan(close_valued)] = 0
+
+    # 只在仓位由0变1的当天买入
+    entry = pos == 1
+    entry[1:] &= pos[:-1] == 0
+
+    shares = np.zeros(n_stocks)
+    cash = float(initial_money)
+    equity_prev = float(initial_money)
+    value_prev = np.zeros(n_stocks)
+
+    # 归因统计
+    cash_flow = np.zeros(n_stocks)
+    trades = np.zeros(n_stocks, dtype=np.int64)
+    fees = np.zeros(n_stocks)
+    holding_days = np.zeros(n_stocks, dtype=np.int64)
+
+    out_cash = np.empty(n_days)
+    out_value = np.empty(n_days)
+    out_positions = np.empty(n_days, dtype=np.int64)
+    out_fees = np.zeros(n_days)
+
+    for i in range(n_days):
+        open_i = open_price[i].astype(np.float64)
+        close_i = close[i].astype(np.float64)
+        held = shares > 0
+
+        # 若发生除权，按前一日市值调整持股数量
+        if i > 0:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                last_price = close_i / (pct_chg[i].astype(np.float64) + 1)
+                # 与最近一个有效收盘价比较，复牌当天除权也能识别
+                ex_rights = held & (np.abs((close_i / close_valued[i - 1] - 1) - pct_chg[i]) > 0.001)
+            shares[ex_rights] = np.floor(value_prev[ex_rights] / last_price[ex_rights])
+
+        tradable = ~np.isnan(open_i)
+        target = pos[i]
+        day_fee = 0.0
+
+        # ===卖出
+        sell = held & (target == 0) & tradable
+        if sell.any():
+            sell_cash = shares[sell] * (open_i[sell] - slippage)
+            commission = np.round(np.maximum(sell_cash * c_rate, 5), 2)
+            tax = np.round(sell_cash * t_rate, 2)
+            cash += float((sell_cash - commission - tax).sum())
+            cash_flow[sell] += sell_cash - commission - tax
+            fees[sell] += commission + tax
+            trades[sell] += 1
+            day_fee += float((commission + tax).sum())
+            shares[sell] = 0
+
+        # ===买入
+        slots = max_positions - int((shares > 0).sum())
+        buy = (shares == 0) & entry[i] & tradable
+        if slots > 0 and buy.any():
+            candidates = np.flatnonzero(buy)[:slots]
+            price = open_i[candidates] + slippage
+            budget = equity_prev / max_positions
+            buy_num = np.floor(budget / price / 100) * 100
+            buy_cash = buy_num * price
+            commission = np.round(buy_cash * c_rate, 2)
+            commission[(commission < 5) & (commission != 0)] = 5
+            cost = buy_cash + commission
+            # 现金不足时，按顺序先到先得
+            accepted = (np.cumsum(cost) <= cash) & (buy_num > 0)
+            candidates = candidates[accepted]
+            cash -= float(cost[accepted].sum())
+            shares[candidates] = buy_num[accepted]
+            cash_flow[candidates] -= cost[accepted]
+            fees[candidates] += commission[accepted]
+            trades[candidates] += 1
+            day_fee += float(commission[accepted].sum())
+
+        # ===计算当天的各种数据
+        value = shares * close_valued[i]
+        holding_days += shares > 0
+        equity_prev = cash + float(value.sum())
+        value_prev = value
+
+        out_cash[i] = cash
+        out_value[i] = value.sum()
+        out_positions[i] = int((shares > 0).sum())
+        out_fees[i] = day_fee
+
+    equity_df = pd.DataFrame({
+        'cash': out_cash,
+        'stock_value': out_value,
+        'equity': out_cash + out_value,
+        'positions': out_positions,
+        'fees': out_fees,
+    }, index=pd.Index(panel['dates'], name='交易日期'))
+    equity_df['equity_curve'] = equity_df['equity'] / initial_money
+
+    pnl = cash_flow + value_prev
+    attribution_df = pd.DataFrame({
+        'pnl': pnl,
+        'contribution': pnl / initial_money,
+        'trades': trades,
+        'fees': fees,
+        'holding_days': holding_days,
+    }, index=pd.Index(panel['codes'], name='股票代码')).sort_values('pnl', ascending=False)
+
+    return equity_df, attribution_df
+
+
+def run_portfolio_backtest(stock_codes, ma_short=6, ma_long=50, initial_money=1000000, max_positions=20,
+                           slippage=0.01, c_rate=5.0 / 10000, t_rate=1.0 / 1000,
+                           loader=FinFunctions.import_stock_data_cached):
+    """
+    加载数据、计算信号和仓位并模拟组合资金曲线
+    """
+    panel = load_panel(stock_codes, loader=loader)
+    pos = portfolio_position(panel, ma_short=ma_short, ma_long=ma_long)
+    return backtest_portfolio(panel, pos, initial_money=initial_money, max_positions=max_positions,
+                              slippage=slippage, c_rate=c_rate, t_rate=t_rate)
+
+
+def list_stock_codes():
+    """列出 config.input_data_path/stock_data 下所有的股票代码"""
+    stock_dir = os.path.join(config.input_data_path, 'stock_data')
+    suffix = '_utf-8.csv'
+    return sorted(f[:-len(suffix)] for f in os.listdir(stock_dir) if f.endswith(suffix))
+
+
+if __name__ == "__main__":
+    equity, attribution = run_portfolio_backtest(list_stock_codes())
+    print(equity.tail(20))
+    print(attribution.head(20))
@@ -0,0 +1,323 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+仓位策略：把择时信号的 0/1 仓位转换为每只股票的目标仓位比例
+
+Timing_Functions.position 只给出满仓或空仓，这里在 (交易日 × 股票) 面板上向量化计算仓位大小：
+- vol_target：波动率目标，仓位 = 目标年化波动率 / 近期年化波动率
+- atr_risk：ATR 风险，止损距离为 atr_multiple 倍 ATR，单笔亏损不超过总资金的 risk_per_trade
+- Kelly 上限：按持仓期间收益估计 Kelly 比例 mu / sigma^2，仓位不超过 kelly_multiplier 倍（如半 Kelly）
+- 最大同时持仓数：已持有的股票保留名额，新开仓按 score 从高到低填满剩余名额
+
+所有估计量只使用前一交易日及以前的数据（当天开盘按仓位成交，与 position 的口径一致）。
+默认仓位大小在开仓当天确定、持有期间不变，避免每天因波动率变化而频繁调仓；rebalance=True 时每天按最新估计调整。
+输出的仓位比例可以直接作为 Timing_Functions.equity_curve_arrays 的 pos 参数。
+"""
+
+import numpy as np
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Signals
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Timing_Functions
+
+TRADING_DAYS = 252
+SIZING_METHODS = ('equal', 'vol_target', 'atr_risk')
+
+
+def _lag(values):
+    """整体下移一个交易日，第一天为 NaN"""
+    result = np.full(values.shape, np.nan)
+    result[1:] = values[:-1]
+    return result
+
+
+def rolling_count_panel(values, window):
+    """滚动窗口内非 NaN 的数量"""
+    valid = np.cumsum(~np.isnan(values), axis=0, dtype=np.int64)
+    if window < values.shape[0]:
+        valid[window:] = valid[window:] - valid[:-window].copy()
+    return valid
+
+
+def _min_periods(window, min_periods):
+    return max(window // 2, 2) if min_periods is None else min_periods
+
+
+def _true_range_pct(close, pct_chg, high=None, low=None):
+    """真实波幅 / 前收盘价"""
+    close = np.asarray(close, dtype=np.float64)
+    pct_chg = np.asarray(pct_chg, dtype=np.float64)
+    prev_close = close / (1 + pct_chg)
+    if high is None or low is None:
+        true_range = np.abs(close - prev_close)
+    else:
+        high = np.asarray(high, dtype=np.float64)
+        low = np.asarray(low, dtype=np.float64)
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+    return true_range / prev_close
+
+
+def _trailing_moments(values, window, valid=None):
+    """
+    最后 window 行的有效数据个数、均值和平方均值（NaN 不计入），与滚动面板最后一行的口径一致
+
+    :param valid: 可选，与 values 最后 window 行对应的计入条件，默认为非 NaN
+    :return: (count, mean, mean_sq)，每只股票一个值
+    """
+    values = np.asarray(values, dtype=np.float64)[-window:]
+    valid = ~np.isnan(values) if valid is None else valid & ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    count = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = filled.sum(axis=0) / count
+        mean_sq = np.einsum('ij,ij->j', filled, filled) / count
+    return count, mean, mean_sq
+
+
+def realized_volatility(pct_chg, window=20, periods=TRADING_DAYS, min_periods=None):
+    """
+    滚动年化波动率，停牌日不计入
+
+    :param pct_chg: (交易日 × 股票) 涨跌幅（小数）
+    :param min_periods: 窗口内最少的有效数据天数，不足时为 NaN（仓位为0），默认 window // 2；
+                        避免刚上市、长期停牌的股票因样本太少波动率接近0而得到最大仓位
+    """
+    pct_chg = np.asarray(pct_chg, dtype=np.float64)
+    mean = Signals.rolling_mean_panel(pct_chg, window)
+    mean_sq = Signals.rolling_mean_panel(pct_chg ** 2, window)
+    vol = np.sqrt(np.maximum(mean_sq - mean ** 2, 0) * periods)
+    vol[rolling_count_panel(pct_chg, window) < _min_periods(window, min_periods)] = np.nan
+    return vol
+
+
+def average_true_range_pct(close, pct_chg, high=None, low=None, window=14, min_periods=None):
+    """
+    以前收盘价为基准的 ATR 百分比
+
+    前收盘价用 收盘价 / (1 + 涨跌幅) 计算，除权日不会出现虚假的跳空；
+    没有最高价、最低价时以收盘价的涨跌幅绝对值作为真实波幅
+
+    :param min_periods: 窗口内最少的有效数据天数，不足时为 NaN（仓位为0），默认 window // 2
+    :return: (交易日 × 股票) ATR / 前收盘价
+    """
+    true_range_pct = _true_range_pct(close, pct_chg, high, low)
+    atr_pct = Signals.rolling_mean_panel(true_range_pct, window)
+    atr_pct[rolling_count_panel(true_range_pct, window) < _min_periods(window, min_periods)] = np.nan
+    return atr_pct
+
+
+def kelly_fraction(pct_chg, pos, window=250, min_obs=60):
+    """
+    按持仓日的收益滚动估计 Kelly 比例 mu / sigma^2
+
+    :param pos: (交易日 × 股票) 0/1 仓位
+    :return: Kelly 比例，负值截断为0，窗口内持仓天数不足 min_obs 时为 NaN（不做约束）
+    """
+    pct_chg = np.asarray(pct_chg, dtype=np.float64)
+    held_returns = np.where(np.asarray(pos) > 0, pct_chg, np.nan)
+    mean = Signals.rolling_mean_panel(held_returns, window)
+    mean_sq = Signals.rolling_mean_panel(held_returns ** 2, window)
+
+    # 窗口内的持仓天数
+    held = (~np.isnan(held_returns)).astype(np.float64)
+    span = np.minimum(np.arange(1, held.shape[0] + 1), window)[:, None]
+    count = Signals.rolling_mean_panel(held, window) * span
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = mean / (mean_sq - mean ** 2)
+    fraction[count < min_obs] = np.nan
+    return np.maximum(fraction, 0)
+
+
+def limit_positions(pos, max_positions, score=None):
+    """
+    限制同时持仓的股票数量
+
+    已持有的股票在仓位变为0之前一直保留名额；每天新出现的持仓信号按 score 从高到低填满剩余名额，
+    score 为 NaN 或没有名额的信号当天不开仓（信号仍在时，之后有名额再开仓）。
+
+    :param pos: (交易日 × 股票) 0/1 仓位
+    :param score: 可选，(交易日 × 股票) 开仓优先级，默认按股票顺序
+    :return: 限制后的 0/1 仓位
+    """
+    pos = np.asarray(pos) > 0
+    n_days, n_stocks = pos.shape
+    if score is None:
+        score = np.broadcast_to(-np.arange(n_stocks, dtype=np.float64), pos.shape)
+
+    result = np.zeros(pos.shape, dtype=bool)
+    held = np.zeros(n_stocks, dtype=bool)
+    for i in range(n_days):
+        held &= pos[i]
+        free = max_positions - int(held.sum())
+        candidates = np.flatnonzero(pos[i] & ~held & ~np.isnan(score[i]))
+        if free > 0 and len(candidates):
+            if len(candidates) > free:
+                order = np.argsort(-score[i][candidates], kind='stable')
+                candidates = candidates[order[:free]]
+            held[candidates] = True
+        result[i] = held
+    return result.astype(np.float64)
+
+
+def _freeze_at_entry(weights, pos):
+    """仓位大小在开仓当天确定，持有期间保持不变"""
+    held = pos > 0
+    entry = held & ~np.vstack([np.zeros((1, held.shape[1]), dtype=bool), held[:-1]])
+    frozen = Timing_Functions.ffill_panel(np.where(entry, weights, np.nan))
+    return np.where(held, frozen, 0.0)
+
+
+def raw_weights(panel, method='vol_target', target_vol=0.15, vol_window=20, risk_per_trade=0.01,
+                atr_multiple=2.0, atr_window=14):
+    """
+    每只股票每天的原始仓位比例（未考虑持仓信号和各种上限），只使用前一交易日及以前的数据
+
+    :param panel: Portfolio_Backtest.load_panel 的返回值，可选包含 最高价、最低价
+    """
+    if method not in SIZING_METHODS:
+        raise ValueError(f"Unknown sizing method: {method}, expected one of {SIZING_METHODS}")
+    pct_chg = panel['涨跌幅'].astype(np.float64)
+
+    if method == 'equal':
+        return np.ones(pct_chg.shape)
+    if method == 'vol_target':
+        vol = _lag(realized_volatility(pct_chg, window=vol_window))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return target_vol / vol
+    atr_pct = _lag(average_true_range_pct(panel['收盘价'], pct_chg, panel.get('最高价'), panel.get('最低价'),
+                                          window=atr_window))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return risk_per_trade / (atr_multiple * atr_pct)
+
+
+def size_positions(panel, pos, method='vol_target', max_positions=None, max_weight=None, kelly_multiplier=None,
+                   kelly_window=250, score=None, rebalance=False, **method_kwargs):
+    """
+    计算 (交易日 × 股票) 目标仓位比例
+
+    :param panel: Portfolio_Backtest.load_panel 的返回值
+    :param pos: 0/1 仓位，如 Portfolio_Backtest.portfolio_position 的返回值
+    :param method: 'equal', 'vol_target' 或 'atr_risk'
+    :param max_positions: 最大同时持仓数，None 表示不限制
+    :param max_weight: 单只股票的仓位上限，默认为 1 / max_positions（不限制持仓数时为1），
+                       保证所有持仓之和不超过100%
+    :param kelly_multiplier: Kelly 比例的倍数上限，如0.5为半 Kelly，None 表示不使用
+    :param score: 开仓优先级，默认按股票顺序
+    :param rebalance: False 时仓位大小在开仓日确定，True 时每天按最新估计调整
+    :param method_kwargs: 传给 raw_weights 的参数，如 target_vol, risk_per_trade, atr_multiple
+    :return: (交易日 × 股票) 仓位比例
+    """
+    pos = np.asarray(pos, dtype=np.float64)
+    if max_positions is not None:
+        pos = limit_positions(pos, max_positions, score=score)
+    if max_weight is None:
+        max_weight = 1.0 / max_positions if max_positions else 1.0
+
+    weights = raw_weights(panel, method=method, **method_kwargs)
+    if kelly_multiplier is not None:
+        kelly = _lag(kelly_fraction(panel['涨跌幅'].astype(np.float64), pos, window=kelly_window))
+        weights = np.fmin(weights, kelly_multiplier * kelly)
+
+    weights = np.clip(np.nan_to_num(weights, nan=0.0, posinf=max_weight), 0, max_weight)
+    weights = weights if rebalance else _freeze_at_entry(weights, pos)
+    return np.where(pos > 0, weights, 0.0)
+
+
+def size_day(pct_chg_history, signal, held_weights, method='vol_target', max_positions=None, max_weight=None,
+             score=None, close_history=None, high_history=None, low_history=None, kelly_multiplier=None,
+             pos_history=None, kelly_window=250, **method_kwargs):
+    """
+    实盘每天开盘前计算全市场的目标仓位，只使用最近的窗口数据
+
+    与 size_positions 最后一天的结果一致，但只对最后一个窗口求和，不计算整个历史的滚动面板
+
+    :param pct_chg_history: (最近若干交易日 × 股票) 涨跌幅，最后一行为前一交易日
+    :param signal: 今天的 0/1 持仓信号
+    :param held_weights: 当前持仓的仓位比例（未持有为0），已持有且信号仍为1的股票保持原仓位
+    :param close_history: atr_risk 方法需要的收盘价，最高价、最低价可选
+    :param kelly_multiplier: Kelly 比例的倍数上限，与 size_positions 相同，只约束新开仓的仓位
+    :param pos_history: 使用 kelly_multiplier 时必须提供，与 pct_chg_history 对应的 0/1 仓位
+    :param score: 开仓优先级，与 limit_positions 相同，score 为 NaN 的股票不开仓
+    :return: 今天的目标仓位比例
+    """
+    weights = _last_raw_weights(pct_chg_history, method, close_history, high_history, low_history, **method_kwargs)
+    if kelly_multiplier is not None:
+        if pos_history is None:
+            raise ValueError("kelly_multiplier requires pos_history")
+        weights = np.fmin(weights, kelly_multiplier * _last_kelly_fraction(pct_chg_history, pos_history, kelly_window))
+
+    if max_weight is None:
+        max_weight = 1.0 / max_positions if max_positions else 1.0
+    weights = np.clip(np.nan_to_num(weights, nan=0.0, posinf=max_weight), 0, max_weight)
+
+    signal = np.asarray(signal) > 0
+    held = signal & (np.asarray(held_weights) > 0)
+    entering = signal & ~held
+    if max_positions is not None:
+        if score is not None:
+            entering &= ~np.isnan(np.asarray(score, dtype=np.float64))
+        free = max(max_positions - int(held.sum()), 0)
+        candidates = np.flatnonzero(entering)
+        if len(candidates) > free:
+            priority = -np.arange(len(candidates)) if score is None else np.asarray(score)[candidates]
+            keep = candidates[np.argsort(-priority, kind='stable')[:free]]
+            entering = np.zeros_like(entering)
+            entering[keep] = True
+    return np.where(held, held_weights, np.where(entering, weights, 0.0))
+
+
+def _last_raw_weights(pct_chg_history, method, close_history=None, high_history=None, low_history=None,
+                      target_vol=0.15, vol_window=20, risk_per_trade=0.01, atr_multiple=2.0, atr_window=14):
+    """raw_weights 的最后一天：历史数据的最后一行是前一交易日，不需要再下移"""
+    if method not in SIZING_METHODS:
+        raise ValueError(f"Unknown sizing method: {method}, expected one of {SIZING_METHODS}")
+    n_stocks = pct_chg_history.shape[1]
+    if method == 'equal':
+        return np.ones(n_stocks)
+    if method == 'vol_target':
+        count, mean, mean_sq = _trailing_moments(pct_chg_history, vol_window)
+        vol = np.sqrt(np.maximum(mean_sq - mean ** 2, 0) * TRADING_DAYS)
+        vol[count < _min_periods(vol_window, None)] = np.nan
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return target_vol / vol
+    if high_history is None or low_history is None:
+        high_history = low_history = None
+    else:
+        high_history, low_history = high_history[-atr_window:], low_history[-atr_window:]
+    true_range_pct = _true_range_pct(close_history[-atr_window:], pct_chg_history[-atr_window:],
+                                     high_history, low_history)
+    count, atr_pct, _ = _trailing_moments(true_range_pct, atr_window)
+    atr_pct[count < _min_periods(atr_window, None)] = np.nan
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return risk_per_trade / (atr_multiple * atr_pct)
+
+
+def _last_kelly_fraction(pct_chg_history, pos_history, window=250, min_obs=60):
+    """kelly_fraction 的最后一天"""
+    count, mean, mean_sq = _trailing_moments(pct_chg_history, window, valid=np.asarray(pos_history)[-window:] > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fraction = mean / (mean_sq - mean ** 2)
+    fraction[count < min_obs] = np.nan
+    return np.maximum(fraction, 0)
+
+
+def equity_curves(panel, weights, initial_money=1000000, slippage=0.01, c_rate=5.0 / 10000, t_rate=1.0 / 1000):
+    """
+    每只股票独立账户按仓位比例计算资金曲线，只使用该股票有数据的交易日
+
+    :return: {stock_code: equity_curve_arrays 的返回值}
+    """
+    results = {}
+    for j, code in enumerate(panel['codes']):
+        listed = ~np.isnan(panel['收盘价'][:, j])
+        if not listed.any():
+            continue
+        pos = weights[listed, j].astype(np.float64)
+        pos[0] = 0
+        results[code] = Timing_Functions.equity_curve_arrays(
+            panel['开盘价'][listed, j].astype(np.float64), panel['收盘价'][listed, j].astype(np.float64),
+            panel['涨跌幅'][listed, j].astype(np.float64), pos, initial_money=initial_money, slippage=slippage,
+            c_rate=c_rate, t_rate=t_rate)
+    return results
@@ -2,6 +2,9 @@
 # -*- coding: UTF-8 -*-
 
 
+import numpy as np
+
+
 # 普通均线策略
 def signal_ma(df, ma_short=5, ma_long=20):
     """
@@ -39,3 +42,45 @@ def signal_ma(df, ma_short=5, ma_long=20):
     df.drop(['ma_short', 'ma_long'], axis=1, inplace=True)
 
     return df
+
+
+def rolling_mean_panel(values, window):
+    """
+    对 (交易日 × 股票) 面板按列计算滑动均值，等价于 rolling(window, min_periods=1).mean()：
+    窗口内的 NaN（未上市、停牌）不计入，窗口内全为 NaN 时结果为 NaN。
+    基于前缀和，每个点 O(1)。
+    """
+    valid = ~np.isnan(values)
+    csum = np.cumsum(np.where(valid, values, 0), axis=0, dtype=np.float64)
+    ccnt = np.cumsum(valid, axis=0, dtype=np.int64)
+    if window < values.shape[0]:
+        csum[window:] = csum[window:] - csum[:-window].copy()
+        ccnt[window:] = ccnt[window:] - ccnt[:-window].copy()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(ccnt > 0, csum / ccnt, np.nan)
+
+
+def signal_ma_panel(close_adj, ma_short=5, ma_long=20):
+    """
+    signal_ma 的面板版本，对所有股票同时计算均线交叉信号
+
+    :param close_adj: (交易日 × 股票) 后复权收盘价数组
+    :param ma_short: 短期均线
+    :param ma_long: 长期均线
+    :return: 与 close_adj 同形状的 float 数组，买入信号为1，卖出信号为0，其余为 NaN
+    """
+    ma_s = rolling_mean_panel(close_adj, ma_short)
+    ma_l = rolling_mean_panel(close_adj, ma_long)
+
+    signal = np.full(close_adj.shape, np.nan)
+    with np.errstate(invalid='ignore'):
+        # 当天短期均线大于等于长期均线，上个交易日短期均线小于长期均线
+        buy = np.zeros(close_adj.shape, dtype=bool)
+        buy[1:] = (ma_s[1:] >= ma_l[1:]) & (ma_s[:-1] < ma_l[:-1])
+        # 当天短期均线小于等于长期均线，上个交易日短期均线大于长期均线
+        sell = np.zeros(close_adj.shape, dtype=bool)
+        sell[1:] = (ma_s[1:] <= ma_l[1:]) & (ma_s[:-1] > ma_l[:-1])
+    signal[buy] = 1
+    signal[sell] = 0
+
+    return signal
@@ -0,0 +1,353 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+增量计算的择时信号
+
+Signals.signal_ma 和 Timing_Functions.position 每增加一根K线都要对全部历史重新做 rolling 和 shift。
+这里把它们改写成带状态的对象，每根新K线 O(1) 更新：
+- StreamingMA：环形缓冲区 + 滑动和，口径与 rolling(n, min_periods=1).mean() 一致
+- StreamingSignalMA：均线交叉信号，与 signal_ma 一致
+- StreamingPosition：仓位，与 position 一致（信号次日生效，开盘涨停不能买入，开盘跌停不能卖出）
+- StreamingTimingSignal：单只股票的完整状态，另外维护后复权因子
+- SignalStateRepository：把所有股票的状态快照保存到数据库 t_signal_state，第二天从快照恢复，不需要重新加载历史
+
+后复权价格只用于计算均线交叉，而均线交叉与价格的整体缩放无关，
+因此这里直接使用累乘的复权因子 (1 + 涨跌幅) 作为后复权价格，不需要随新数据重新缩放。
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine, text, MetaData, Table, Column, String, Date, DateTime, Text
+
+from program.python.com.caicongyang.financial.engineering.utils.env_loader import load_env
+
+# 加载环境变量 - 使用通用加载模块
+load_env()
+
+STATE_TABLE = 't_signal_state'
+
+
+class StreamingMA:
+    """
+    滑动均值，环形缓冲区保存最近 window 个值
+
+    每 window 次更新用缓冲区重新求和一次，避免长期加减带来的浮点误差累积（均摊仍为 O(1)）
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buffer = [0.0] * window
+        self.head = 0
+        self.count = 0
+        self.total = 0.0
+        self.updates = 0
+
+    def update(self, value):
+        if self.count == self.window:
+            self.total -= self.buffer[self.head]
+        else:
+            self.count += 1
+        self.buffer[self.head] = value
+        self.total += value
+        self.head = (self.head + 1) % self.window
+
+        self.updates += 1
+        if self.updates % self.window == 0:
+            # 未填满的位置为0，直接对整个缓冲区求和即可
+            self.total = float(sum(self.buffer))
+        return self.total / self.count
+
+    def peek(self, value):
+        """假设加入 value 之后的均值，不修改状态"""
+        if self.count == self.window:
+            return (self.total - self.buffer[self.head] + value) / self.count
+        return (self.total + value) / (self.count + 1)
+
+    def to_state(self):
+        return {'window': self.window, 'buffer': list(self.buffer), 'head': self.head,
+                'count': self.count, 'total': self.total, 'updates': self.updates}
+
+    @classmethod
+    def from_state(cls, state):
+        ma = cls(state['window'])
+        ma.buffer = [float(v) for v in state['buffer']]
+        ma.head = state['head']
+        ma.count = state['count']
+        ma.total = state['total']
+        ma.updates = state['updates']
+        return ma
+
+
+class StreamingSignalMA:
+    """均线交叉信号，每根K线返回 1（买入）、0（卖出）或 None（无信号）"""
+
+    def __init__(self, ma_short=5, ma_long=20):
+        self.ma_short = StreamingMA(ma_short)
+        self.ma_long = StreamingMA(ma_long)
+        self.last_short = None
+        self.last_long = None
+
+    def _cross(self, ma_s, ma_l):
+        if self.last_short is None:
+            return None
+        # 当天的短期均线大于等于长期均线，上个交易日的短期均线小于长期均线
+        if ma_s >= ma_l and self.last_short < self.last_long:
+            return 1
+        # 当天的短期均线小于等于长期均线，上个交易日的短期均线大于长期均线
+        if ma_s <= ma_l and self.last_short > self.last_long:
+            return 0
+        return None
+
+    def update(self, close_adj):
+        ma_s = self.ma_short.update(close_adj)
+        ma_l = self.ma_long.update(close_adj)
+        signal = self._cross(ma_s, ma_l)
+        self.last_short, self.last_long = ma_s, ma_l
+        return signal
+
+    def peek(self, close_adj):
+        """盘中用实时价格预估收盘时的信号，不修改状态"""
+        return self._cross(self.ma_short.peek(close_adj), self.ma_long.peek(close_adj))
+
+    def to_state(self):
+        return {'ma_short': self.ma_short.to_state(), 'ma_long': self.ma_long.to_state(),
+                'last_short': self.last_short, 'last_long': self.last_long}
+
+    @classmethod
+    def from_state(cls, state):
+        signal = cls.__new__(cls)
+        signal.ma_short = StreamingMA.from_state(state['ma_short'])
+        signal.ma_long = StreamingMA.from_state(state['ma_long'])
+        signal.last_short = state['last_short']
+        signal.last_long = state['last_long']
+        return signal
+
+
+class StreamingPosition:
+    """
+    根据信号计算每天的仓位，规则与 Timing_Functions.position 一致：
+    - 今天的目标仓位为截至昨天最近一次出现的信号
+    - 开盘涨停（开盘价 > 昨收 * 1.097）不能买入，开盘跌停（开盘价 < 昨收 * 0.903）不能卖出，仓位与前一天保持一致
+    - 出现第一个信号之前仓位为0
+    """
+
+    def __init__(self):
+        self.last_signal = None     # 截至昨天最近一次出现的信号
+        self.pending_signal = None  # 今天收盘产生的信号，明天生效
+        self.last_pos = None
+        self.last_close = None
+
+    def update(self, open_price, close, signal):
+        # 昨天产生的信号今天生效
+        if self.pending_signal is not None:
+            self.last_signal = self.pending_signal
+        self.pending_signal = signal
+
+        pos = self.last_signal
+        if pos is not None and self.last_close is not None:
+            if pos == 1 and open_price > self.last_close * 1.097:
+                pos = None
+            elif pos == 0 and open_price < self.last_close * 0.903:
+                pos = None
+        if pos is None:
+            pos = self.last_pos
+
+        self.last_pos = pos
+        self.last_close = close
+        return 0 if pos is None else pos
+
+    def to_state(self):
+        return {'last_signal': self.last_signal, 'pending_signal': self.pending_signal,
+                'last_pos': self.last_pos, 'last_close': self.last_close}
+
+    @classmethod
+    def from_state(cls, state):
+        position = cls()
+        position.last_signal = state['last_signal']
+        position.pending_signal = state['pending_signal']
+        position.last_pos = state['last_pos']
+        position.last_close = state['last_close']
+        return position
+
+
+class StreamingTimingSignal:
+    """单只股票的增量择时状态：复权因子 + 均线交叉信号 + 仓位"""
+
+    def __init__(self, ma_short=6, ma_long=50):
+        self.adj_factor = 1.0
+        self.signal = StreamingSignalMA(ma_short, ma_long)
+        self.position = StreamingPosition()
+        self.last_date = None
+
+    def update(self, trade_date, open_price, close, pct_chg):
+        """
+        加入一根日线
+
+        :param pct_chg: 涨跌幅（小数），用于累乘复权因子
+        :return: (signal, pos)，signal 为当天收盘产生的信号，pos 为当天的仓位
+        """
+        self.adj_factor *= 1.0 + pct_chg
+        signal = self.signal.update(self.adj_factor)
+        pos = self.position.update(open_price, close, signal)
+        self.last_date = str(trade_date)[:10]
+        return signal, pos
+
+    def peek(self, pct_chg):
+        """盘中预估：如果以当前涨跌幅 pct_chg 收盘，会不会产生信号"""
+        return self.signal.peek(self.adj_factor * (1.0 + pct_chg))
+
+    def to_state(self):
+        return {'adj_factor': self.adj_factor, 'signal': self.signal.to_state(),
+                'position': self.position.to_state(), 'last_date': self.last_date}
+
+    @classmethod
+    def from_state(cls, state):
+        timing = cls.__new__(cls)
+        timing.adj_factor = state['adj_factor']
+        timing.signal = StreamingSignalMA.from_state(state['signal'])
+        timing.position = StreamingPosition.from_state(state['position'])
+        timing.last_date = state['last_date']
+        return timing
+
+    @classmethod
+    def from_history(cls, df, ma_short=6, ma_long=50):
+        """
+        用历史日线回放一次得到初始状态
+
+        :param df: 包含 交易日期、开盘价、收盘价、涨跌幅 的 DataFrame，按日期升序
+        """
+        timing = cls(ma_short, ma_long)
+        for trade_date, open_price, close, pct_chg in zip(df['交易日期'].tolist(), df['开盘价'].tolist(),
+                                                          df['收盘价'].tolist(), df['涨跌幅'].tolist()):
+            timing.update(trade_date, open_price, close, pct_chg)
+        return timing
+
+
+class SignalStateRepository:
+    """
+    把增量信号状态保存到 MySQL，每只股票每个策略一行 JSON
+
+    表结构：stock_code, strategy, trade_date（状态对应的最后一个交易日）, state, updated_at
+    """
+
+    def __init__(self, engine=None):
+        if engine is None:
+            mysql_user = os.getenv('DB_USER')
+            mysql_password = os.getenv('DB_PASSWORD')
+            mysql_host = os.getenv('DB_HOST')
+            mysql_port = os.getenv('DB_PORT')
+            mysql_db = os.getenv('DB_NAME')
+            engine = create_engine(f'mysql+pymysql://{mysql_user}:{mysql_password}@{mysql_host}:{mysql_port}/{mysql_db}')
+        self.engine = engine
+
+    def init_table(self):
+        """创建状态表（如果不存在）"""
+        metadata = MetaData()
+        Table(
+            STATE_TABLE, metadata,
+            Column('stock_code', String(20), primary_key=True),
+            Column('strategy', String(64), primary_key=True),
+            Column('trade_date', Date, nullable=True),
+            Column('state', Text, nullable=False),
+            Column('updated_at', DateTime, nullable=False),
+        )
+        metadata.create_all(self.engine)
+
+    def save(self, strategy, states):
+        """
+        批量保存状态（存在则覆盖）
+
+        :param strategy: 策略标识，如 'ma_6_50'
+        :param states: {stock_code: StreamingTimingSignal}
+        """
+        now = datetime.now()
+        rows = [{
+            'stock_code': code,
+            'strategy': strategy,
+            'trade_date': timing.last_date,
+            'state': json.dumps(timing.to_state()),
+            'updated_at': now,
+        } for code, timing in states.items()]
+        if not rows:
+            return
+        sql = text(f"""
+            INSERT INTO {STATE_TABLE} (stock_code, strategy, trade_date, state, updated_at)
+            VALUES (:stock_code, :strategy, :trade_date, :state, :updated_at)
+            ON DUPLICATE KEY UPDATE trade_date = VALUES(trade_date), state = VALUES(state),
+                                    updated_at = VALUES(updated_at)
+        """)
+        with self.engine.begin() as conn:
+            conn.execute(sql, rows)
+
+    def load(self, strategy):
+        """读取某个策略下所有股票的状态，返回 {stock_code: StreamingTimingSignal}"""
+        query = text(f"SELECT stock_code, state FROM {STATE_TABLE} WHERE strategy = :strategy")
+        with self.engine.connect() as conn:
+            rows = conn.execute(query, {'strategy': strategy}).fetchall()
+        return {code: StreamingTimingSignal.from_state(json.loads(state)) for code, state in rows}
+
+
+class SignalBook:
+    """
+    全市场的增量信号簿
+
+    每天收盘后用当天的日线调用一次 update_day，每只股票 O(1)；
+    状态通过 SignalStateRepository 保存和恢复。
+    """
+
+    def __init__(self, ma_short=6, ma_long=50, repository=None):
+        self.ma_short = ma_short
+        self.ma_long = ma_long
+        self.strategy = f'ma_{ma_short}_{ma_long}'
+        self.repository = repository
+        self.states = {}
+
+    def restore(self):
+        self.states = self.repository.load(self.strategy)
+        return len(self.states)
+
+    def snapshot(self):
+        self.repository.save(self.strategy, self.states)
+
+    def update_day(self, bars):
+        """
+        加入一天的日线
+
+        :param bars: DataFrame，包含 股票代码、交易日期、开盘价、收盘价、涨跌幅
+        :return: DataFrame，每只股票当天的 signal 与 pos
+        """
+        records = []
+        for code, trade_date, open_price, close, pct_chg in zip(
+                bars['股票代码'].tolist(), bars['交易日期'].tolist(), bars['开盘价'].tolist(),
+                bars['收盘价'].tolist(), bars['涨跌幅'].tolist()):
+            timing = self.states.get(code)
+            if timing is None:
+                timing = self.states[code] = StreamingTimingSignal(self.ma_short, self.ma_long)
+            elif timing.last_date is not None and str(trade_date)[:10] <= timing.last_date:
+                # 同一天重复推送时跳过，避免状态被推进两次
+                continue
+            signal, pos = timing.update(trade_date, open_price, close, pct_chg)
+            records.append((code, trade_date, np.nan if signal is None else signal, pos))
+        return pd.DataFrame(records, columns=['股票代码', '交易日期', 'signal', 'pos'])
+
+    def peek(self, prices):
+        """
+        盘中预估：用实时价格判断哪些股票收盘时会产生信号
+
+        :param prices: {stock_code: 当前涨跌幅（小数）}
+        :return: {stock_code: signal}，只包含会产生信号的股票
+        """
+        result = {}
+        for code, pct_chg in prices.items():
+            timing = self.states.get(code)
+            if timing is not None:
+                signal = timing.peek(pct_chg)
+                if signal is not None:
+                    result[code] = signal
+        return result
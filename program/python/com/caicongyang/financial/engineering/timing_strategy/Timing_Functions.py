@@ -6,6 +6,8 @@
 择时策略需要用到的常用方法
 """
 
+import numpy as np
+
 
 def position(df):
     """
@@ -39,6 +41,45 @@ def position(df):
     return df
 
 
+def ffill_panel(values):
+    """对 (交易日 × 股票) 面板按列向下填充 NaN"""
+    idx = np.where(~np.isnan(values), np.arange(values.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return values[idx, np.arange(values.shape[1])]
+
+
+def position_panel(signal, open_price, close):
+    """
+    position 的面板版本，对所有股票同时根据信号计算每天的仓位，
+    同样考虑开盘涨停不能买入、开盘跌停不能卖出
+
+    :param signal: (交易日 × 股票) 信号数组，1买入 0卖出 NaN无信号
+    :param open_price: 开盘价（不复权）
+    :param close: 收盘价（不复权）
+    :return: 仓位数组
+    """
+
+    # 由signal计算出实际的每天持有股票仓位
+    pos = np.full(signal.shape, np.nan)
+    pos[1:] = signal[:-1]
+    pos = ffill_panel(pos)
+
+    prev_close = np.full(close.shape, np.nan)
+    prev_close[1:] = close[:-1]
+    with np.errstate(invalid='ignore'):
+        # 开盘涨停日、并且当天position为1时不能买入
+        cond_cannot_buy = (open_price > prev_close * 1.097) & (pos == 1)
+        # 开盘跌停日、并且当天position为0时不能卖出
+        cond_cannot_sell = (open_price < prev_close * 0.903) & (pos == 0)
+    pos[cond_cannot_buy | cond_cannot_sell] = np.nan
+
+    # position为空的日期，不能买卖。position只能和前一个交易日保持一致。
+    pos = ffill_panel(pos)
+    pos[np.isnan(pos)] = 0
+
+    return pos
+
+
 # 计算资金曲线，简单版本
 def equity_curve_simple(df):
     """
@@ -57,10 +98,10 @@ def equity_curve_simple(df):
     return df
 
 
-# 计算资金曲线，简单版本
+# 计算资金曲线，实际版本
 def equity_curve(df, initial_money=1000000, slippage=0.01, c_rate=5.0 / 10000, t_rate=1.0 / 1000):
     """
-    :param df:
+    :param df: 需包含 开盘价、收盘价、涨跌幅、pos 列，index 为 0..n-1
     :param initial_money: 初始资金，默认为1000000元
     :param slippage: 滑点，默认为0.01元
     :param c_rate: 手续费，commission fees，默认为万分之5
@@ -68,83 +109,132 @@ def equity_curve(df, initial_money=1000000, slippage=0.01, c_rate=5.0 / 10000, t
     :return:
     """
 
+    result = equity_curve_arrays(df['开盘价'].to_numpy(dtype=np.float64),
+                                 df['收盘价'].to_numpy(dtype=np.float64),
+                                 df['涨跌幅'].to_numpy(dtype=np.float64),
+                                 df['pos'].to_numpy(dtype=np.float64),
+                                 initial_money=initial_money, slippage=slippage, c_rate=c_rate, t_rate=t_rate)
+
+    # 计算结果一次性写回 DataFrame
+    for col in ('hold_num', 'stock_value', 'actual_pos', 'cash', 'equity', '手续费', '印花税'):
+        df[col] = result[col]
+
+    return df
+
+
+def equity_curve_arrays(open_price, close, pct_chg, pos, initial_money=1000000, slippage=0.01,
+                        c_rate=5.0 / 10000, t_rate=1.0 / 1000):
+    """
+    在 numpy 数组上计算资金曲线，逻辑与逐行版本完全一致：
+    整百买入、手续费不足5元按5元收、卖出收印花税、除权时按前一日市值调整持股数量。
+
+    与逐行版本相比，除权判断、调仓判断等与状态无关的部分先向量化算好，
+    循环内只处理持股/现金这两个状态，并只读写 python 列表，最后一次性转换为数组。
+
+    :param open_price: 开盘价数组
+    :param close: 收盘价数组
+    :param pct_chg: 涨跌幅数组（小数）
+    :param pos: 目标仓位数组，可以是0~1之间的小数
+    :return: dict，包含 hold_num, stock_value, actual_pos, cash, equity, 手续费, 印花税 数组，
+             没有发生交易的日期手续费/印花税为 NaN
+    """
+
+    n = len(close)
+
+    # ===与状态无关的部分，向量化计算
+    # 若发生除权，需要调整hold_num
+    ex_rights = np.zeros(n, dtype=bool)
+    last_price = np.zeros(n, dtype=np.float64)
+    if n > 1:
+        ex_rights[1:] = np.abs((close[1:] / close[:-1] - 1) - pct_chg[1:]) > 0.001
+        last_price[1:] = close[1:] / (pct_chg[1:] + 1)
+    # 仓位是否变化（NaN 与任何值都不相等，与逐行比较的结果一致）
+    pos_changed = np.zeros(n, dtype=bool)
+    if n > 1:
+        pos_changed[1:] = pos[1:] != pos[:-1]
+
+    open_list = open_price.tolist()
+    close_list = close.tolist()
+    pos_list = pos.tolist()
+    last_price_list = last_price.tolist()
+    ex_rights_list = ex_rights.tolist()
+    pos_changed_list = pos_changed.tolist()
+
+    nan = float('nan')
+    hold_arr = [0] * n
+    value_arr = [0] * n
+    actual_pos_arr = [0] * n
+    cash_arr = [0] * n
+    equity_arr = [0] * n
+    commission_arr = [nan] * n
+    tax_arr = [nan] * n
+
     # ===第一天的情况
-    df.at[0, 'hold_num'] = 0  # 持有股票数量
-    df.at[0, 'stock_value'] = 0  # 持仓股票市值
-    df.at[0, 'actual_pos'] = 0  # 每日的实际仓位
-    df.at[0, 'cash'] = initial_money  # 持有现金现金
-    df.at[0, 'equity'] = initial_money  # 总资产 = 持仓股票市值 + 现金
+    cash_arr[0] = initial_money
+    equity_arr[0] = initial_money
 
     # ===第一天之后每天的情况
-    for i in range(1, df.shape[0]):
+    for i in range(1, n):
 
         # 前一天持有的股票的数量
-        hold_num = df.at[i - 1, 'hold_num']
+        hold_num = hold_arr[i - 1]
+        cash = cash_arr[i - 1]
 
         # 若发生除权，需要调整hold_num
-        if abs((df.at[i, '收盘价'] / df.at[i - 1, '收盘价'] - 1) - df.at[i, '涨跌幅']) > 0.001:
-            stock_value = df.at[i - 1, 'stock_value']
-            last_price = df.at[i, '收盘价'] / (df.at[i, '涨跌幅'] + 1)
-            hold_num = stock_value / last_price
-            hold_num = int(hold_num)
+        if ex_rights_list[i]:
+            hold_num = int(value_arr[i - 1] / last_price_list[i])
 
-        # 判断是否需要调整仓位
         # 需要调整仓位
-        if df.at[i, 'pos'] != df.at[i - 1, 'pos']:
+        if pos_changed_list[i]:
+            open_i = open_list[i]
 
-            # 昨天的总资产 * 今天的仓位 / 今天的收盘价，得到需要持有的股票数
-            theory_num = df.at[i - 1, 'equity'] * df.at[i, 'pos'] / df.at[i, '开盘价']
-            # 对需要持有的股票数取整
-            theory_num = int(theory_num)  # 向下取整数
+            # 昨天的总资产 * 今天的仓位 / 今天的开盘价，得到需要持有的股票数，向下取整
+            theory_num = int(equity_arr[i - 1] * pos_list[i] / open_i)
 
-            # 判断加仓还是减仓
             # 加仓
             if theory_num >= hold_num:
-                # 计算实际需要买入的股票数量
-                buy_num = theory_num - hold_num
                 # 买入股票只能整百，对buy_num进行向下取整百
-                buy_num = int(buy_num / 100) * 100
-
-                # 计算买入股票花去的现金
-                buy_cash = buy_num * (df.at[i, '开盘价'] + slippage)
-                # 计算买入股票花去的手续费，并保留2位小数
+                buy_num = int((theory_num - hold_num) / 100) * 100
+                buy_cash = buy_num * (open_i + slippage)
+                # 计算买入股票花去的手续费，并保留2位小数，不足5元按5元收
                 commission = round(buy_cash * c_rate, 2)
-                # 不足5元按5元收
                 if commission < 5 and commission != 0:
                     commission = 5
-                df.at[i, '手续费'] = commission
+                commission_arr[i] = commission
 
-                # 计算当天收盘时持有股票的数量和现金
-                df.at[i, 'hold_num'] = hold_num + buy_num  # 持有股票
-                df.at[i, 'cash'] = df.at[i - 1, 'cash'] - buy_cash - commission  # 剩余现金
+                hold_num = hold_num + buy_num
+                cash = cash - buy_cash - commission
 
             # 减仓
             else:
-                # 计算卖出股票数量，卖出股票可以不是整数，不需要取整百。
+                # 卖出股票可以不是整数，不需要取整百
                 sell_num = hold_num - theory_num
-
-                # 计算卖出股票得到的现金
-                sell_cash = sell_num * (df.at[i, '开盘价'] - slippage)
+                sell_cash = sell_num * (open_i - slippage)
                 # 计算手续费，不足5元按5元收并保留2位小数
                 commission = round(max(sell_cash * c_rate, 5), 2)
-                df.at[i, '手续费'] = commission
-                # 计算印花税，保留2位小数。历史上有段时间，买入也会收取印花税
+                commission_arr[i] = commission
+                # 计算印花税，保留2位小数
                 tax = round(sell_cash * t_rate, 2)
-                df.at[i, '印花税'] = tax
+                tax_arr[i] = tax
 
-                # 计算当天收盘时持有股票的数量和现金
-                df.at[i, 'hold_num'] = hold_num - sell_num  # 持有股票
-                df.at[i, 'cash'] = df.at[i - 1, 'cash'] + sell_cash - commission - tax  # 剩余现金
-
-        # 不需要调仓
-        else:
-            # 计算当天收盘时持有股票的数量和现金
-            df.at[i, 'hold_num'] = hold_num  # 持有股票
-            df.at[i, 'cash'] = df.at[i - 1, 'cash']  # 剩余现金
+                hold_num = hold_num - sell_num
+                cash = cash + sell_cash - commission - tax
 
         # 计算当天的各种数据
-        df.at[i, 'stock_value'] = df.at[i, 'hold_num'] * df.at[i, '收盘价']  # 剩余现金
-        df.at[i, 'equity'] = df.at[i, 'cash'] + df.at[i, 'stock_value']  # 总资产
-        df.at[i, 'actual_pos'] = df.at[i, 'stock_value'] / df.at[i, 'equity']  # 实际仓位
-
-    return df
+        stock_value = hold_num * close_list[i]
+        equity = cash + stock_value
+        hold_arr[i] = hold_num
+        cash_arr[i] = cash
+        value_arr[i] = stock_value
+        equity_arr[i] = equity
+        actual_pos_arr[i] = stock_value / equity
+
+    return {
+        'hold_num': np.array(hold_arr, dtype=np.float64),
+        'stock_value': np.array(value_arr, dtype=np.float64),
+        'actual_pos': np.array(actual_pos_arr, dtype=np.float64),
+        'cash': np.array(cash_arr, dtype=np.float64),
+        'equity': np.array(equity_arr, dtype=np.float64),
+        '手续费': np.array(commission_arr, dtype=np.float64),
+        '印花税': np.array(tax_arr, dtype=np.float64),
+    }
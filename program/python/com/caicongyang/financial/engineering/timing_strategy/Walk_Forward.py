@@ -0,0 +1,241 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+均线策略参数的滚动样本外（walk-forward）优化
+
+对每只股票把历史切成滚动的 训练期 + 测试期：
+- 在训练期上遍历 (ma_short, ma_long) 网格，按训练期收益选出最优参数
+- 用最优参数在紧随其后的测试期上回测，记录样本外收益，同时记录 main.py 默认参数 6/50 的收益作为对照
+- 测试期向后滚动一个测试期长度，重复以上过程
+
+股票 × 窗口 的任务分发到进程池执行。价格面板只在主进程加载一次，
+放在共享内存中，子进程以只读方式挂载，不需要为每个任务复制或重新读取数据。
+资金曲线使用 Timing_Functions.equity_curve_arrays，口径与 main.py 一致。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import MA_Kernel
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Timing_Functions
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Portfolio_Backtest
+
+pd.set_option('expand_frame_repr', False)  # 当列太多时不换行
+
+SHARED_FIELDS = ('开盘价', '收盘价', '涨跌幅', '收盘价_后复权')
+
+# 默认参数网格
+DEFAULT_SHORT_GRID = tuple(range(3, 21))
+DEFAULT_LONG_GRID = tuple(range(20, 121, 5))
+
+# 子进程中挂载的共享面板
+_shared_panel = {}
+
+
+def param_grid(short_grid=DEFAULT_SHORT_GRID, long_grid=DEFAULT_LONG_GRID):
+    """生成 ma_short < ma_long 的全部参数组合"""
+    return [(s, l) for s in short_grid for l in long_grid if s < l]
+
+
+def strategy_positions(open_price, close, close_adj, pairs):
+    """
+    一只股票在多组均线参数下的仓位
+
+    :param open_price: 开盘价，一维数组
+    :param close: 收盘价，一维数组
+    :param close_adj: 后复权收盘价，一维数组
+    :param pairs: [(ma_short, ma_long), ...]
+    :return: (交易日 × 参数组) 仓位数组
+    """
+    return MA_Kernel.crossover_positions(close_adj, open_price, close, pairs).T
+
+
+def window_return(open_price, close, pct_chg, pos, start, end, initial_money=1000000, **cost_kwargs):
+    """
+    在 [start, end) 区间内按仓位计算资金曲线，返回区间收益率
+    区间第一天仓位设置为0，与 main.py 截取数据后的处理一致
+    """
+    pos = pos[start:end].copy()
+    pos[0] = 0
+    result = Timing_Functions.equity_curve_arrays(open_price[start:end], close[start:end], pct_chg[start:end],
+                                                  pos, initial_money=initial_money, **cost_kwargs)
+    return result['equity'][-1] / initial_money - 1
+
+
+def make_windows(n_days, train_days, test_days, first_day=0):
+    """生成滚动窗口 [(train_start, train_end, test_end), ...]，测试期为 [train_end, test_end)"""
+    windows = []
+    train_start = first_day
+    while train_start + train_days + test_days <= n_days:
+        train_end = train_start + train_days
+        windows.append((train_start, train_end, train_end + test_days))
+        train_start += test_days
+    return windows
+
+
+# ===================== 共享内存 =====================
+
+def _share_panel(panel):
+    """把面板中的数组复制到共享内存，返回 (共享内存块列表, 子进程挂载用的描述信息)"""
+    blocks = []
+    spec = {}
+    for field in SHARED_FIELDS:
+        values = np.ascontiguousarray(panel[field], dtype=np.float64)
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=np.float64, buffer=shm.buf)[:] = values
+        blocks.append(shm)
+        spec[field] = (shm.name, values.shape)
+    return blocks, spec
+
+
+def _attach_panel(spec):
+    """进程池初始化函数：以只读方式挂载共享面板"""
+    for field, (name, shape) in spec.items():
+        shm = shared_memory.SharedMemory(name=name)
+        values = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        values.flags.writeable = False
+        # 保留 shm 对象的引用，避免被回收后缓冲区失效
+        _shared_panel[field] = (shm, values)
+
+
+def _column(field, j):
+    return _shared_panel[field][1][:, j]
+
+
+def _run_job(j, windows, pairs, baseline, cost_kwargs):
+    """
+    一只股票上若干个窗口的优化任务，在子进程中执行
+
+    只使用该股票有数据的交易日（窗口下标也是相对这些交易日的）。
+    信号只依赖历史数据，因此对整段历史一次性算出各参数的仓位，再按窗口截取
+    """
+    listed = ~np.isnan(_column('收盘价', j))
+    open_price = _column('开盘价', j)[listed]
+    close = _column('收盘价', j)[listed]
+    pct_chg = _column('涨跌幅', j)[listed]
+    close_adj = _column('收盘价_后复权', j)[listed]
+
+    all_pairs = list(pairs) + ([baseline] if baseline not in pairs else [])
+    positions = strategy_positions(open_price, close, close_adj, all_pairs)
+
+    records = []
+    for train_start, train_end, test_end in windows:
+        train_returns = np.array([
+            window_return(open_price, close, pct_chg, positions[:, p], train_start, train_end, **cost_kwargs)
+            for p in range(len(pairs))
+        ])
+        best = int(np.argmax(train_returns))
+        records.append({
+            'column': j,
+            'train_start': train_start,
+            'train_end': train_end,
+            'test_end': test_end,
+            'best_short': pairs[best][0],
+            'best_long': pairs[best][1],
+            'train_return': train_returns[best],
+            'test_return': window_return(open_price, close, pct_chg, positions[:, best],
+                                         train_end, test_end, **cost_kwargs),
+            'baseline_test_return': window_return(open_price, close, pct_chg,
+                                                  positions[:, all_pairs.index(baseline)],
+                                                  train_end, test_end, **cost_kwargs),
+        })
+    return records
+
+
+# ===================== 主流程 =====================
+
+def walk_forward(panel, train_days=500, test_days=120, pairs=None, baseline=(6, 50), min_listed_days=250,
+                 max_workers=None, windows_per_job=4, slippage=0.01, c_rate=5.0 / 10000, t_rate=1.0 / 1000):
+    """
+    对面板中所有股票做滚动样本外优化
+
+    :param panel: Portfolio_Backtest.load_panel 的返回值
+    :param train_days: 训练期长度（交易日）
+    :param test_days: 测试期长度，也是窗口滚动的步长
+    :param pairs: 参数网格，默认为 param_grid()
+    :param baseline: 对照参数
+    :param min_listed_days: 上市满多少个交易日后才开始第一个训练期
+    :param max_workers: 进程数，默认为CPU核数
+    :param windows_per_job: 每个任务包含的窗口数，减少进程间调度开销
+    :return: DataFrame，每行是一只股票的一个窗口
+    """
+    pairs = param_grid() if pairs is None else list(pairs)
+    cost_kwargs = {'slippage': slippage, 'c_rate': c_rate, 't_rate': t_rate}
+
+    # 构造 股票 × 窗口 任务，窗口按每只股票自己有数据的交易日计算
+    valid = ~np.isnan(panel['收盘价'])
+    listed_rows = [np.flatnonzero(valid[:, j]) for j in range(len(panel['codes']))]
+    jobs = []
+    for j, listed in enumerate(listed_rows):
+        windows = make_windows(len(listed), train_days, test_days, first_day=min_listed_days)
+        for k in range(0, len(windows), windows_per_job):
+            jobs.append((j, windows[k:k + windows_per_job]))
+
+    blocks, spec = _share_panel(panel)
+    records = []
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                                 initializer=_attach_panel, initargs=(spec,)) as executor:
+            futures = [executor.submit(_run_job, j, windows, pairs, baseline, cost_kwargs) for j, windows in jobs]
+            completed = 0
+            for future in as_completed(futures):
+                records.extend(future.result())
+                completed += 1
+                if completed % 100 == 0:
+                    print(f"Progress: {completed}/{len(futures)} jobs processed")
+    finally:
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    if not records:
+        return pd.DataFrame()
+
+    result = pd.DataFrame(records)
+    dates = panel['dates']
+
+    def to_dates(column, offset=0):
+        return dates[[listed_rows[j][k + offset] for j, k in zip(result['column'], result[column])]]
+
+    result.insert(0, 'stock_code', [panel['codes'][j] for j in result['column']])
+    result['train_start'] = to_dates('train_start')
+    result['test_start'] = to_dates('train_end')
+    result['test_end'] = to_dates('test_end', offset=-1)
+    result = result[['stock_code', 'train_start', 'test_start', 'test_end', 'best_short', 'best_long',
+                     'train_return', 'test_return', 'baseline_test_return']]
+    return result.sort_values(['stock_code', 'train_start']).reset_index(drop=True)
+
+
+def summarize(result):
+    """
+    参数稳定性汇总，每只股票一行：
+    窗口数、最优参数的变化程度、样本外平均收益、相对默认参数的平均超额、样本外胜率
+    """
+    grouped = result.groupby('stock_code')
+    summary = pd.DataFrame({
+        'windows': grouped.size(),
+        'short_std': grouped['best_short'].std(),
+        'long_std': grouped['best_long'].std(),
+        'param_changes': grouped.apply(
+            lambda g: int(((g['best_short'].diff() != 0) | (g['best_long'].diff() != 0)).iloc[1:].sum()),
+            include_groups=False),
+        'avg_test_return': grouped['test_return'].mean(),
+        'avg_excess_return': grouped.apply(lambda g: (g['test_return'] - g['baseline_test_return']).mean(),
+                                           include_groups=False),
+        'test_win_rate': grouped['test_return'].apply(lambda r: (r > 0).mean()),
+        'degradation': grouped['train_return'].mean() - grouped['test_return'].mean(),
+    })
+    return summary.sort_values('avg_test_return', ascending=False)
+
+
+if __name__ == "__main__":
+    price_panel = Portfolio_Backtest.load_panel(Portfolio_Backtest.list_stock_codes())
+    wf_result = walk_forward(price_panel)
+    print(wf_result.head(20))
+    print(summarize(wf_result).head(20))
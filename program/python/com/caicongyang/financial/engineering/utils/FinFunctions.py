@@ -13,13 +13,15 @@ from program.python.com.caicongyang.financial.engineering import config
 
 
 # 导入函数
-def import_stock_data(stock_code):
+def import_stock_data(stock_code, stock_data_path=None):
     """
 
     :param stock_code:
+    :param stock_data_path: CSV所在目录，默认为 config.input_data_path/stock_data
     :return:
     """
-    df = pd.read_csv(config.input_data_path + '/stock_data/' + stock_code + '_utf-8.csv', encoding='utf-8')
+    stock_data_path = stock_data_path or config.input_data_path + '/stock_data'
+    df = pd.read_csv(stock_data_path + '/' + stock_code + '_utf-8.csv', encoding='utf-8')
     # df.columns = [i.encode('utf8') for i in df.columns] 导入的是gbk 时需要做一次转成
     df = df[['交易日期', '股票代码', '开盘价', '最高价', '最低价', '收盘价', '涨跌幅']]
     df.sort_values(by=['交易日期'], inplace=True)
@@ -29,6 +31,18 @@ def import_stock_data(stock_code):
     return df
 
 
+def import_stock_data_cached(stock_code, answer_authority_type=None):
+    """
+    与 import_stock_data 返回相同的数据，但从 PriceStore 的二进制缓存读取，
+    CSV 发生变化时自动重新转换；复权价格在缓存中预先算好。
+    :param stock_code:
+    :param answer_authority_type: '前复权' / '后复权'，指定时附加对应的复权价格列
+    :return:
+    """
+    from program.python.com.caicongyang.financial.engineering.utils import PriceStore
+    return PriceStore.get_default_store().load_frame(stock_code, answer_authority_type)
+
+
 # 计算复权价
 
 def cal_answer_authority(input_stock_data, answer_authority_type='后复权'):
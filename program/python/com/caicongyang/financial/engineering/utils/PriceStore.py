@@ -0,0 +1,301 @@
+# !/usr/bin/python
+# -*- coding: UTF-8 -*-
+
+
+"""
+日线数据二进制缓存
+把 config.input_data_path/stock_data 下的 {stock_code}_utf-8.csv 一次性转换为可内存映射的列式二进制文件：
+
+    stock_data_cache/
+        index.json            # {generation, rows, stocks: {stock_code: [offset, length, csv_mtime_ns, 股票代码列的值]}}
+        date.{generation}.bin # int64, datetime64[ns]
+        open.{generation}.bin # float64, 原始价格、涨跌幅
+        close_hfq.{generation}.bin ... # float64, 预先算好的前复权/后复权价格（第0代为 date.bin 等）
+
+每个字段是一个连续的大数组，每只股票占其中一段 [offset, offset + length)，
+读取一只股票只是对 np.memmap 的切片，不需要解析 CSV、排序和重新计算复权。
+CSV 的修改时间发生变化时只重新转换该股票：新数据追加到文件末尾，旧的一段成为空洞，
+空洞超过一半时整体压缩。
+
+崩溃安全：索引只在数据写完后原子替换，并记录有效行数 rows——追加中途失败时文件末尾多出的数据
+不会被读到，下次追加前截掉；压缩写入下一代（generation + 1）的文件，替换索引后才删除旧一代的文件。
+同一时间只允许一个进程写入：refresh / compact 持有缓存目录下 .lock 文件的排他锁（fcntl，
+Windows 下没有该模块，需要自行保证只有一个进程写入）。
+@author: caicongyang
+"""
+
+import json
+import os
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from program.python.com.caicongyang.financial.engineering import config
+from program.python.com.caicongyang.financial.engineering.utils import FinFunctions
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+CSV_SUFFIX = '_utf-8.csv'
+
+# 原始列 -> 文件名
+RAW_FIELDS = {
+    '交易日期': 'date',
+    '开盘价': 'open',
+    '最高价': 'high',
+    '最低价': 'low',
+    '收盘价': 'close',
+    '涨跌幅': 'pct_chg',
+}
+
+# 复权列 -> 文件名
+ADJUSTED_FIELDS = {
+    f'{price}_{fuquan_type}': f'{name}_{suffix}'
+    for fuquan_type, suffix in (('前复权', 'qfq'), ('后复权', 'hfq'))
+    for price, name in (('开盘价', 'open'), ('最高价', 'high'), ('最低价', 'low'), ('收盘价', 'close'))
+}
+
+FIELDS = dict(RAW_FIELDS, **ADJUSTED_FIELDS)
+
+
+class PriceStore:
+    def __init__(self, csv_dir=None, cache_dir=None):
+        self.csv_dir = csv_dir or os.path.join(config.input_data_path, 'stock_data')
+        self.cache_dir = cache_dir or os.path.join(config.input_data_path, 'stock_data_cache')
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.index, self.generation, self.rows = self._read_index()
+        self._maps = {}
+
+    # ===================== 索引 =====================
+
+    def _index_path(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    def _field_path(self, field, generation=None):
+        generation = self.generation if generation is None else generation
+        # 第0代沿用旧版本的文件名
+        suffix = '.bin' if generation == 0 else f'.{generation}.bin'
+        return os.path.join(self.cache_dir, FIELDS[field] + suffix)
+
+    def _read_index(self):
+        """:return: (索引, 数据文件的代数, 有效行数)"""
+        try:
+            with open(self._index_path(), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}, 0, 0
+        if 'stocks' not in data:
+            # 旧版本的索引只有股票一项，有效行数以日期文件的大小为准
+            index = {code: tuple(v) for code, v in data.items()}
+            path = os.path.join(self.cache_dir, FIELDS['交易日期'] + '.bin')
+            return index, 0, os.path.getsize(path) // 8 if os.path.exists(path) else 0
+        return {code: tuple(v) for code, v in data['stocks'].items()}, data['generation'], data['rows']
+
+    def _write_index(self):
+        # 先写临时文件再替换，避免中途失败留下损坏的索引
+        tmp_path = self._index_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'generation': self.generation, 'rows': self.rows, 'stocks': self.index}, f)
+        os.replace(tmp_path, self._index_path())
+
+    def _reload(self):
+        """重新读取索引，其他进程可能已经追加或压缩了数据"""
+        index, generation, rows = self._read_index()
+        if (generation, rows) != (self.generation, self.rows):
+            self._maps.clear()
+        self.index, self.generation, self.rows = index, generation, rows
+
+    @contextmanager
+    def _lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.cache_dir, '.lock'), 'w') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _stored_rows(self):
+        return self.rows
+
+    def _csv_path(self, stock_code):
+        return os.path.join(self.csv_dir, stock_code + CSV_SUFFIX)
+
+    def codes(self):
+        return sorted(self.index.keys())
+
+    # ===================== 写入 =====================
+
+    def _convert(self, stock_code):
+        """读取CSV并计算前复权、后复权价格，返回 {列名: 数组}"""
+        df = FinFunctions.import_stock_data(stock_code, self.csv_dir)
+        columns = {'交易日期': df['交易日期'].to_numpy(dtype='datetime64[ns]').view(np.int64),
+                   '股票代码': df['股票代码'].iloc[0] if not df.empty else stock_code}
+        for field in list(RAW_FIELDS)[1:]:
+            columns[field] = df[field].to_numpy(dtype=np.float64)
+        if not df.empty:
+            for fuquan_type in ('前复权', '后复权'):
+                adjusted = FinFunctions.cal_answer_authority(df, fuquan_type)
+                for col in adjusted.columns:
+                    columns[col] = adjusted[col].to_numpy(dtype=np.float64)
+        else:
+            for col in ADJUSTED_FIELDS:
+                columns[col] = np.empty(0, dtype=np.float64)
+        return columns
+
+    def _append(self, converted):
+        """把多只股票的数据追加到各字段文件末尾，并更新索引"""
+        self._maps.clear()
+        offset = self._stored_rows()
+        for field in FIELDS:
+            with open(self._field_path(field), 'ab') as f:
+                # 截掉上次追加失败留下的、索引中没有记录的数据
+                f.truncate(offset * 8)
+                for _, _, columns in converted:
+                    f.write(np.ascontiguousarray(columns[field]).tobytes())
+        for stock_code, mtime_ns, columns in converted:
+            length = len(columns['交易日期'])
+            self.index[stock_code] = (offset, length, mtime_ns, str(columns['股票代码']))
+            offset += length
+        self.rows = offset
+
+    def refresh(self, stock_codes=None):
+        """
+        增量刷新：只转换新增的、或CSV修改时间发生变化的股票
+
+        :param stock_codes: 需要检查的股票，默认为CSV目录下的所有股票
+        :return: 本次重新转换的股票数量
+        """
+        if stock_codes is None:
+            stock_codes = [f[:-len(CSV_SUFFIX)] for f in os.listdir(self.csv_dir) if f.endswith(CSV_SUFFIX)]
+
+        with self._lock():
+            self._reload()
+            converted = []
+            for stock_code in stock_codes:
+                mtime_ns = os.stat(self._csv_path(stock_code)).st_mtime_ns
+                cached = self.index.get(stock_code)
+                if cached is None or cached[2] != mtime_ns:
+                    converted.append((stock_code, mtime_ns, self._convert(stock_code)))
+
+            if converted:
+                self._append(converted)
+                self._write_index()
+                if self._garbage_rows() > self._stored_rows() // 2:
+                    self._compact()
+        return len(converted)
+
+    def _garbage_rows(self):
+        return self._stored_rows() - sum(entry[1] for entry in self.index.values())
+
+    def compact(self):
+        """重写数据文件，去掉被替换掉的旧数据段"""
+        with self._lock():
+            self._reload()
+            self._compact()
+
+    def _compact(self):
+        # 新数据写入下一代文件，替换索引之前旧一代的文件和索引都保持不变，中途失败不影响读取
+        order = sorted(self.index.items(), key=lambda item: item[1][0])
+        new_index = {}
+        offset = 0
+        for stock_code, (old_offset, length, mtime_ns, code_value) in order:
+            new_index[stock_code] = (offset, length, mtime_ns, code_value)
+            offset += length
+
+        old_generation = self.generation
+        new_generation = old_generation + 1
+        for field in FIELDS:
+            source = self._memmap(field)
+            with open(self._field_path(field, new_generation), 'wb') as f:
+                for _, (old_offset, length, _, _) in order:
+                    f.write(source[old_offset:old_offset + length].tobytes())
+        self._maps.clear()
+
+        self.index, self.generation, self.rows = new_index, new_generation, offset
+        self._write_index()
+
+        for field in FIELDS:
+            try:
+                os.remove(self._field_path(field, old_generation))
+            except OSError:
+                # Windows 下其他进程仍在映射的文件删除失败，它已不再被索引引用，留下也不影响读取
+                pass
+
+    # ===================== 读取 =====================
+
+    def _memmap(self, field):
+        if field not in self._maps:
+            dtype = np.int64 if field == '交易日期' else np.float64
+            if self._stored_rows() == 0:
+                self._maps[field] = np.empty(0, dtype=dtype)
+            else:
+                # 只映射索引中记录的行，忽略追加失败留在文件末尾的数据
+                self._maps[field] = np.memmap(self._field_path(field), dtype=dtype, mode='r',
+                                              shape=(self._stored_rows(),))
+        return self._maps[field]
+
+    def _ensure_fresh(self, stock_code):
+        cached = self.index.get(stock_code)
+        if cached is None or os.stat(self._csv_path(stock_code)).st_mtime_ns != cached[2]:
+            self.refresh([stock_code])
+
+    def load_arrays(self, stock_code, fields=None):
+        """
+        读取一只股票的数据，返回内存映射数组的切片（不复制）
+
+        :param fields: 需要的列，默认为全部列
+        :return: {列名: 数组}，交易日期为 datetime64[ns]
+        """
+        self._ensure_fresh(stock_code)
+        try:
+            return self._slice(stock_code, fields)
+        except FileNotFoundError:
+            # 其他进程压缩后删除了旧一代的文件，按新索引重新读取
+            self._reload()
+            return self._slice(stock_code, fields)
+
+    def _slice(self, stock_code, fields):
+        offset, length = self.index[stock_code][:2]
+        result = {}
+        for field in fields or FIELDS:
+            values = self._memmap(field)[offset:offset + length]
+            result[field] = values.view('datetime64[ns]') if field == '交易日期' else values
+        return result
+
+    def load_frame(self, stock_code, answer_authority_type=None):
+        """
+        读取一只股票的数据，返回与 FinFunctions.import_stock_data 相同格式的 DataFrame
+
+        :param answer_authority_type: '前复权' / '后复权'，指定时附加对应的复权价格列
+        """
+        fields = list(RAW_FIELDS)
+        if answer_authority_type:
+            fields += [f'{price}_{answer_authority_type}' for price in ('开盘价', '最高价', '最低价', '收盘价')]
+        arrays = self.load_arrays(stock_code, fields)
+
+        df = pd.DataFrame({'交易日期': arrays['交易日期'], '股票代码': self.index[stock_code][3]})
+        for field in fields[1:]:
+            df[field] = arrays[field]
+        return df
+
+
+_default_store = None
+
+
+def get_default_store():
+    """全局共享的默认缓存，指向 config.input_data_path 下的数据"""
+    global _default_store
+    if _default_store is None:
+        _default_store = PriceStore()
+    return _default_store
+
+
+if __name__ == "__main__":
+    store = get_default_store()
+    print(f"converted {store.refresh()} stocks, {len(store.codes())} stocks cached")
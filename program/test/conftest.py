@@ -0,0 +1,6 @@
+import os
+import sys
+
+# stock_select_strategy 等模块以 com.caicongyang... 导入，需要 program/python 在 sys.path 中
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'python'))
+os.environ.setdefault('DB_PORT', '3306')
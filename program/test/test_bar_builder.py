@@ -0,0 +1,29 @@
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+from com.caicongyang.financial.engineering.stock_select_strategy.bar_builder import BarBuilder
+
+
+def record(clock, volume, price=1000):
+    hour, minute = map(int, clock.split(':'))
+    return hour * 3600 + minute * 60, price, price, price, price, price, volume, volume * price
+
+
+class BarBuilderTest(unittest.TestCase):
+    """交易时段以外的分钟标签不生成K线"""
+
+    def test_no_bars_outside_sessions(self):
+        builder = BarBuilder()
+        for clock, volume in (('11:26', 100), ('11:30', 200), ('11:31', 50), ('13:01', 300),
+                              ('14:56', 400), ('15:00', 500), ('15:01', 2000)):
+            builder.update('000001', record(clock, volume))
+        builder.close_all()
+        bars = {bar[1]: bar[6] for bar in builder.bars5}
+        self.assertEqual(sorted(bars), [11 * 3600 + 30 * 60, 13 * 3600 + 5 * 60, 15 * 3600])
+        self.assertEqual(bars[11 * 3600 + 30 * 60], 300)
+        self.assertEqual(bars[15 * 3600], 900)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import MA_Kernel, Signals
+
+
+class CrossoverSignalsTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(2)
+        pct_chg = rng.normal(0, 0.02, 1500)
+        # 价格持平的交易日会出现两条均线恰好相等
+        pct_chg[rng.random(1500) < 0.15] = 0
+        pct_chg[500:560] = 0
+        self.close_adj = np.round(10 * np.cumprod(1 + pct_chg), 2)
+        self.pairs = [(s, l) for s in range(2, 30, 3) for l in range(10, 120, 7) if s < l]
+
+    def test_matches_signal_ma_outside_ties(self):
+        signals = MA_Kernel.crossover_signals(self.close_adj, self.pairs)
+        close = pd.Series(self.close_adj)
+        for k, (ma_short, ma_long) in enumerate(self.pairs):
+            expected = Signals.signal_ma(pd.DataFrame({'收盘价_后复权': self.close_adj}), ma_short, ma_long)['signal']
+            expected = expected.to_numpy(dtype=np.float64)
+            # 只比较两条均线（当天和前一天）都不在容差范围内相等的交易日
+            ma_s = close.rolling(ma_short, min_periods=1).mean().to_numpy()
+            ma_l = close.rolling(ma_long, min_periods=1).mean().to_numpy()
+            tie = np.abs(ma_s - ma_l) <= 1e-8 * ma_l
+            tie[1:] |= tie[:-1]
+            np.testing.assert_array_equal(signals[k][~tie], expected[~tie])
+
+    def test_exact_ties(self):
+        # 第7天起两条均线都等于1.2：短期均线从上方回到与长期均线相等，视为下穿
+        close_adj = np.array([0.3, 0.6, 0.9, 1.2, 1.2, 1.2, 1.2, 1.2, 1.2])
+        signals = MA_Kernel.crossover_signals(close_adj, [(2, 5)])[0]
+        self.assertEqual(signals[7], 0)
+        self.assertTrue(np.isnan(signals[[0, 1, 2, 3, 4, 5, 6, 8]]).all())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+import numpy as np
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Performance_Metrics
+
+
+def loop_trade_returns(equity, pos):
+    """逐日累乘的参考实现"""
+    returns, current = [], None
+    for t in range(1, len(equity)):
+        if pos[t] > 0:
+            current = (1 if current is None else current) * equity[t] / equity[t - 1]
+        elif current is not None:
+            returns.append(current - 1)
+            current = None
+    if current is not None:
+        returns.append(current - 1)
+    return np.array(returns)
+
+
+class TradeStatisticsTest(unittest.TestCase):
+
+    def test_matches_daily_compounding(self):
+        rng = np.random.default_rng(0)
+        pos = (rng.random((20, 300)) < 0.5).astype(np.float64)
+        pos[0] = 0
+        pos[1] = 1
+        pos[2, -1] = 1
+        equity = 1e6 * np.cumprod(1 + rng.normal(0, 0.01, pos.shape) * pos, axis=1)
+
+        stats = Performance_Metrics.trade_statistics(equity, pos)
+        for k in range(len(pos)):
+            returns = loop_trade_returns(equity[k], pos[k])
+            self.assertEqual(stats['trades'][k], len(returns))
+            if len(returns):
+                self.assertAlmostEqual(stats['win_rate'][k], (returns > 0).mean())
+                self.assertAlmostEqual(stats['avg_trade_return'][k], returns.mean())
+            else:
+                self.assertTrue(np.isnan(stats['win_rate'][k]))
+
+
+if __name__ == '__main__':
+    unittest.main()
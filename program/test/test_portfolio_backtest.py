@@ -0,0 +1,65 @@
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Portfolio_Backtest, Signals
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Timing_Functions
+
+
+def make_panel(close, pct_chg, open_price=None):
+    close = np.asarray(close, dtype=np.float32)
+    panel = {'dates': pd.bdate_range('2020-01-01', periods=close.shape[0]),
+             'codes': [str(j) for j in range(close.shape[1])],
+             '收盘价': close, '开盘价': close if open_price is None else np.asarray(open_price, dtype=np.float32),
+             '涨跌幅': np.asarray(pct_chg, dtype=np.float32)}
+    panel['收盘价_后复权'] = Portfolio_Backtest.cal_answer_authority_panel(close, panel['涨跌幅']).astype(np.float32)
+    return panel
+
+
+class PortfolioPositionTest(unittest.TestCase):
+
+    def test_matches_single_stock_on_listed_days(self):
+        rng = np.random.default_rng(0)
+        n_days, n_stocks = 600, 70
+        pct_chg = rng.normal(0.0005, 0.02, (n_days, n_stocks))
+        close = 10 * np.cumprod(1 + pct_chg, axis=0)
+        missing = (np.arange(n_days)[:, None] < rng.integers(0, 300, n_stocks)) | (rng.random(close.shape) < 0.03)
+        close[missing] = np.nan
+        pct_chg[missing] = np.nan
+        panel = make_panel(close, pct_chg)
+
+        pos = Portfolio_Backtest.portfolio_position(panel, min_listed_days=100)
+        for j in range(n_stocks):
+            listed = ~np.isnan(panel['收盘价'][:, j])
+            close_j = panel['收盘价'][listed, j:j + 1].astype(np.float64)
+            signal = Signals.signal_ma_panel(panel['收盘价_后复权'][listed, j:j + 1].astype(np.float64), 6, 50)
+            expected = Timing_Functions.position_panel(signal, close_j, close_j)[:, 0]
+            expected[:100] = 0
+            np.testing.assert_array_equal(pos[listed, j], expected)
+
+
+class BacktestPortfolioTest(unittest.TestCase):
+
+    def test_ex_rights_on_resumption_day(self):
+        # 第3天停牌，第4天复牌并10送10：收盘价减半，涨跌幅为0
+        close = [[10.0], [10.0], [np.nan], [5.0], [5.0]]
+        pct_chg = [[0.0], [0.0], [np.nan], [0.0], [0.0]]
+        panel = make_panel(close, pct_chg)
+        pos = np.array([[1], [1], [1], [1], [1]], dtype=np.float64)
+        equity, _ = Portfolio_Backtest.backtest_portfolio(panel, pos, initial_money=100000, max_positions=1,
+                                                          slippage=0)
+        self.assertAlmostEqual(equity['stock_value'].iloc[3], equity['stock_value'].iloc[1], delta=10)
+
+    def test_buys_only_on_entry(self):
+        panel = make_panel(np.full((4, 3), 10.01), np.zeros((4, 3)))
+        # 第三只股票的仓位一开始就是1，仓位已满时没有买入，第3天有了空位也不追买
+        pos = np.array([[1, 1, 1], [1, 1, 1], [0, 1, 1], [0, 1, 1]], dtype=np.float64)
+        equity, attribution = Portfolio_Backtest.backtest_portfolio(panel, pos, max_positions=2, slippage=0)
+        self.assertEqual(attribution['trades'].to_dict(), {'0': 2, '1': 1, '2': 0})
+        self.assertEqual(equity['positions'].tolist(), [2, 2, 1, 1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+# -*- coding: UTF-8 -*-
+
+import unittest
+
+import numpy as np
+
+from program.python.com.caicongyang.financial.engineering.timing_strategy import Position_Sizing
+
+
+class SizeDayTest(unittest.TestCase):
+    """size_day 只算最后一个窗口，结果与面板计算的最后一天一致"""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        n_days, n_stocks = 300, 40
+        self.pct_chg = rng.normal(0.001, 0.02, (n_days, n_stocks))
+        self.pct_chg[rng.random(self.pct_chg.shape) < 0.1] = np.nan
+        self.pct_chg[:295, :3] = np.nan
+        self.close = 10 * np.cumprod(1 + np.nan_to_num(self.pct_chg), axis=0)
+        self.close[np.isnan(self.pct_chg)] = np.nan
+        self.high, self.low = self.close * 1.02, self.close * 0.97
+        self.pos = (rng.random(self.pct_chg.shape) < 0.7).astype(np.float64)
+
+    def expected(self, method, kelly_multiplier=None):
+        pad = np.full((1, self.pct_chg.shape[1]), np.nan)
+        panel = {'涨跌幅': np.vstack([self.pct_chg, pad]), '收盘价': np.vstack([self.close, pad]),
+                 '最高价': np.vstack([self.high, pad]), '最低价': np.vstack([self.low, pad])}
+        weights = Position_Sizing.raw_weights(panel, method=method)[-1]
+        if kelly_multiplier is not None:
+            kelly = Position_Sizing.kelly_fraction(self.pct_chg, self.pos, window=250)[-1]
+            weights = np.fmin(weights, kelly_multiplier * kelly)
+        return np.clip(np.nan_to_num(weights, nan=0.0, posinf=0.1), 0, 0.1)
+
+    def size_day(self, method, **kwargs):
+        n_stocks = self.pct_chg.shape[1]
+        return Position_Sizing.size_day(self.pct_chg, np.ones(n_stocks), np.zeros(n_stocks), method=method,
+                                        max_weight=0.1, close_history=self.close, high_history=self.high,
+                                        low_history=self.low, **kwargs)
+
+    def test_matches_panel(self):
+        for method in Position_Sizing.SIZING_METHODS:
+            np.testing.assert_allclose(self.size_day(method), self.expected(method), rtol=1e-9, atol=1e-12)
+        np.testing.assert_allclose(self.size_day('vol_target', kelly_multiplier=0.5, pos_history=self.pos),
+                                   self.expected('vol_target', kelly_multiplier=0.5), rtol=1e-9, atol=1e-12)
+        # 样本不足的股票不开仓
+        self.assertTrue((self.size_day('vol_target')[:3] == 0).all())
+
+    def test_nan_score_does_not_open(self):
+        score = np.arange(4, dtype=np.float64)
+        score[1] = np.nan
+        weights = Position_Sizing.size_day(self.pct_chg[:, 3:7], np.ones(4), np.zeros(4), method='equal',
+                                           max_positions=10, score=score)
+        self.assertEqual(weights.tolist(), [0.1, 0.0, 0.1, 0.1])
+        limited = Position_Sizing.limit_positions(np.ones((1, 4)), 10, score=score[None, :])
+        self.assertEqual(limited[0].tolist(), [1.0, 0.0, 1.0, 1.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
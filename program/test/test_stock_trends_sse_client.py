@@ -0,0 +1,129 @@
+# -*- coding: UTF-8 -*-
+
+import time
+import unittest
+from datetime import datetime
+
+import fakeredis
+from redis.exceptions import ConnectionError as RedisConnectionError, TimeoutError as RedisTimeoutError
+
+from com.caicongyang.financial.engineering.stock_select_strategy.stock_trends_sse_client import (
+    QuoteTrendConverter, StockTrendsSSEClient)
+
+TRENDS = [f"2024-03-18 09:{31 + i:02d},{10 + i * 0.01:.2f},10.00,11.00,9.00,{300000 + i},{1e6 + i:.1f},10.234"
+          for i in range(5)]
+
+
+class FlushTrendsTest(unittest.IsolatedAsyncioTestCase):
+    """flush_trends 的每批命令最多执行一次"""
+
+    def make_client(self, storage):
+        client = StockTrendsSSEClient()
+        client.storage = storage
+        client.flush_retry_delay = 0
+        server = fakeredis.FakeServer()
+        client.redis = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        client.redis_raw = fakeredis.aioredis.FakeRedis(server=server)
+        client.queue_alert = lambda *args: None
+        return client
+
+    def items(self, client):
+        return [(code, client.parse_trends(code, TRENDS)) for code in ('000001', '300750')]
+
+    async def snapshot(self, client):
+        today = time.strftime('%Y%m%d')
+        return (await client.redis.zrange(f"stock:trends:active:zset:{today}", 0, -1, withscores=True),
+                await client.redis.hgetall(f"stock:trends:active:stocks:{today}"),
+                await client.redis_raw.get(f"stock:trends:000001:packed:{today}"))
+
+    async def test_timeout_after_execute_is_not_replayed(self):
+        for storage in ('json', 'packed'):
+            expected_client = self.make_client(storage)
+            await expected_client.flush_trends(self.items(expected_client))
+            expected = await self.snapshot(expected_client)
+
+            client = self.make_client(storage)
+            create_pipeline = client.redis.pipeline
+
+            def pipeline(*args, **kwargs):
+                pipe = create_pipeline(*args, **kwargs)
+                execute = pipe.execute
+
+                async def execute_then_timeout(*execute_args, **execute_kwargs):
+                    # Redis 已经执行了命令，读取结果时超时
+                    await execute(*execute_args, **execute_kwargs)
+                    raise RedisTimeoutError('Timeout reading from socket')
+
+                pipe.execute = execute_then_timeout
+                return pipe
+
+            client.redis.pipeline = pipeline
+            with self.assertRaises(RedisTimeoutError):
+                await client.flush_trends(self.items(client))
+            self.assertEqual(await self.snapshot(client), expected)
+            self.assertGreater(expected[0][0][1], 0)
+
+    async def test_connect_failure_is_retried_once_applied(self):
+        expected_client = self.make_client('packed')
+        await expected_client.flush_trends(self.items(expected_client))
+        expected = await self.snapshot(expected_client)
+
+        client = self.make_client('packed')
+        pool = client.redis.connection_pool
+        get_connection = pool.get_connection
+        failures = [1, 1]
+
+        async def flaky_get_connection(*args, **kwargs):
+            if failures:
+                failures.pop()
+                raise RedisConnectionError('Error 111 connecting to localhost:6379. Connection refused.')
+            return await get_connection(*args, **kwargs)
+
+        pool.get_connection = flaky_get_connection
+        await client.flush_trends(self.items(client))
+        self.assertEqual(failures, [])
+        self.assertEqual(await self.snapshot(client), expected)
+
+    async def test_connect_failure_gives_up_after_retries(self):
+        client = self.make_client('json')
+        client.flush_retries = 1
+
+        async def refuse(*args, **kwargs):
+            raise RedisConnectionError('Connection refused')
+
+        client.redis.connection_pool.get_connection = refuse
+        with self.assertRaises(RedisConnectionError):
+            await client.flush_trends(self.items(client))
+
+
+class QuoteTrendConverterTest(unittest.TestCase):
+    """ulist 快照的分钟标签不超出交易时段"""
+
+    def convert(self, *ticks):
+        converter = QuoteTrendConverter()
+        records = []
+        for clock, volume in ticks:
+            ts = datetime.strptime(f"2024-03-18 {clock}", '%Y-%m-%d %H:%M:%S').timestamp()
+            records.append(converter.update('000001', {'f2': 10.0, 'f5': volume, 'f6': volume * 1000.0, 'f124': ts}))
+        return [record.split(',') if record else None for record in records]
+
+    def test_morning_close(self):
+        records = self.convert(('11:29:58', 1000), ('11:30:00', 1500), ('11:30:03', 1800))
+        self.assertEqual([r[0] for r in records], ['2024-03-18 11:30'] * 3)
+        # 11:30 之后的成交量并入 11:30 这一分钟
+        self.assertEqual(records[-1][5], '800')
+
+    def test_market_close(self):
+        records = self.convert(('14:59:57', 1000), ('15:00:00', 2000), ('15:00:03', 3000))
+        self.assertEqual([r[0] for r in records], ['2024-03-18 15:00'] * 3)
+        self.assertEqual(records[-1][5], '2000')
+
+    def test_session_minutes(self):
+        records = self.convert(('09:10:00', 0), ('09:25:00', 100), ('09:30:00', 200), ('13:00:00', 300),
+                               ('14:59:00', 400))
+        self.assertIsNone(records[0])
+        self.assertEqual([r[0][-5:] for r in records[1:]], ['09:30', '09:31', '13:01', '15:00'])
+
+
+if __name__ == '__main__':
+    unittest.main()